@@ -0,0 +1,163 @@
+# Answering many counting questions in one pass over the people.
+# Every question registers an accumulator with an Aggregation, and run() feeds each person to all of them.
+# The people are only iterated once, so a stream from iter_people works as well as a list or a PeopleTable.
+# Accumulators of the same kind can be merged, for example when parts of a file are counted separately.
+# A person can also be taken out again with remove (remove_person for an Aggregation), so the counts can follow
+# a person that changes.
+#
+# A value function returning None means the person is not counted by that accumulator.
+
+
+class Histogram:
+
+    def __init__(self, value, where=None):
+        self.value = value
+        self.where = where
+        self.counts = {}
+        self.total = 0
+
+    def add(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        value = self.value(row)
+        if value is None:
+            return
+        self.add_value(value)
+
+    def add_value(self, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+        self.total += 1
+
+    def remove(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        value = self.value(row)
+        if value is None:
+            return
+        self.remove_value(value)
+
+    def remove_value(self, value):
+        if self.counts[value] == 1:
+            del self.counts[value]
+        else:
+            self.counts[value] -= 1
+        self.total -= 1
+
+    def merge(self, other):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.total += other.total
+
+        return self
+
+
+# Histogram that also keeps the minimum, maximum and sum of the values
+class Summary(Histogram):
+
+    def __init__(self, value, where=None):
+        super().__init__(value, where)
+        self.min = None
+        self.max = None
+        self.sum = 0
+
+    def add_value(self, value):
+        super().add_value(value)
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # The counts hold every value, so a removed minimum or maximum is found again from them
+    def remove_value(self, value):
+        super().remove_value(value)
+        self.sum -= value
+        if value not in self.counts:
+            if value == self.min:
+                self.min = min(self.counts) if self.counts else None
+            if value == self.max:
+                self.max = max(self.counts) if self.counts else None
+
+    def merge(self, other):
+        super().merge(other)
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+        return self
+
+    def mean(self):
+        return self.sum / self.total
+
+
+# Share of the counted people for which is_true holds
+class Fraction:
+
+    def __init__(self, is_true, where=None):
+        self.is_true = is_true
+        self.where = where
+        self.count = 0
+        self.total = 0
+
+    def add(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        self.total += 1
+        if self.is_true(row):
+            self.count += 1
+
+    def remove(self, row):
+        if self.where is not None and not self.where(row):
+            return
+        self.total -= 1
+        if self.is_true(row):
+            self.count -= 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+
+        return self
+
+    def ratio(self):
+        return self.count / self.total
+
+
+class Aggregation:
+
+    def __init__(self):
+        self.accumulators = {}
+
+    def add(self, name, accumulator):
+        self.accumulators[name] = accumulator
+
+        return accumulator
+
+    def __getitem__(self, name):
+        return self.accumulators[name]
+
+    # Feeds every person to every accumulator in one pass
+    def run(self, people):
+        adders = [accumulator.add for accumulator in self.accumulators.values()]
+        for row in people:
+            for add in adders:
+                add(row)
+
+        return self
+
+    # One person at a time, for counts that follow changes to the people
+    def add_person(self, row):
+        for accumulator in self.accumulators.values():
+            accumulator.add(row)
+
+    def remove_person(self, row):
+        for accumulator in self.accumulators.values():
+            accumulator.remove(row)
+
+    def merge(self, other):
+        for name, accumulator in other.accumulators.items():
+            self.accumulators[name].merge(accumulator)
+
+        return self
@@ -0,0 +1,174 @@
+# Benchmarks of every stage of the report on synthetic populations of growing size.
+# For each size a people.db file is generated with synthetic.py (kept in bench_data/ and reused by later runs),
+# every stage is run and timed, and then run again under tracemalloc for its peak memory. The results are written
+# as JSON, and a previous results file can be given to compare against.
+#
+# Usage: benchmark.py [--sizes 10k,100k,1M,10M] [--output benchmark_results.json] [--compare old.json]
+
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import project_final
+import synthetic
+from family_graph import FamilyGraph
+from writers import TextWriter
+
+
+DATA_DIR = 'bench_data'
+DEFAULT_SIZES = '10k,100k'
+SEED = 0
+
+
+# '10k' -> 10000 and '1M' -> 1000000
+def parse_size(text):
+    text = text.strip()
+    multiplier = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}.get(text[-1], 1)
+    if multiplier > 1:
+        text = text[:-1]
+
+    return int(float(text) * multiplier)
+
+
+def population_file(size, data_dir=DATA_DIR, seed=SEED):
+    os.makedirs(data_dir, exist_ok=True)
+    file_name = os.path.join(data_dir, 'people_{}_seed{}.db'.format(size, seed))
+    if not os.path.exists(file_name):
+        synthetic.write_population(file_name + '.tmp', size, seed)
+        os.replace(file_name + '.tmp', file_name)
+
+    return file_name
+
+
+# The stages of the report as (name, function of the loaded data). Stages needing the data are given the table
+# and the family graph built by the loading stages, like main does.
+def report_stages(file_name):
+    data = {}
+
+    def load_table():
+        data['people'] = project_final.read_people_as_table(file_name)
+        return len(data['people'])
+
+    def build_family():
+        data['family'] = FamilyGraph.from_people(data['people'])
+        return len(data['family'])
+
+    def on_people(function, *args, **kwargs):
+        return lambda: function(data['people'], *args, **kwargs)
+
+    def on_family(function):
+        return lambda: function(data['people'], data['family'])
+
+    # Analyses returning results are timed including writing them as the text report
+    def written(function):
+        def run():
+            with TextWriter() as writer:
+                writer.write(function())
+        return run
+
+    return [
+        ('read_people_as_dict', lambda: len(project_final.read_people_as_dict(file_name))),
+        ('read_people_as_table', load_table),
+        ('FamilyGraph.from_people', build_family),
+        ('age_distribution', lambda: project_final.print_distribution_of_values(
+            'Age', (project_final.bucket_age(age) for age in data['people'].age))),
+        ('gender_distribution', lambda: project_final.print_distribution_of_values(
+            'Gender', (x['Gender'] for x in data['people']))),
+        ('first_child_age_stats_fathers', on_people(project_final.print_first_child_age_stats, 'Male', 'fathers')),
+        ('first_child_age_stats_mothers', on_people(project_final.print_first_child_age_stats, 'Female', 'mothers')),
+        ('percentage_without_children', on_people(project_final.print_percentage_without_children)),
+        ('parents_for_children', on_family(project_final.parents_for_children)),
+        ('grandparents_for_children', on_family(project_final.grandparents_for_children)),
+        ('average_age_difference_between_parents', written(on_family(project_final.average_age_difference_between_parents))),
+        ('num_alive_grandparents', written(on_family(project_final.num_alive_grandparents))),
+        ('average_number_of_cousins', written(on_family(project_final.average_number_of_cousins))),
+        ('num_multiple_partners', written(on_family(project_final.num_multiple_partners))),
+        ('height_of_couples', written(on_family(project_final.height_of_couples))),
+        ('height_of_children_parents', written(on_family(project_final.height_of_children_parents))),
+        ('bmi_of_couples', written(on_family(project_final.bmi_of_couples))),
+        ('children_that_have_fake_parents', written(on_family(project_final.children_that_have_fake_parents))),
+        ('fathers_that_can_donate_to_sons', written(on_people(project_final.fathers_that_can_donate_to_sons))),
+        ('child_that_can_donate_to_grandparents', written(on_family(project_final.child_that_can_donate_to_grandparents))),
+    ]
+
+
+# Runs function with its printing thrown away. Returns the seconds it took and, when traced, its peak memory.
+def measure(function, trace_memory):
+    gc.collect()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if trace_memory:
+            tracemalloc.start()
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return None, peak
+
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start, None
+
+
+def benchmark_size(size, trace_memory=True, data_dir=DATA_DIR):
+    file_name = population_file(size, data_dir)
+    results = []
+    for name, function in report_stages(file_name):
+        seconds, _ = measure(function, False)
+        peak = measure(function, True)[1] if trace_memory else None
+        results.append({'size': size, 'stage': name, 'seconds': seconds, 'peak_bytes': peak})
+        print('{:>10} {:<42} {:>10.3f}s {:>12}'.format(
+            size, name, seconds, '-' if peak is None else '{:.1f} MB'.format(peak / 1e6)))
+
+    return results
+
+
+# Prints how much slower (>1) or faster (<1) every stage is compared to a previous results file
+def compare(results, previous):
+    previous_seconds = {(x['size'], x['stage']): x['seconds'] for x in previous['results']}
+    print()
+    print('{:>10} {:<42} {:>10} {:>10} {:>8}'.format('Size', 'Stage', 'Before', 'Now', 'Ratio'))
+    print('-' * 84)
+    for x in results:
+        before = previous_seconds.get((x['size'], x['stage']))
+        if before is None:
+            continue
+        ratio = x['seconds'] / before if before > 0 else float('inf')
+        print('{:>10} {:<42} {:>9.3f}s {:>9.3f}s {:>7.2f}x'.format(x['size'], x['stage'], before, x['seconds'], ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times every stage of the report on synthetic populations.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated sizes, e.g. 10k,100k,1M,10M')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='previous results file to compare with')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in [parse_size(x) for x in args.sizes.split(',')]:
+        results.extend(benchmark_size(size, not args.no_memory, args.data_dir))
+
+    output = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=2)
+    print('Results written to', args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# Putting whole columns of values into bins, for the height, BMI and age categories.
+# A Binning has increasing cut points and one label more than there are cut points. The bin of a value is found
+# with a binary search over the cut points, so a column is binned with one bisect call per value instead of a chain
+# of comparisons in a lambda. The cut points can differ per group of people, such as per gender or per age group:
+# cuts is then a dict from group to cut points and group_by gives the group of every row of the table.
+#
+# Pairs of people (couples, parent and child) are counted in a contingency table of (bin, bin) and only then folded
+# to the unordered pairs of labels that percentage_of_pairs reports, so no row is looked at more than once.
+#
+# Usage: binning.py [people.db] [--question height|bmi|parents] [--cuts 160,180 ...]
+# Cut points for each gender are given as --cuts Female=155,170/Male=170,185.
+
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import partial
+
+
+class Binning:
+
+    # column gives the values of a table that are binned, and group_by the group of every row of the table when
+    # the cut points differ per group. A value equal to a cut point goes in the bin above it, or with right=True
+    # in the bin below it.
+    def __init__(self, labels, cuts, column=None, group_by=None, right=False):
+        self.labels = tuple(labels)
+        self.cuts = cuts
+        self.column = column
+        self.group_by = group_by
+        self.right = right
+        self.search = bisect_left if right else bisect_right
+        for x in (cuts.values() if isinstance(cuts, dict) else [cuts]):
+            if list(x) != sorted(x) or len(x) != len(self.labels) - 1:
+                raise ValueError('Cut points must be increasing and one fewer than the labels: ' + str(x))
+
+    def __repr__(self):
+        return 'Binning({}, {})'.format(self.labels, self.cuts)
+
+    def cuts_for(self, group=None):
+        if isinstance(self.cuts, dict):
+            return self.cuts[group]
+
+        return self.cuts
+
+    def bin(self, value, group=None):
+        return self.search(self.cuts_for(group), value)
+
+    def label(self, value, group=None):
+        return self.labels[self.bin(value, group)]
+
+    # The bin of every value. groups has the group of every value when the cut points differ per group.
+    def bin_values(self, values, groups=None):
+        if not isinstance(self.cuts, dict):
+            return array('b', map(partial(self.search, self.cuts), values))
+        search_for_group = {group: partial(self.search, cuts) for group, cuts in self.cuts.items()}
+
+        return array('b', map(lambda value, group: search_for_group[group](value), values, groups))
+
+    def bin_table(self, table, values=None):
+        if values is None:
+            values = self.column(table)
+        groups = None if self.group_by is None else self.group_by(table)
+
+        return self.bin_values(values, groups)
+
+    # The same binning with other cut points, for trying out limits
+    def with_cuts(self, cuts, group_by=None):
+        return Binning(self.labels, cuts, self.column, group_by or self.group_by, self.right)
+
+
+# Groups for cut points that differ between women (0) and men (1)
+def by_gender(table):
+    return table.gender
+
+
+# The rows of pairs of CPRs, as two arrays of rows
+def rows_for_pairs(table, cpr_pairs):
+    index_for_cpr = table.index_for_cpr
+    first_rows = array('l')
+    second_rows = array('l')
+    for first, second in cpr_pairs:
+        first_rows.append(index_for_cpr[first])
+        second_rows.append(index_for_cpr[second])
+
+    return first_rows, second_rows
+
+
+# Number of pairs for every (bin of the first, bin of the second)
+def contingency(bins, first_rows, second_rows):
+    return Counter(zip(map(bins.__getitem__, first_rows), map(bins.__getitem__, second_rows)))
+
+
+# Folds a contingency table to the number of pairs for every sorted pair of labels
+def label_pair_counts(labels, counts):
+    label_counts = {}
+    for (first, second), count in counts.items():
+        key = tuple(sorted((labels[first], labels[second])))
+        label_counts[key] = label_counts.get(key, 0) + count
+
+    return label_counts
+
+
+def pair_counts(binning, table, row_pairs, values=None):
+    return label_pair_counts(binning.labels, contingency(binning.bin_table(table, values), *row_pairs))
+
+
+# Number of pairs for every (value of the first, value of the second), with the values paired with their groups
+# when there are groups
+def value_pair_counts(values, groups, first_rows, second_rows):
+    keys = values if groups is None else list(zip(values, groups))
+
+    return Counter(zip(map(keys.__getitem__, first_rows), map(keys.__getitem__, second_rows)))
+
+
+# The pair counts of every binning over the same pairs of rows, for trying out many limits.
+# Pairs with the same values end up in the same bins whatever the limits, so the pairs are counted once per pair of
+# values for all binnings sharing a column and groups. Each binning then only bins the distinct values, which for
+# heights in whole centimeters are a few thousand pairs however many people there are.
+def sweep(table, row_pairs, binnings):
+    counts_for_column = {}
+    for binning in binnings:
+        grouped = binning.group_by is not None
+        if (binning.column, binning.group_by) not in counts_for_column:
+            groups = binning.group_by(table) if grouped else None
+            counts_for_column[binning.column, binning.group_by] = value_pair_counts(binning.column(table), groups,
+                                                                                  *row_pairs)
+        bin_for_key = {}
+        counts = Counter()
+        for keys, count in counts_for_column[binning.column, binning.group_by].items():
+            for key in keys:
+                if key not in bin_for_key:
+                    bin_for_key[key] = binning.bin(*key) if grouped else binning.bin(key)
+            counts[bin_for_key[keys[0]], bin_for_key[keys[1]]] += count
+        yield binning, label_pair_counts(binning.labels, counts)
+
+
+# '160,180' gives the same cut points for everyone, 'Female=155,170/Male=170,185' cut points for each gender
+def parse_cuts(text):
+    # Imported here since project_final.py builds on this module
+    from people_table import encode_gender
+    if '=' not in text:
+        return tuple(float(x) for x in text.split(','))
+    cuts = {}
+    for part in text.split('/'):
+        gender, values = part.split('=')
+        cuts[encode_gender(gender)] = tuple(float(x) for x in values.split(','))
+
+    return cuts
+
+
+def main(argv=None):
+    import project_final
+    from family_graph import FamilyGraph
+    from writers import TextWriter
+
+    # The binning, the pairs, the title and the fields of people.db each question reads
+    questions = {
+        'height': (project_final.HEIGHT_BINNING, project_final.get_couple_pairs, 'Height of couples',
+                   ('Height', 'Children')),
+        'bmi': (project_final.BMI_BINNING, project_final.get_couple_pairs, 'BMI of couples',
+                ('Height', 'Weight', 'Children')),
+        'parents': (project_final.HEIGHT_BINNING, project_final.parent_child_pairs, 'Height of parents and children',
+                    ('Height', 'Children')),
+    }
+    parser = argparse.ArgumentParser(description='Prints the categories of pairs of people for several limits.')
+    parser.add_argument('file_name', nargs='?', default='people.db')
+    parser.add_argument('--question', choices=sorted(questions), default='height')
+    parser.add_argument('--cuts', action='append', type=parse_cuts, metavar='LIMITS',
+                        help='cut points, such as 160,180 or Female=155,170/Male=170,185 (repeatable)')
+    args = parser.parse_args(argv)
+
+    binning, pairs_function, name, fields = questions[args.question]
+    binnings = [
+        binning if cuts is None else binning.with_cuts(cuts, by_gender if isinstance(cuts, dict) else None)
+        for cuts in (args.cuts or [None])
+    ]
+    # Cut points per gender need the gender of everyone
+    if any(x.group_by is by_gender for x in binnings):
+        fields += ('Gender',)
+    table = project_final.read_people_as_table(args.file_name, fields=fields)
+    family = FamilyGraph.from_people(table)
+    row_pairs = rows_for_pairs(table, pairs_function(table, family))
+
+    with TextWriter() as writer:
+        for x, counts in sweep(table, row_pairs, binnings):
+            writer.text('{} with limits {}:'.format(name, x.cuts))
+            writer.write(project_final.pair_percentages(counts, name))
+
+
+if __name__ == "__main__":
+    main()
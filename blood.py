@@ -0,0 +1,133 @@
+# Blood type inheritance as lookup tables over the blood type codes of people_table.
+# The whitelists of possible (parent1, parent2, child) combinations for the Rhesus and ABO systems are turned
+# into one table of 8 * 8 * 8 entries when the module is loaded. Each entry holds a bit per system that is
+# possible, so checking a family is a single lookup instead of building and searching sets.
+
+from collections import namedtuple
+
+from people_table import BLOOD_TYPES, MISSING
+
+
+# Parent1, parent2, child
+POSSIBLE_SIGN_COMBOS = {
+    ('+', '+', '+'),
+    ('+', '+', '-'),
+    ('+', '-', '+'),
+    ('+', '-', '-'),
+    ('-', '-', '-'),
+}
+
+POSSIBLE_SYMBOL_COMBOS = {
+    # Parent1, parent2, child
+    ("A", "A", "A"),
+    ("A", "A", "O"),
+
+    ("A", "B", "A"),
+    ("A", "B", "B"),
+    ("A", "B", "AB"),
+    ("A", "B", "O"),
+
+    ("A", "AB", "A"),
+    ("A", "AB", "B"),
+    ("A", "AB", "AB"),
+
+    ("A", "O", "A"),
+    ("A", "O", "O"),
+
+    ("B", "B", "B"),
+    ("B", "B", "O"),
+
+    ("B", "AB", "A"),
+    ("B", "AB", "B"),
+    ("B", "AB", "AB"),
+
+    ("B", "O", "B"),
+    ("B", "O", "O"),
+
+    ("AB", "AB", "A"),
+    ("AB", "AB", "B"),
+    ("AB", "AB", "AB"),
+
+    ("AB", "O", "A"),
+    ("AB", "O", "B"),
+    ("O", "O", "O"),
+}
+
+# Bits of the entries in the tables
+ABO = 1
+RHESUS = 2
+SYSTEM_NAMES = {ABO: 'ABO', RHESUS: 'Rhesus'}
+
+
+def is_possible_sign(parent1, parent2, child):
+    parent1_sign, parent2_sign, child_sign = parent1[-1], parent2[-1], child[-1]
+    return ((parent1_sign, parent2_sign, child_sign) in POSSIBLE_SIGN_COMBOS
+            or (parent2_sign, parent1_sign, child_sign) in POSSIBLE_SIGN_COMBOS)
+
+
+def is_possible_symbol(parent1, parent2, child):
+    parent1, parent2, child = parent1[:-1], parent2[:-1], child[:-1]
+    return (parent1, parent2, child) in POSSIBLE_SYMBOL_COMBOS or (parent2, parent1, child) in POSSIBLE_SYMBOL_COMBOS
+
+
+def possible_systems(parent1, parent2, child):
+    return (ABO if is_possible_symbol(parent1, parent2, child) else 0) | (RHESUS if is_possible_sign(parent1, parent2, child) else 0)
+
+
+# Entry (parent1 * 8 + parent2) * 8 + child holds the systems in which the child is possible
+INHERITANCE_TABLE = bytes(
+    possible_systems(parent1, parent2, child)
+    for parent1 in BLOOD_TYPES for parent2 in BLOOD_TYPES for child in BLOOD_TYPES
+)
+
+# Entry parent * 8 + child holds the systems in which parent can have child with a parent of some blood type
+PARENT_TABLE = bytes(
+    (ABO if any(INHERITANCE_TABLE[(parent * 8 + other) * 8 + child] & ABO for other in range(8)) else 0)
+    | (RHESUS if any(INHERITANCE_TABLE[(parent * 8 + other) * 8 + child] & RHESUS for other in range(8)) else 0)
+    for parent in range(8) for child in range(8)
+)
+
+ALL_SYSTEMS = ABO | RHESUS
+
+
+# One system in which a child can not be the child of both its parents.
+# implicated holds the parents that can not be a parent of the child whatever the other parent is. When it is
+# empty, each parent is possible on its own but not the two of them together.
+InheritanceViolation = namedtuple('InheritanceViolation', ['child', 'parents', 'system', 'implicated'])
+
+
+# Checks every child with two parents in the family graph against the blood types of the table.
+# Node ids of the graph are row indexes of the table, so the blood types are gathered straight from its column.
+# Children are checked in the order they are first listed as children. Returns a list of InheritanceViolation.
+def inheritance_violations(table, family):
+    blood_type = table.blood_type
+    num_people = len(table)
+    children = [
+        child for child in family.nodes_with_parents()
+        if child < num_people and len(family.parents(child)) == 2
+    ]
+    parents = [family.parents(child) for child in children]
+    child_codes = [blood_type[child] for child in children]
+    first_codes = [blood_type[pair[0]] for pair in parents]
+    second_codes = [blood_type[pair[1]] for pair in parents]
+
+    flags = [
+        INHERITANCE_TABLE[(first * 8 + second) * 8 + child] if MISSING not in (first, second, child) else ALL_SYSTEMS
+        for first, second, child in zip(first_codes, second_codes, child_codes)
+    ]
+
+    violations = []
+    for index, possible in enumerate(flags):
+        if possible == ALL_SYSTEMS:
+            continue
+        child, pair = children[index], parents[index]
+        for system in (ABO, RHESUS):
+            if possible & system:
+                continue
+            implicated = tuple(
+                parent for parent, code in ((pair[0], first_codes[index]), (pair[1], second_codes[index]))
+                if not PARENT_TABLE[code * 8 + child_codes[index]] & system
+            )
+            violations.append(InheritanceViolation(child, (pair[0], pair[1]), system, implicated))
+
+    return violations
@@ -0,0 +1,198 @@
+# Persistent cache of analysis results and of the indexes the analyses build.
+# Entries are kept as pickle files in one directory. An entry is keyed by the SHA-256 of the content of people.db,
+# the name of the analysis, the parameters of the report (height and BMI limits, reference date) and the code
+# version, which is a hash of the source of the modules the analyses are made of. A changed file, parameter or
+# module therefore never gives an old result, and old entries are simply never read again.
+#
+# Hashing a large file takes a while, so the hash is remembered together with the size and modification time of
+# the file and only worked out again when one of them changes, as for snapshot files.
+#
+# The cache is kept within a number of bytes and entries by evicting the least recently used entries. Reading an
+# entry updates its modification time, so the modification times give the order of use.
+
+import contextlib
+import hashlib
+import importlib
+import json
+import os
+import pickle
+
+from writers import Table
+
+
+DEFAULT_DIRECTORY = '.people_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+ENTRY_SUFFIX = '.pickle'
+FILE_HASHES = 'file_hashes.json'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Modules whose source makes up the code version: the analyses and the modules reading the people they are
+# worked out from
+CODE_MODULES = (
+    'project_final', 'aggregation', 'binning', 'blood', 'couples', 'cpr', 'donors', 'family_graph',
+    'instrumentation', 'kinship', 'normality', 'parallel_ingest', 'paternity', 'people_table', 'scheduler',
+    'sharded', 'snapshot', 'sqlite_store', 'writers',
+)
+
+
+def file_sha256(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+_code_version = None
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for name in CODE_MODULES:
+            with open(importlib.import_module(name).__file__, 'rb') as file:
+                digest.update(file.read())
+        _code_version = digest.hexdigest()
+
+    return _code_version
+
+
+# Tables may have a generator for rows, which is turned into a list so the result can be stored
+def materialize(result):
+    if isinstance(result, Table):
+        return result if isinstance(result.rows, list) else result._replace(rows=list(result.rows))
+    if isinstance(result, list):
+        return [materialize(x) for x in result]
+
+    return result
+
+
+class ResultCache:
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES, max_entries=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    # Returns (True, value) for a cached entry and (False, None) otherwise
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+            os.utime(path)
+        except (IOError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self.misses += 1
+            return False, None
+        self.hits += 1
+
+        return True, value
+
+    def put(self, key, value):
+        path = self.path_for(key)
+        # Replacing in one step means a reader never sees a half written entry
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        found, value = self.get(key)
+        if not found:
+            value = materialize(compute())
+            self.put(key, value)
+
+        return value
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        return entries
+
+    # Removes the least recently used entries until the cache is within its limits
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, path = entries.pop(0)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    # Content hash of file_name, only worked out again when the size or modification time of the file changed
+    def content_hash(self, file_name):
+        hashes_path = os.path.join(self.directory, FILE_HASHES)
+        try:
+            with open(hashes_path) as file:
+                hashes = json.load(file)
+        except (IOError, ValueError):
+            hashes = {}
+
+        stat = os.stat(file_name)
+        path = os.path.realpath(file_name)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        known = hashes.get(path)
+        if known is not None and known[:2] == stamp:
+            return known[2]
+
+        content_hash = file_sha256(file_name)
+        hashes[path] = stamp + [content_hash]
+        with open(hashes_path + '.tmp', 'w') as file:
+            json.dump(hashes, file)
+        os.replace(hashes_path + '.tmp', hashes_path)
+
+        return content_hash
+
+
+# The cache for the report over one file, or the shards of one dataset, with one set of parameters
+class DatasetCache:
+
+    def __init__(self, cache, file_name, parameters):
+        self.cache = cache
+        self.parameters = parameters
+        if isinstance(file_name, str):
+            self.content_hash = cache.content_hash(file_name)
+        else:
+            # The shards in their order, which is the order of the people
+            self.content_hash = cache.key(*[cache.content_hash(x) for x in file_name])
+
+    # parameters defaults to all the parameters of the report
+    def get_or_compute(self, name, compute, parameters=None):
+        if parameters is None:
+            parameters = self.parameters
+        key = self.cache.key(self.content_hash, code_version(), name, parameters)
+
+        return self.cache.get_or_compute(key, compute)
+
+    # Returns (True, value) for a cached result and (False, None) otherwise
+    def get(self, name, parameters=None):
+        if parameters is None:
+            parameters = self.parameters
+
+        return self.cache.get(self.cache.key(self.content_hash, code_version(), name, parameters))
+
+    def put(self, name, value, parameters=None):
+        if parameters is None:
+            parameters = self.parameters
+        self.cache.put(self.cache.key(self.content_hash, code_version(), name, parameters), materialize(value))
@@ -0,0 +1,73 @@
+# Couples: people who have at least one child together.
+# Each couple is kept once, as the node ids (first, second) with first < second packed into one integer
+# first * num_nodes + second, together with the number of children they share. The keys are sorted, so a couple is
+# found with a binary search, and the index takes memory for the couples only, however many children they have.
+
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+
+class CoupleIndex:
+
+    def __init__(self, num_nodes, keys, shared_children):
+        self.num_nodes = num_nodes
+        self.keys = keys
+        self.shared_children = shared_children
+
+    # Built in one pass over the children and their parents
+    @classmethod
+    def from_family(cls, family):
+        num_nodes = len(family)
+        children_for_key = {}
+        for child in family.nodes_with_parents():
+            parents = sorted(family.parents(child))
+            for i, first in enumerate(parents):
+                for second in parents[i + 1:]:
+                    key = first * num_nodes + second
+                    children_for_key[key] = children_for_key.get(key, 0) + 1
+
+        keys = array('q', sorted(children_for_key))
+
+        return cls(num_nodes, keys, array('l', (children_for_key[key] for key in keys)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        num_nodes = self.num_nodes
+        for key in self.keys:
+            yield divmod(key, num_nodes)
+
+    def firsts(self):
+        return array('l', (key // self.num_nodes for key in self.keys))
+
+    def seconds(self):
+        return array('l', (key % self.num_nodes for key in self.keys))
+
+    # Number of children first and second have together, 0 when they are not a couple
+    def children_of(self, first, second):
+        if first > second:
+            first, second = second, first
+        key = first * self.num_nodes + second
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.shared_children[position]
+
+        return 0
+
+    # Number of partners of every node
+    def partner_counts(self):
+        counts = array('l', [0]) * self.num_nodes
+        for first, second in self:
+            counts[first] += 1
+            counts[second] += 1
+
+        return counts
+
+    def num_with_multiple_partners(self):
+        return sum(1 for x in self.partner_counts() if x > 1)
+
+    # Number of couples for every (bin of the first, bin of the second), with bins indexed by node id
+    def contingency(self, bins):
+        return Counter(zip(map(bins.__getitem__, self.firsts()), map(bins.__getitem__, self.seconds())))
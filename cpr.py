@@ -0,0 +1,93 @@
+# Decoding of CPR numbers given as 'ddmmyy-ssss'.
+# Each CPR is parsed into a packed integer holding the birth date (as a date ordinal), the four digit sequence
+# number and the gender bit (odd last digit = male). The most recently parsed CPRs are cached, so a CPR seen as a
+# person, as a child and as a parent close together is only parsed once, while streaming a large file keeps the
+# cache within CPR_CACHE_SIZE entries.
+# Ages are calculated from the packed value against a reference date, which defaults to the year the
+# database was made.
+
+import datetime
+import functools
+from array import array
+
+
+REFERENCE_DATE = datetime.date(2000, 1, 1)
+
+SEQUENCE_BITS = 14
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+CPR_CACHE_SIZE = 64 * 1024
+
+
+# Packed value is birth_ordinal << 15 | sequence << 1 | gender_bit
+@functools.lru_cache(maxsize=CPR_CACHE_SIZE)
+def decode_cpr(cpr):
+    ddmmyy, sequence = cpr.split('-')
+    birth_date = datetime.date(
+        year=int(ddmmyy[-2:]) + 1900,
+        month=int(ddmmyy[2:4]),
+        day=int(ddmmyy[:2]),
+    )
+    sequence = int(sequence)
+
+    return (birth_date.toordinal() << (SEQUENCE_BITS + 1)) | (sequence << 1) | (sequence % 2)
+
+
+def clear_cpr_cache():
+    decode_cpr.cache_clear()
+
+
+def birth_ordinal(packed):
+    return packed >> (SEQUENCE_BITS + 1)
+
+
+def birth_date(packed):
+    return datetime.date.fromordinal(birth_ordinal(packed))
+
+
+def sequence_number(packed):
+    return (packed >> 1) & SEQUENCE_MASK
+
+
+# 1 for male and 0 for female
+def gender_bit(packed):
+    return packed & 1
+
+
+# Whole years of 365 days between birth and the reference date
+def age_from_ordinal(ordinal, reference_date=REFERENCE_DATE):
+    return (reference_date.toordinal() - ordinal) // 365
+
+
+def age_from_cpr(cpr, reference_date=REFERENCE_DATE):
+    return age_from_ordinal(birth_ordinal(decode_cpr(cpr)), reference_date)
+
+
+def gender_bit_from_cpr(cpr):
+    return gender_bit(decode_cpr(cpr))
+
+
+# The firstborn is the child with the highest age. Children of the same age are told apart by the highest CPR.
+def first_born(child_cprs, reference_date=REFERENCE_DATE):
+    return max((age_from_cpr(cpr, reference_date), cpr) for cpr in child_cprs)[1]
+
+
+# Batch versions working on whole columns at once
+
+def decode_cpr_column(cprs):
+    return array('q', map(decode_cpr, cprs))
+
+
+def birth_ordinal_column(packed_column):
+    shift = SEQUENCE_BITS + 1
+    return array('l', (packed >> shift for packed in packed_column))
+
+
+def gender_column(packed_column):
+    return array('b', (packed & 1 for packed in packed_column))
+
+
+# Ages for a column of birth ordinals. Negative ordinals are missing values and are kept as they are.
+def age_column(ordinal_column, reference_date=REFERENCE_DATE):
+    reference = reference_date.toordinal()
+    return array('h', ((reference - ordinal) // 365 if ordinal >= 0 else ordinal for ordinal in ordinal_column))
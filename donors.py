@@ -0,0 +1,173 @@
+# Blood donors among relatives.
+# Compatibility is one 8 bit mask per donor blood type, with a bit for every recipient blood type the donor can
+# give to. With the antigen codes of people_table (A = 4, B = 2, Rhesus D = 1) a donor can give to a recipient
+# when the recipient has every antigen of the donor.
+# Relatives are found by walking the CSR arrays of the family graph, a generation at a time for all people at once.
+#
+# Usage: donors.py people.db CPR [hops]   lists everyone within hops (default 2) of CPR who can donate to them
+
+import sys
+
+from people_table import BLOOD_TYPES, MISSING
+
+
+# DONATION_MASKS[donor] has bit recipient set when donor can give blood to recipient
+DONATION_MASKS = bytes(
+    sum(1 << recipient for recipient in range(8) if donor & ~recipient == 0) for donor in range(8)
+)
+
+
+def can_donate(donor_code, recipient_code):
+    if donor_code == MISSING or recipient_code == MISSING:
+        return False
+
+    return (DONATION_MASKS[donor_code] >> recipient_code) & 1 == 1
+
+
+# Mask of the donor blood types that can give to recipient_code
+def donor_mask_for(recipient_code):
+    return sum(1 << donor for donor in range(8) if DONATION_MASKS[donor] >> recipient_code & 1)
+
+
+# Most generations or parent/child steps a walk may take. No family in a registry goes back further.
+MAX_GENERATIONS = 100
+
+
+# Relatives n generations up or down, each listed once. A node already reached in an earlier generation or
+# along another path is skipped, so inconsistent or cyclic parent data can not make a generation grow past the
+# number of people.
+def walk(node, generations, step):
+    seen = {node}
+    nodes = [node]
+    for _ in range(generations):
+        next_nodes = []
+        for x in nodes:
+            for relative in step(x):
+                if relative not in seen:
+                    seen.add(relative)
+                    next_nodes.append(relative)
+        nodes = next_nodes
+        if not nodes:
+            break
+
+    return nodes
+
+
+def ancestors(family, node, generations):
+    return walk(node, generations, family.parents)
+
+
+def descendants(family, node, generations):
+    return walk(node, generations, family.children)
+
+
+# Functions giving the relatives of a node for each relationship
+RELATIONSHIPS = {
+    'parent': lambda family, node: family.parents(node),
+    'child': lambda family, node: family.children(node),
+    'grandparent': lambda family, node: family.grandparents(node),
+    'grandchild': lambda family, node: family.grandchildren(node),
+    'sibling': lambda family, node: family.siblings(node),
+    'cousin': lambda family, node: family.cousins(node),
+    'partner': lambda family, node: family.partners(node),
+}
+
+
+# A relationship is one of RELATIONSHIPS, or 'ancestor:n' / 'descendant:n' for the n-th generation up or down
+def relatives_function(relationship):
+    if relationship in RELATIONSHIPS:
+        return RELATIONSHIPS[relationship]
+
+    name, _, generations = relationship.partition(':')
+    if name in ('ancestor', 'descendant') and generations.isdigit():
+        if int(generations) > MAX_GENERATIONS:
+            raise ValueError('At most {} generations: {}'.format(MAX_GENERATIONS, relationship))
+        walk = ancestors if name == 'ancestor' else descendants
+        return lambda family, node: walk(family, node, int(generations))
+
+    raise ValueError('Unknown relationship: ' + relationship)
+
+
+def relatives(family, node, relationship):
+    return relatives_function(relationship)(family, node)
+
+
+# (donor, recipient) node pairs where the recipient has the given relationship to the donor and can receive the
+# donor's blood. donors defaults to everyone in the table, and can be given to choose which and in what order.
+# Recipients without a row in the table are skipped.
+def donor_pairs(table, family, relationship, donors=None):
+    return list(iter_donor_pairs(table, family, relationship, donors))
+
+
+# The same pairs as a generator, so a long list can be written out as it is found
+def iter_donor_pairs(table, family, relationship, donors=None):
+    find_relatives = relatives_function(relationship)
+    blood_type = table.blood_type
+    num_people = len(table)
+    if donors is None:
+        donors = range(num_people)
+
+    for donor in donors:
+        if donor >= num_people:
+            continue
+        code = blood_type[donor]
+        if code == MISSING:
+            continue
+        mask = DONATION_MASKS[code]
+        for recipient in find_relatives(family, donor):
+            if recipient < num_people and blood_type[recipient] != MISSING and (mask >> blood_type[recipient]) & 1:
+                yield donor, recipient
+
+
+# Everyone within hops parent/child steps of recipient who can donate to them, as (donor, hops) ordered by hops.
+# Two steps reach parents, children, grandparents, grandchildren, siblings and partners.
+def donors_within(table, family, recipient, hops=2):
+    blood_type = table.blood_type
+    num_people = len(table)
+    if recipient >= num_people or blood_type[recipient] == MISSING:
+        return []
+    mask = donor_mask_for(blood_type[recipient])
+
+    distance = {recipient: 0}
+    frontier = [recipient]
+    for hop in range(1, hops + 1):
+        if not frontier:
+            break
+        next_frontier = []
+        for node in frontier:
+            for relative in list(family.parents(node)) + list(family.children(node)):
+                if relative not in distance:
+                    distance[relative] = hop
+                    next_frontier.append(relative)
+        frontier = next_frontier
+
+    return [
+        (node, hop) for node, hop in distance.items()
+        if hop > 0 and node < num_people and blood_type[node] != MISSING and (mask >> blood_type[node]) & 1
+    ]
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('Usage: donors.py people.db CPR [hops]')
+        return
+
+    # Imported here since project_final.py builds on this module
+    import project_final
+    from family_graph import FamilyGraph
+
+    table = project_final.read_people_as_table(sys.argv[1])
+    family = FamilyGraph.from_people(table)
+    hops = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    recipient = table.index_for_cpr[sys.argv[2]]
+    rows = [
+        (project_final.name_for_row(table[donor]), table.cpr[donor], BLOOD_TYPES[table.blood_type[donor]], str(hop))
+        for donor, hop in donors_within(table, family, recipient, hops)
+    ]
+    print('Donors within', hops, 'steps of', project_final.name_for_row(table[recipient]),
+          '(' + BLOOD_TYPES[table.blood_type[recipient]] + '):')
+    project_final.print_blood(rows, ['Donor', 'CPR', 'Blood type', 'Steps'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# The family relations of people.db as one shared index.
+# Every CPR gets an integer node id. The people in the database get the ids 0..n-1 in the order they were read,
+# so a node id is also the index of the row in the list or PeopleTable the graph was built from.
+# CPRs only seen in a 'Children' field are given the ids after that.
+# Relations are stored CSR style: the relatives of node i are ids[offsets[i]:offsets[i + 1]].
+
+from array import array
+
+from couples import CoupleIndex
+
+
+# Builds offset and id arrays from one list of ids per node
+def csr_from_lists(lists):
+    offsets = array('l', [0])
+    ids = array('l')
+    for node_ids in lists:
+        ids.extend(node_ids)
+        offsets.append(len(ids))
+
+    return offsets, ids
+
+
+# Builds offset and id arrays from (node, relative) edges. The relatives keep the order of the edges.
+def csr_from_edges(num_nodes, sources, targets):
+    counts = array('l', [0]) * (num_nodes + 1)
+    for source in sources:
+        counts[source + 1] += 1
+
+    offsets = array('l', [0]) * (num_nodes + 1)
+    for node in range(num_nodes):
+        offsets[node + 1] = offsets[node] + counts[node + 1]
+
+    ids = array('l', [0]) * len(sources)
+    position = array('l', offsets[:-1])
+    for source, target in zip(sources, targets):
+        ids[position[source]] = target
+        position[source] += 1
+
+    return offsets, ids
+
+
+class FamilyGraph:
+
+    def __init__(self, cprs, num_people, id_for_cpr, child_offsets, child_ids, parent_offsets, parent_ids,
+                 children_in_order):
+        self.cprs = cprs
+        self.num_people = num_people
+        self.id_for_cpr = id_for_cpr
+        self.child_offsets = child_offsets
+        self.child_ids = child_ids
+        self.parent_offsets = parent_offsets
+        self.parent_ids = parent_ids
+        # Children in the order they are first listed in a 'Children' field
+        self.children_in_order = children_in_order
+        # Derived relations are only built the first time they are asked for
+        self._partner_offsets = None
+        self._partner_ids = None
+        self._grandparent_offsets = None
+        self._grandparent_ids = None
+        self._couples = None
+
+    # Builds the graph in one pass over the people (list of dicts, stream or PeopleTable)
+    @classmethod
+    def from_people(cls, people):
+        cprs = []
+        children_for_row = []
+        for row in people:
+            cprs.append(row['CPR'])
+            children_for_row.append(row.get('Children'))
+
+        num_people = len(cprs)
+        id_for_cpr = {cpr: node for node, cpr in enumerate(cprs)}
+        parent_sources = array('l')
+        child_targets = array('l')
+        for parent, children in enumerate(children_for_row):
+            if children is None:
+                continue
+            for cpr in children.split():
+                if cpr not in id_for_cpr:
+                    id_for_cpr[cpr] = len(cprs)
+                    cprs.append(cpr)
+                parent_sources.append(parent)
+                child_targets.append(id_for_cpr[cpr])
+
+        return cls.from_edges(cprs, num_people, id_for_cpr, parent_sources, child_targets)
+
+    # Builds the graph from parent -> child edges given as two arrays of node ids
+    @classmethod
+    def from_edges(cls, cprs, num_people, id_for_cpr, parent_sources, child_targets):
+        child_offsets, child_ids = csr_from_edges(len(cprs), parent_sources, child_targets)
+        parent_offsets, parent_ids = csr_from_edges(len(cprs), child_targets, parent_sources)
+        children_in_order = array('l')
+        seen = bytearray(len(cprs))
+        for child in child_targets:
+            if not seen[child]:
+                seen[child] = 1
+                children_in_order.append(child)
+
+        return cls(cprs, num_people, id_for_cpr, child_offsets, child_ids, parent_offsets, parent_ids, children_in_order)
+
+    def __len__(self):
+        return len(self.cprs)
+
+    def node_id(self, cpr):
+        return self.id_for_cpr[cpr]
+
+    def cpr(self, node):
+        return self.cprs[node]
+
+    def cprs_for(self, nodes):
+        return [self.cprs[node] for node in nodes]
+
+    # People in the database have a row. Children only seen in a 'Children' field do not.
+    def has_row(self, node):
+        return node < self.num_people
+
+    def parents(self, node):
+        return self.parent_ids[self.parent_offsets[node]:self.parent_offsets[node + 1]]
+
+    def children(self, node):
+        return self.child_ids[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def has_parents(self, node):
+        return self.parent_offsets[node + 1] > self.parent_offsets[node]
+
+    def has_children(self, node):
+        return self.child_offsets[node + 1] > self.child_offsets[node]
+
+    def nodes_with_parents(self):
+        return self.children_in_order
+
+    def nodes_with_children(self):
+        return [node for node in range(len(self.cprs)) if self.has_children(node)]
+
+    # Builds the partner and grandparent relations now instead of the first time they are asked for
+    def build_derived(self):
+        if len(self.cprs) > 0:
+            self.partners(0)
+            self.grandparents(0)
+            self.couples()
+
+        return self
+
+    # Everyone who has a child together with node, ordered by node id
+    def partners(self, node):
+        if self._partner_offsets is None:
+            self._partner_offsets, self._partner_ids = csr_from_lists(
+                sorted({partner for child in self.children(x) for partner in self.parents(child) if partner != x})
+                for x in range(len(self.cprs))
+            )
+
+        return self._partner_ids[self._partner_offsets[node]:self._partner_offsets[node + 1]]
+
+    # Every couple once, with the number of children they have together, see couples.py
+    def couples(self):
+        if self._couples is None:
+            self._couples = CoupleIndex.from_family(self)
+
+        return self._couples
+
+    # The parents of both parents. A grandparent reached through both parents is listed twice.
+    def grandparents(self, node):
+        if self._grandparent_offsets is None:
+            self._grandparent_offsets, self._grandparent_ids = csr_from_lists(
+                [grandparent for parent in self.parents(x) for grandparent in self.parents(parent)]
+                for x in range(len(self.cprs))
+            )
+
+        return self._grandparent_ids[self._grandparent_offsets[node]:self._grandparent_offsets[node + 1]]
+
+    # The children of the children. A grandchild reached through both its parents is listed twice.
+    def grandchildren(self, node):
+        return [grandchild for child in self.children(node) for grandchild in self.children(child)]
+
+    # Everyone sharing at least one parent with node
+    def siblings(self, node):
+        return sorted({sibling for parent in self.parents(node) for sibling in self.children(parent) if sibling != node})
+
+    # Grandchildren of node's grandparents that are neither node nor one of its siblings
+    def cousins(self, node):
+        excluded = set(self.siblings(node))
+        excluded.add(node)
+        return sorted({
+            cousin for grandparent in self.grandparents(node) for cousin in self.grandchildren(grandparent)
+            if cousin not in excluded
+        })
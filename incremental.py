@@ -0,0 +1,322 @@
+# Keeping the statistics of the report up to date while people and children are added.
+# Registry extracts grow by small deltas: new people, and new children for people already in the database.
+# Instead of rereading everything, IncrementalEngine keeps its own growable family relations and updates every
+# statistic from the part of the family around each change:
+#
+#   a new child of parent reaches        the numbers it changes
+#   the parent's other children          partners and couples of the parent (multiple partners, couple categories)
+#   the child's own children             whether they have a grandparent (alive grandparents)
+#   the grandchildren of the parent      the number of cousins of each of them (average number of cousins)
+#   and of the parent's parents
+#
+# and the parent age and first child gender of the parent, together with the distribution accumulators, which
+# take the parent out and add it again.
+# verify() recomputes everything from scratch with the functions of project_final.py and lists any difference.
+#
+# Usage: incremental.py people.db delta.db [--verify]
+
+import argparse
+import bisect
+import sys
+import time
+
+import project_final
+from cpr import REFERENCE_DATE, age_from_cpr, birth_ordinal, decode_cpr, first_born, gender_bit
+from family_graph import FamilyGraph
+from kinship import kinship_counts
+from people_table import PeopleTable
+
+
+# Category of a person for each of the couple questions of the report
+COUPLE_CATEGORIES = {
+    'height': lambda row: project_final.category_for_height(row['Height']),
+    'BMI': lambda row: project_final.category_for_bmi(project_final.bmi_from_row(row)),
+}
+
+
+class IncrementalEngine:
+
+    def __init__(self, reference_date=REFERENCE_DATE):
+        self.table = PeopleTable(reference_date)
+        # Node ids are given in the order CPRs are first seen and never change. They are not the row indexes of the
+        # table, since a CPR first seen as a child can get a row later.
+        self.cprs = []
+        self.id_for_cpr = {}
+        self.row_for_node = []
+        # Parents are kept in the order of their rows, as in a FamilyGraph built from the table
+        self.parents = []
+        self.children = []
+        self.partners = []
+
+        self.aggregation = project_final.distribution_aggregation()
+        self.num_with_parents = 0
+        self.has_grandparent = []
+        self.num_with_grandparents = 0
+        self.num_multiple_partners = 0
+        self.couple_counts = {name: {} for name in COUPLE_CATEGORIES}
+        # Number of cousins of every node, and the number of nodes with cousins and their sum
+        self.cousins = []
+        self.num_with_cousins = 0
+        self.sum_cousins = 0
+
+    def node_for_cpr(self, cpr):
+        node = self.id_for_cpr.get(cpr)
+        if node is None:
+            node = len(self.cprs)
+            self.id_for_cpr[cpr] = node
+            self.cprs.append(cpr)
+            self.row_for_node.append(None)
+            self.parents.append([])
+            self.children.append([])
+            self.partners.append(set())
+            self.has_grandparent.append(False)
+            self.cousins.append(0)
+
+        return node
+
+    # Applies people as read by iter_people. A CPR that is not in the table yet is a new person. For a CPR that
+    # is, only the children not listed before are added.
+    def apply(self, people):
+        for row in people:
+            if row['CPR'] in self.table.index_for_cpr:
+                if 'Children' in row:
+                    self.add_children(row['CPR'], row['Children'].split())
+            else:
+                self.add_person(row)
+
+        return self
+
+    def add_person(self, row):
+        if row['CPR'] in self.table.index_for_cpr:
+            raise ValueError('Already in the table: ' + row['CPR'])
+        index = len(self.table)
+        self.table.append(row)
+        self.aggregation.add_person(self.table[index])
+        node = self.node_for_cpr(row['CPR'])
+        self.row_for_node[node] = index
+        if 'Children' in row:
+            for cpr in row['Children'].split():
+                self.add_edge(node, cpr)
+
+    # New children of a person already in the table. Children that are already listed are skipped.
+    def add_children(self, parent_cpr, child_cprs):
+        index = self.table.index_for_cpr[parent_cpr]
+        node = self.id_for_cpr[parent_cpr]
+        listed = set(self.cprs_for(self.children[node]))
+        new_children = []
+        for cpr in child_cprs:
+            if cpr not in listed:
+                listed.add(cpr)
+                new_children.append(cpr)
+        if not new_children:
+            return
+
+        table = self.table
+        self.aggregation.remove_person(table[index])
+        if table.children[index] is None:
+            table.children[index] = ' '.join(new_children)
+        else:
+            table.children[index] = table.children[index] + ' ' + ' '.join(new_children)
+        first_child = first_born(table.children[index].split(), table.reference_date)
+        packed = decode_cpr(first_child)
+        table.first_child_birth_ordinal[index] = birth_ordinal(packed)
+        table.first_child_gender[index] = gender_bit(packed)
+        table.parent_age[index] = table.age[index] - age_from_cpr(first_child, table.reference_date)
+        self.aggregation.add_person(table[index])
+
+        for cpr in new_children:
+            self.add_edge(node, cpr)
+
+    def add_edge(self, parent, child_cpr):
+        child = self.node_for_cpr(child_cpr)
+        parents = self.parents[child]
+        if parent in parents:
+            return
+        rows = [self.row_for_node[x] for x in parents]
+        parents.insert(bisect.bisect(rows, self.row_for_node[parent]), parent)
+        self.children[parent].append(child)
+        if len(parents) == 1:
+            self.num_with_parents += 1
+
+        for other in parents:
+            if other != parent and other not in self.partners[parent]:
+                self.add_couple(parent, other)
+
+        # The child may have got a grandparent through parent, and its children now have one through it
+        for node in [child] + self.children[child]:
+            self.update_has_grandparent(node)
+
+        # The child has new cousins, its new siblings lose it as a cousin, and the grandchildren of the parent and
+        # of the parent's parents have new cousins
+        affected = {child}
+        affected.update(self.children[parent])
+        for grandparent in [parent] + self.parents[parent]:
+            affected.update(self.grandchildren(grandparent))
+        for node in affected:
+            self.update_cousins(node)
+
+    def add_couple(self, first, second):
+        for node, partner in ((first, second), (second, first)):
+            self.partners[node].add(partner)
+            if len(self.partners[node]) == 2:
+                self.num_multiple_partners += 1
+
+        first_row, second_row = self.table[self.row_for_node[first]], self.table[self.row_for_node[second]]
+        for name, category in COUPLE_CATEGORIES.items():
+            key = tuple(sorted((category(first_row), category(second_row))))
+            counts = self.couple_counts[name]
+            counts[key] = counts.get(key, 0) + 1
+
+    def update_has_grandparent(self, node):
+        has_grandparent = any(self.parents[parent] for parent in self.parents[node])
+        if has_grandparent != self.has_grandparent[node]:
+            self.has_grandparent[node] = has_grandparent
+            self.num_with_grandparents += 1 if has_grandparent else -1
+
+    def update_cousins(self, node):
+        before = self.cousins[node]
+        after = self.cousin_count_for_node(node)
+        self.cousins[node] = after
+        self.sum_cousins += after - before
+        if (before > 0) != (after > 0):
+            self.num_with_cousins += 1 if after > 0 else -1
+
+    def cprs_for(self, nodes):
+        return [self.cprs[node] for node in nodes]
+
+    def grandchildren(self, node):
+        return [grandchild for child in self.children[node] for grandchild in self.children[child]]
+
+    # Everyone sharing at least one parent with node, as in kinship.py
+    def sibling_count_for_node(self, node):
+        if not self.parents[node]:
+            return 0
+
+        return len({sibling for parent in self.parents[node] for sibling in self.children[parent]}) - 1
+
+    def sibling_count(self, cpr):
+        return self.sibling_count_for_node(self.id_for_cpr[cpr])
+
+    # Grandchildren of the node's grandparents that are neither the node nor a sibling, as in kinship.py
+    def cousin_count_for_node(self, node):
+        excluded = {sibling for parent in self.parents[node] for sibling in self.children[parent]}
+        excluded.add(node)
+
+        return len({
+            cousin
+            for parent in self.parents[node] for grandparent in self.parents[parent]
+            for cousin in self.grandchildren(grandparent)
+            if cousin not in excluded
+        })
+
+    def cousin_count(self, cpr):
+        return self.cousins[self.id_for_cpr[cpr]]
+
+    # The statistics of the report, as the functions of project_final.py compute them
+
+    def alive_grandparents_percentage(self):
+        return (self.num_with_grandparents / self.num_with_parents) * 100
+
+    def average_number_of_cousins(self):
+        return self.sum_cousins / self.num_with_cousins
+
+    def multiple_partners_count(self):
+        return self.num_multiple_partners
+
+    # Number of couples for each pair of categories. Each couple is counted once.
+    def couple_category_counts(self, name):
+        return self.couple_counts[name]
+
+    def print_report(self):
+        print('Percentage of people who have at least one grandparent still alive:')
+        print("{:.2f}%".format(self.alive_grandparents_percentage()))
+        print('Average number of cousins per individual (if they have cousins):')
+        print("{:.2f}".format(self.average_number_of_cousins()))
+        print('Percentage of men/women who have children with more than one woman/man:')
+        print("{:.1f}%".format(self.multiple_partners_count()))
+        for name in COUPLE_CATEGORIES:
+            counts = self.couple_counts[name]
+            total = sum(counts.values())
+            print('The percentages of couples in respect to', name, 'difference:')
+            project_final.print_table(
+                {'/'.join(k): project_final.to_percentage_str(v / total) for k, v in counts.items()},
+                ["Groups", "Percentage"])
+
+    # Recomputes every statistic from the table and returns a description of each difference. Empty means the
+    # incremental state is the same as a full recompute.
+    def verify(self):
+        table = self.table
+        family = FamilyGraph.from_people(table)
+        differences = []
+
+        def compare(name, incremental, full):
+            if incremental != full:
+                differences.append('{}: incremental {!r}, full recompute {!r}'.format(name, incremental, full))
+
+        compare('alive grandparents', self.alive_grandparents_percentage(),
+                project_final.alive_grandparents_percentage(table, family))
+        kinship = kinship_counts(family)
+        compare('people with cousins', (self.num_with_cousins, self.sum_cousins),
+                (sum(1 for x in kinship.cousins if x > 0), sum(kinship.cousins)))
+        compare('multiple partners', self.multiple_partners_count(), project_final.multiple_partners_count(table, family))
+
+        couple_pairs = project_final.get_couple_pairs(table, family)
+        for name, category in COUPLE_CATEGORIES.items():
+            compare(name + ' of couples', self.couple_counts[name],
+                    project_final.category_pair_counts(table, couple_pairs, category))
+
+        full_aggregation = project_final.distribution_questions(table)
+        for name, accumulator in full_aggregation.accumulators.items():
+            compare(name, accumulator_state(self.aggregation[name]), accumulator_state(accumulator))
+
+        for index in range(len(table)):
+            if table.children[index] is None:
+                continue
+            first_child = first_born(table.children[index].split(), table.reference_date)
+            compare('parent age of ' + table.cpr[index], table.parent_age[index],
+                    table.age[index] - age_from_cpr(first_child, table.reference_date))
+            compare('first child gender of ' + table.cpr[index], table.first_child_gender[index],
+                    gender_bit(decode_cpr(first_child)))
+
+        for node in family.nodes_with_parents():
+            cpr = family.cpr(node)
+            compare('siblings of ' + cpr, self.sibling_count(cpr), kinship.siblings[node])
+            compare('cousins of ' + cpr, self.cousin_count(cpr), kinship.cousins[node])
+
+        return differences
+
+
+# The counts of an accumulator, leaving out its value functions which differ between two accumulators
+def accumulator_state(accumulator):
+    return {key: value for key, value in accumulator.__dict__.items() if not callable(value)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Applies a delta file to people.db and updates the statistics.')
+    parser.add_argument('file_name', nargs='?', default='people.db')
+    parser.add_argument('delta_files', nargs='*', help='files in the people.db format with new people and children')
+    parser.add_argument('--verify', action='store_true', help='check the result against a full recompute')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    engine = IncrementalEngine().apply(project_final.iter_people(args.file_name))
+    print('Loaded', len(engine.table), 'people in {:.3f}s'.format(time.perf_counter() - started), file=sys.stderr)
+    for delta_file in args.delta_files:
+        started = time.perf_counter()
+        engine.apply(project_final.iter_people(delta_file))
+        print('Applied', delta_file, 'in {:.3f}s'.format(time.perf_counter() - started), file=sys.stderr)
+
+    engine.print_report()
+
+    if args.verify:
+        started = time.perf_counter()
+        differences = engine.verify()
+        print('Verified in {:.3f}s'.format(time.perf_counter() - started), file=sys.stderr)
+        for difference in differences:
+            print(difference)
+        print('Incremental state matches a full recompute' if not differences else
+              '{} differences from a full recompute'.format(len(differences)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Timing and memory of the stages of the report.
+# Each stage is run inside profiler.stage(name), which records wall time, CPU time, peak memory (tracemalloc)
+# and how many records the stage went through. A disabled profiler hands out one shared do-nothing stage, so
+# leaving the instrumentation in place costs nothing when it is off.
+# Profiling is turned on with --profile or by setting PEOPLE_PROFILE=1 in the environment.
+#
+# Stages can run at the same time on threads (see scheduler.py) inside profiler.overlapping(). Their CPU time is
+# then that of their own thread, and their peak memory is not known, since tracemalloc only has one peak for the
+# whole process.
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+ENVIRONMENT_VARIABLE = 'PEOPLE_PROFILE'
+TRACE_ENVIRONMENT_VARIABLE = 'PEOPLE_PROFILE_TRACE'
+DEFAULT_TRACE_FILE = 'profile_trace.json'
+
+
+def enabled_by_environment():
+    return os.environ.get(ENVIRONMENT_VARIABLE, '') not in ('', '0', 'false', 'no')
+
+
+class Profiler:
+
+    def __init__(self, enabled=False, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = []
+        self.started = time.perf_counter()
+        self.overlapping_stages = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # Use as 'with profiler.stage(name, records) as stage:'. records can also be set on the stage inside the block.
+    def stage(self, name, records=None):
+        if not self.enabled:
+            return NULL_STAGE
+
+        return Stage(self, name, records)
+
+    # Stages started inside this block may run at the same time as other stages
+    @contextlib.contextmanager
+    def overlapping(self):
+        self.overlapping_stages = True
+        try:
+            yield self
+        finally:
+            self.overlapping_stages = False
+
+    # Adds a stage timed somewhere else, such as in a worker process. Its peak memory is not known.
+    def record(self, name, start_offset, wall_seconds, cpu_seconds, records=None, thread_name=None):
+        if not self.enabled:
+            return
+        stage = Stage(self, name, records)
+        stage.start_offset = start_offset
+        stage.wall_seconds = wall_seconds
+        stage.cpu_seconds = cpu_seconds
+        if thread_name is not None:
+            stage.thread_name = thread_name
+        self.stages.append(stage)
+
+    def summary(self, file=sys.stderr):
+        print(file=file)
+        print('{:<45} {:>10} {:>10} {:>12} {:>10}'.format('Stage', 'Wall', 'CPU', 'Peak memory', 'Records'), file=file)
+        print('-' * 91, file=file)
+        for stage in self.stages:
+            peak = '-' if stage.peak_bytes is None else '{:.1f} MB'.format(stage.peak_bytes / 1e6)
+            records = '-' if stage.records is None else stage.records
+            print('{:<45} {:>9.3f}s {:>9.3f}s {:>12} {:>10}'.format(
+                stage.name, stage.wall_seconds, stage.cpu_seconds, peak, records), file=file)
+        print('-' * 91, file=file)
+        print('{:<45} {:>9.3f}s {:>9.3f}s'.format(
+            'Total', self.elapsed_seconds(), sum(x.cpu_seconds for x in self.stages)), file=file)
+
+    # Wall time from the start of the first stage to the end of the last, which overlapping stages are counted once in
+    def elapsed_seconds(self):
+        if not self.stages:
+            return 0.0
+
+        return (max(x.start_offset + x.wall_seconds for x in self.stages)
+                - min(x.start_offset for x in self.stages))
+
+    # Writes the stages in the Chrome trace event format, which chrome://tracing and Perfetto can show.
+    # Stages run by different threads are shown as different rows.
+    def write_trace(self, file_name):
+        thread_ids = {}
+        for stage in self.stages:
+            thread_ids.setdefault(stage.thread_name, len(thread_ids))
+        events = [{
+            'name': stage.name,
+            'ph': 'X',
+            'pid': os.getpid(),
+            'tid': thread_ids[stage.thread_name],
+            'ts': round(stage.start_offset * 1e6),
+            'dur': round(stage.wall_seconds * 1e6),
+            'args': {
+                'cpu_seconds': stage.cpu_seconds,
+                'peak_bytes': stage.peak_bytes,
+                'records': stage.records,
+            },
+        } for stage in self.stages]
+        with open(file_name, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file, indent=1)
+
+
+class Stage:
+
+    def __init__(self, profiler, name, records):
+        self.profiler = profiler
+        self.name = name
+        self.records = records
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.peak_bytes = None
+        self.start_offset = None
+        self.thread_name = threading.current_thread().name
+
+    def __enter__(self):
+        self.overlapping = self.profiler.overlapping_stages
+        self._cpu_time = time.thread_time if self.overlapping else time.process_time
+        if self.profiler.trace_memory and not self.overlapping:
+            tracemalloc.reset_peak()
+            self._memory_at_start = tracemalloc.get_traced_memory()[0]
+        self._cpu_start = self._cpu_time()
+        self._wall_start = time.perf_counter()
+        self.start_offset = self._wall_start - self.profiler.started
+
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = self._cpu_time() - self._cpu_start
+        if self.profiler.trace_memory and not self.overlapping:
+            # Peak of the memory allocated while the stage ran
+            self.peak_bytes = tracemalloc.get_traced_memory()[1] - self._memory_at_start
+        self.profiler.stages.append(self)
+
+        return False
+
+
+# What a disabled profiler hands out. Setting records on it is allowed and ignored.
+class NullStage:
+    records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = NullStage()
@@ -0,0 +1,55 @@
+# Exact sibling and cousin counts for everyone in the family graph.
+# Siblings share at least one parent. Full siblings share all their listed parents, half siblings only some.
+# First cousins are the grandchildren of a person's grandparents that are neither the person nor a sibling.
+#
+# All of these only depend on the set of parents, so children with the same parents (a sibship) are counted
+# together: the union of their parents' children and of their grandparents' grandchildren is made once per
+# sibship as a set of node ids, and every child of it gets the size. Each parent's children are therefore
+# visited once per sibship the parent is in, which keeps the work close to linear in the number of edges.
+
+from array import array
+from collections import namedtuple
+
+
+# One array per count, indexed by node id. People without parents have 0 in all of them.
+KinshipCounts = namedtuple('KinshipCounts', ['siblings', 'full_siblings', 'half_siblings', 'cousins'])
+
+
+# The children of each set of parents, in the order the sibships are first seen
+def sibships(family):
+    children_for_parents = {}
+    for node in family.nodes_with_parents():
+        key = tuple(sorted(family.parents(node)))
+        if key not in children_for_parents:
+            children_for_parents[key] = []
+        children_for_parents[key].append(node)
+
+    return children_for_parents
+
+
+def kinship_counts(family):
+    num_nodes = len(family)
+    siblings = array('l', [0]) * num_nodes
+    full_siblings = array('l', [0]) * num_nodes
+    half_siblings = array('l', [0]) * num_nodes
+    cousins = array('l', [0]) * num_nodes
+
+    for parents, children in sibships(family).items():
+        # The children themselves are in this set, so they are left out of the counts below
+        sibling_set = {child for parent in parents for child in family.children(parent)}
+        cousin_set = {
+            cousin
+            for parent in parents for grandparent in family.parents(parent)
+            for uncle in family.children(grandparent) for cousin in family.children(uncle)
+        }
+        cousin_set -= sibling_set
+
+        num_siblings = len(sibling_set) - 1
+        num_full = len(children) - 1
+        for child in children:
+            siblings[child] = num_siblings
+            full_siblings[child] = num_full
+            half_siblings[child] = num_siblings - num_full
+            cousins[child] = len(cousin_set)
+
+    return KinshipCounts(siblings, full_siblings, half_siblings, cousins)
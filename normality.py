@@ -0,0 +1,521 @@
+# Testing whether the distributions of the distribution questions are "normal".
+# A Distribution is a Summary, so it keeps the count of every value: for whole numbers such as ages this is the
+# exact distribution in memory bounded by the number of different values, however many people are counted, and two
+# Distributions counted over different parts of a file are merged by adding their counts.
+#
+# From the counts come
+#   the moments (mean, variance, skewness, excess kurtosis), with Moments,
+#   D'Agostino's K² and the Jarque-Bera test, from skewness and kurtosis,
+#   the Anderson-Darling and Lilliefors (Kolmogorov-Smirnov with estimated mean and deviation) tests, which are
+#     worked out over the different values with their counts,
+#   the Shapiro-Wilk test over a random sample of at most SHAPIRO_WILK_MAX_SAMPLE values,
+#   bootstrap confidence intervals of the moments, drawing new counts for the values instead of new people.
+#
+# The random draws use a fixed seed, so the report is the same every time.
+# Ages are whole years, so a large sample has many equal values. The Anderson-Darling and Lilliefors tests compare
+# with a continuous distribution and notice those steps once there are enough people, which is worth keeping in
+# mind when only they reject.
+#
+# Usage: normality.py [people.db] [--workers N] [--bootstrap N] [--where gender=Male|age=LOW-HIGH|children ...]
+
+import argparse
+import math
+import random
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from statistics import NormalDist
+
+from aggregation import Aggregation, Summary
+from writers import Table, TextWriter
+
+
+SIGNIFICANCE = 0.05
+SHAPIRO_WILK_MAX_SAMPLE = 5000
+BOOTSTRAP_REPLICATES = 1000
+RANDOM_SEED = 2000
+# Binomial draws with fewer expected successes than this are drawn exactly, larger ones from the normal distribution
+EXACT_BINOMIAL_LIMIT = 25
+# Bootstrap samples are drawn person by person when there are fewer people than this per different value
+PEOPLE_PER_VALUE_LIMIT = 50
+
+STANDARD_NORMAL = NormalDist()
+
+# The fields of people.db the command line reads, see project_final.iter_people
+FIELDS = ('Age', 'Gender', 'Parent age')
+
+# Columns of the tables of NormalityReport.rows and gender_balance
+NORMALITY_COLUMNS = ['Statistic', 'Value', 'p-value or interval']
+
+
+# Count, mean and central moment sums M2, M3 and M4 of counted values
+class Moments:
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    # In two passes over the values, since they are all at hand
+    @classmethod
+    def from_counts(cls, counts):
+        moments = cls()
+        moments.n = sum(counts.values())
+        if moments.n == 0:
+            return moments
+        moments.mean = sum(value * count for value, count in counts.items()) / moments.n
+        for value, count in counts.items():
+            deviation = value - moments.mean
+            square = deviation * deviation
+            moments.m2 += count * square
+            moments.m3 += count * square * deviation
+            moments.m4 += count * square * square
+
+        return moments
+
+    # With ddof=1 the sample variance, with 0 the population variance
+    def variance(self, ddof=1):
+        return self.m2 / (self.n - ddof)
+
+    def standard_deviation(self, ddof=1):
+        return math.sqrt(self.variance(ddof))
+
+    def skewness(self):
+        return math.sqrt(self.n) * self.m3 / self.m2 ** 1.5
+
+    def excess_kurtosis(self):
+        return self.n * self.m4 / (self.m2 * self.m2) - 3
+
+
+# Summary that also gives the moments and the normality tests of the counted values
+class Distribution(Summary):
+
+    # Adds count of value at once, for counts made somewhere else such as in a worker process
+    def add_count(self, value, count):
+        self.counts[value] = self.counts.get(value, 0) + count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def moments(self):
+        return Moments.from_counts(self.counts)
+
+
+# The different values with their counts in increasing order
+def sorted_counts(counts):
+    return sorted((value, count) for value, count in counts.items() if count)
+
+
+def normal_survival(z):
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+# Both tails of the standard normal distribution
+def two_sided_p(z):
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def chi_square_2_survival(x):
+    return math.exp(-x / 2)
+
+
+# log of the normal cumulative distribution at z and of its complement, without taking the log of 0 in the tails
+def log_normal_cdfs(z):
+    lower = 0.5 * math.erfc(-z / math.sqrt(2))
+    upper = 0.5 * math.erfc(z / math.sqrt(2))
+
+    return math.log(max(lower, 1e-300)), math.log(max(upper, 1e-300))
+
+
+# Results of a test: the statistic, its p-value and whether normality is rejected at the significance level.
+# p_value is None when only a bound is known, with p_text telling the bound.
+class TestResult:
+
+    def __init__(self, name, statistic, p_value, p_text=None):
+        self.name = name
+        self.statistic = statistic
+        self.p_value = p_value
+        self.p_text = p_text if p_text is not None else '{:.3g}'.format(p_value)
+
+    def __repr__(self):
+        return '{}: {:.4g} (p {})'.format(self.name, self.statistic, self.p_text)
+
+    def rejects(self, significance=SIGNIFICANCE):
+        return self.p_value is not None and self.p_value < significance
+
+
+# D'Agostino's test of the skewness, for at least 8 values
+def skewness_z(moments):
+    n = moments.n
+    y = moments.skewness() * math.sqrt((n + 1) * (n + 3) / (6.0 * (n - 2)))
+    beta2 = 3.0 * (n * n + 27 * n - 70) * (n + 1) * (n + 3) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+    w2 = -1 + math.sqrt(2 * (beta2 - 1))
+    delta = 1 / math.sqrt(0.5 * math.log(w2))
+    alpha = math.sqrt(2.0 / (w2 - 1))
+    if y == 0:
+        y = 1
+
+    return delta * math.log(y / alpha + math.sqrt((y / alpha) ** 2 + 1))
+
+
+# Anscombe and Glynn's test of the kurtosis, for at least 20 values. NaN when it can not be worked out: for fewer
+# than 4 values, equal values, or a kurtosis the transformation is not defined for.
+def kurtosis_z(moments):
+    n = moments.n
+    if n < 4 or moments.m2 == 0:
+        return math.nan
+    b2 = moments.excess_kurtosis() + 3
+    expected = 3.0 * (n - 1) / (n + 1)
+    variance = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+    x = (b2 - expected) / math.sqrt(variance)
+    root_beta1 = (6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9.0))
+                  * math.sqrt(6.0 * (n + 3) * (n + 5) / (n * (n - 2) * (n - 3))))
+    a = 6.0 + 8.0 / root_beta1 * (2.0 / root_beta1 + math.sqrt(1 + 4.0 / root_beta1 ** 2))
+    term1 = 1 - 2 / (9.0 * a)
+    denominator = 1 + x * math.sqrt(2 / (a - 4.0))
+    if denominator == 0:
+        return math.nan
+    term2 = math.copysign(abs((1 - 2.0 / a) / denominator) ** (1 / 3.0), denominator)
+
+    return (term1 - term2) / math.sqrt(2 / (9.0 * a))
+
+
+def dagostino_pearson(moments):
+    if moments.n < 20:
+        return None
+    k2 = skewness_z(moments) ** 2 + kurtosis_z(moments) ** 2
+    if math.isnan(k2):
+        return None
+
+    return TestResult("D'Agostino K²", k2, chi_square_2_survival(k2))
+
+
+def jarque_bera(moments):
+    jb = moments.n / 6.0 * (moments.skewness() ** 2 + moments.excess_kurtosis() ** 2 / 4)
+
+    return TestResult('Jarque-Bera', jb, chi_square_2_survival(jb))
+
+
+# Anderson-Darling test with estimated mean and deviation. The values at positions a + 1 to a + c of the sorted
+# sample are equal, so their terms of the sum are added at once.
+def anderson_darling(counts):
+    moments = Moments.from_counts(counts)
+    n = moments.n
+    mean, deviation = moments.mean, moments.standard_deviation()
+    total = 0.0
+    before = 0
+    for value, count in sorted_counts(counts):
+        log_lower, log_upper = log_normal_cdfs((value - mean) / deviation)
+        after = before + count
+        total += (after * after - before * before) * log_lower
+        total += (count * (2 * n + 1) - (after * (after + 1) - before * (before + 1))) * log_upper
+        before = after
+    a2 = -n - total / n
+    adjusted = a2 * (1 + 0.75 / n + 2.25 / (n * n))
+
+    # D'Agostino and Stephens (1986), for the case of estimated mean and deviation
+    if adjusted >= 153:
+        p_value = 0.0
+    elif adjusted >= 0.6:
+        p_value = math.exp(1.2937 - 5.709 * adjusted + 0.0186 * adjusted ** 2)
+    elif adjusted >= 0.34:
+        p_value = math.exp(0.9177 - 4.279 * adjusted - 1.38 * adjusted ** 2)
+    elif adjusted >= 0.2:
+        p_value = 1 - math.exp(-8.318 + 42.796 * adjusted - 59.938 * adjusted ** 2)
+    else:
+        p_value = 1 - math.exp(-13.436 + 101.14 * adjusted - 223.73 * adjusted ** 2)
+
+    return TestResult('Anderson-Darling A²', adjusted, p_value)
+
+
+# Kolmogorov-Smirnov distance to the normal distribution with estimated mean and deviation, with the p-value
+# approximation of Dallal and Wilkinson (1986), which is only given below 0.1
+def lilliefors(counts):
+    moments = Moments.from_counts(counts)
+    n = moments.n
+    normal = NormalDist(moments.mean, moments.standard_deviation())
+    distance = 0.0
+    before = 0
+    for value, count in sorted_counts(counts):
+        cdf = normal.cdf(value)
+        distance = max(distance, (before + count) / n - cdf, cdf - before / n)
+        before += count
+
+    scaled, size = distance, n
+    if n > 100:
+        scaled, size = distance * (n / 100.0) ** 0.49, 100
+    p_value = math.exp(-7.01256 * scaled ** 2 * (size + 2.78019) + 2.99587 * scaled * math.sqrt(size + 2.78019)
+                       - 0.122119 + 0.974598 / math.sqrt(size) + 1.67997 / size)
+    if p_value > 0.1:
+        return TestResult('Lilliefors D', distance, None, '> 0.1')
+
+    return TestResult('Lilliefors D', distance, p_value)
+
+
+# A random sample of size values from the counted values, in increasing order
+def sample_from_counts(counts, size, rng):
+    values = sorted_counts(counts)
+    cumulative = []
+    total = 0
+    for _, count in values:
+        total += count
+        cumulative.append(total)
+    positions = sorted(rng.sample(range(total), min(size, total)))
+
+    return [values[bisect_right(cumulative, position)][0] for position in positions]
+
+
+# Shapiro-Wilk W with Royston's (1995) approximations of the coefficients and the p-value, for 3 to 5000 values
+def shapiro_wilk(sorted_values):
+    n = len(sorted_values)
+    if n < 3 or sorted_values[0] == sorted_values[-1]:
+        return None
+    m = [STANDARD_NORMAL.inv_cdf((i - 0.375) / (n + 0.25)) for i in range(1, n + 1)]
+    sum_m2 = sum(x * x for x in m)
+    u = 1 / math.sqrt(n)
+    last = m[-1] / math.sqrt(sum_m2)
+    a_n = last + 0.221157 * u - 0.147981 * u ** 2 - 2.071190 * u ** 3 + 4.434685 * u ** 4 - 2.706056 * u ** 5
+    if n > 5:
+        second_last = m[-2] / math.sqrt(sum_m2)
+        a_n1 = (second_last + 0.042981 * u - 0.293762 * u ** 2 - 1.752461 * u ** 3 + 5.682633 * u ** 4
+                - 3.582633 * u ** 5)
+        phi = (sum_m2 - 2 * m[-1] ** 2 - 2 * m[-2] ** 2) / (1 - 2 * a_n ** 2 - 2 * a_n1 ** 2)
+        a = [x / math.sqrt(phi) for x in m]
+        a[0], a[1], a[-2], a[-1] = -a_n, -a_n1, a_n1, a_n
+    elif n == 3:
+        a = [-math.sqrt(0.5), 0.0, math.sqrt(0.5)]
+    else:
+        phi = (sum_m2 - 2 * m[-1] ** 2) / (1 - 2 * a_n ** 2)
+        a = [x / math.sqrt(phi) for x in m]
+        a[0], a[-1] = -a_n, a_n
+
+    mean = sum(sorted_values) / n
+    w = sum(x * y for x, y in zip(a, sorted_values)) ** 2 / sum((x - mean) ** 2 for x in sorted_values)
+    w = min(w, 1.0)
+
+    if n == 3:
+        p_value = max(0.0, 6 / math.pi * (math.asin(math.sqrt(w)) - math.asin(math.sqrt(0.75))))
+        return TestResult('Shapiro-Wilk W', w, p_value)
+    if w == 1.0:
+        return TestResult('Shapiro-Wilk W', w, 1.0)
+    if n <= 11:
+        gamma = 0.459 * n - 2.273
+        mu = 0.5440 - 0.39978 * n + 0.025054 * n ** 2 - 0.0006714 * n ** 3
+        sigma = math.exp(1.3822 - 0.77857 * n + 0.062767 * n ** 2 - 0.0020322 * n ** 3)
+        if math.log(1 - w) >= gamma:
+            return TestResult('Shapiro-Wilk W', w, 0.0)
+        z = (-math.log(gamma - math.log(1 - w)) - mu) / sigma
+    else:
+        log_n = math.log(n)
+        mu = 0.0038915 * log_n ** 3 - 0.083751 * log_n ** 2 - 0.31082 * log_n - 1.5861
+        sigma = math.exp(0.0030302 * log_n ** 2 - 0.082676 * log_n - 0.4803)
+        z = (math.log(1 - w) - mu) / sigma
+
+    return TestResult('Shapiro-Wilk W', w, normal_survival(z))
+
+
+def binomial_variate(rng, n, p):
+    if p <= 0 or n == 0:
+        return 0
+    if p >= 1:
+        return n
+    if p > 0.5:
+        return n - binomial_variate(rng, n, 1 - p)
+    if n * p < EXACT_BINOMIAL_LIMIT:
+        # The number of successes is the number of geometric waiting times that fit in the n trials
+        log_q = math.log(1 - p)
+        successes = 0
+        trials = 0
+        while True:
+            trials += int(math.log(1 - rng.random()) / log_q) + 1
+            if trials > n:
+                return successes
+            successes += 1
+    draw = round(rng.gauss(n * p, math.sqrt(n * p * (1 - p))))
+
+    return min(max(draw, 0), n)
+
+
+# New counts for the same values as drawing the same number of people again with replacement. With many people
+# per value this is a multinomial draw, made as a binomial draw for one value at a time.
+def resampled_counts(values, counts, rng, cumulative=None):
+    remaining = sum(counts)
+    if remaining < PEOPLE_PER_VALUE_LIMIT * len(values):
+        return Counter(rng.choices(values, cum_weights=cumulative or list(accumulate(counts)), k=remaining))
+    remaining_share = 1.0
+    total = remaining
+    resampled = {}
+    for value, count in zip(values, counts):
+        share = count / total
+        drawn = remaining if share >= remaining_share else binomial_variate(rng, remaining, share / remaining_share)
+        resampled[value] = drawn
+        remaining -= drawn
+        remaining_share -= share
+        if remaining == 0:
+            break
+
+    return resampled
+
+
+def percentile(sorted_values, fraction):
+    position = fraction * (len(sorted_values) - 1)
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+# Percentile bootstrap confidence intervals of the mean, standard deviation, skewness and excess kurtosis
+def bootstrap_intervals(counts, replicates=BOOTSTRAP_REPLICATES, confidence=0.95, rng=None):
+    rng = rng or random.Random(RANDOM_SEED)
+    values, value_counts = zip(*sorted_counts(counts))
+    cumulative = list(accumulate(value_counts))
+    statistics = {'Mean': [], 'Standard deviation': [], 'Skewness': [], 'Excess kurtosis': []}
+    for _ in range(replicates):
+        moments = Moments.from_counts(resampled_counts(values, value_counts, rng, cumulative))
+        if moments.m2 == 0:
+            continue
+        statistics['Mean'].append(moments.mean)
+        statistics['Standard deviation'].append(moments.standard_deviation())
+        statistics['Skewness'].append(moments.skewness())
+        statistics['Excess kurtosis'].append(moments.excess_kurtosis())
+
+    tail = (1 - confidence) / 2
+    intervals = {}
+    for name, draws in statistics.items():
+        draws.sort()
+        intervals[name] = (percentile(draws, tail), percentile(draws, 1 - tail)) if draws else None
+
+    return intervals
+
+
+# Everything known about the normality of the counted values
+class NormalityReport:
+
+    def __init__(self, counts, replicates=BOOTSTRAP_REPLICATES, seed=RANDOM_SEED):
+        self.moments = Moments.from_counts(counts)
+        self.tests = []
+        self.intervals = {}
+        if self.moments.n < 3 or self.moments.m2 == 0:
+            return
+        rng = random.Random(seed)
+        tests = [
+            shapiro_wilk(sample_from_counts(counts, SHAPIRO_WILK_MAX_SAMPLE, rng)),
+            anderson_darling(counts),
+            lilliefors(counts),
+            dagostino_pearson(self.moments),
+            jarque_bera(self.moments),
+        ]
+        self.tests = [x for x in tests if x is not None]
+        if replicates:
+            self.intervals = bootstrap_intervals(counts, replicates, rng=rng)
+
+    def rejections(self, significance=SIGNIFICANCE):
+        return sum(1 for x in self.tests if x.rejects(significance))
+
+    # Rows of (statistic, value, p-value or confidence interval) for a table of the report
+    def rows(self):
+        moments = self.moments
+        if moments.n < 2 or moments.m2 == 0:
+            return [('Count', moments.n, '')]
+        rows = [('Count', moments.n, '')]
+        for name, value in (('Mean', moments.mean),
+                            ('Standard deviation', moments.standard_deviation()),
+                            ('Skewness', moments.skewness()),
+                            ('Excess kurtosis', moments.excess_kurtosis())):
+            interval = self.intervals.get(name)
+            rows.append((name, round(value, 4), '' if interval is None else
+                         '95% CI [{:.4g}, {:.4g}]'.format(*interval)))
+        for x in self.tests:
+            rows.append((x.name, round(x.statistic, 4), 'p ' + x.p_text))
+        rows.append(('Tests rejecting normality', '{} of {}'.format(self.rejections(), len(self.tests)),
+                     'at the {:g}% level'.format(SIGNIFICANCE * 100)))
+
+        return rows
+
+
+# Test of the share of men against one half. Gender has two values, so it can not be normal as such; the question
+# is whether it is balanced.
+def gender_balance(counts):
+    men, women = counts.get('Male', 0), counts.get('Female', 0)
+    total = men + women
+    if total == 0:
+        return [('Count', 0, '')]
+    share = men / total
+    z = (men - total / 2) / math.sqrt(total / 4)
+    margin = 1.959964 * math.sqrt(share * (1 - share) / total)
+
+    return [
+        ('Count', total, ''),
+        ('Share of men', round(share, 4), '95% CI [{:.4g}, {:.4g}]'.format(share - margin, share + margin)),
+        ('Balance z', round(z, 4), 'p {:.3g}'.format(two_sided_p(z))),
+    ]
+
+
+# The counts of the columns tested by the command line, made in a worker process for a range of the file
+def count_chunk(file_name, start, end, reference_date, where=()):
+    # Imported here since project_final.py builds on this module
+    import parallel_ingest
+    aggregation = normality_aggregation()
+    aggregation.run(parallel_ingest.parse_chunk(file_name, start, end, reference_date, FIELDS, where))
+
+    return {name: aggregation[name].counts for name in aggregation.accumulators}
+
+
+def normality_aggregation():
+    # Imported here since project_final.py builds on this module
+    import project_final
+    aggregation = Aggregation()
+    aggregation.add('Age', Distribution(lambda x: x["Age"]))
+    aggregation.add('Age of first-time fathers', project_final.first_child_age_summary("Male"))
+    aggregation.add('Age of first-time mothers', project_final.first_child_age_summary("Female"))
+
+    return aggregation
+
+
+def main(argv=None):
+    # Imported here since project_final.py builds on this module
+    import parallel_ingest
+    import project_final
+
+    parser = argparse.ArgumentParser(description='Tests the age and first-time parent age distributions for normality.')
+    parser.add_argument('file_name', nargs='?', default='people.db')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='count ranges of the file in this many processes and merge the counts')
+    parser.add_argument('--bootstrap', type=int, default=BOOTSTRAP_REPLICATES, metavar='N',
+                        help='number of bootstrap replicates for the confidence intervals')
+    parser.add_argument('--where', action='append', type=project_final.parse_predicate, default=[],
+                        metavar='PREDICATE', help='only count the people this holds for: gender=Male, gender=Female, '
+                                                  'age=LOW-HIGH or children (repeatable, all must hold)')
+    args = parser.parse_args(argv)
+
+    aggregation = normality_aggregation()
+    if args.workers > 1:
+        ranges = parallel_ingest.chunk_boundaries(args.file_name, args.workers)
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [
+                executor.submit(count_chunk, args.file_name, start, end, project_final.REFERENCE_DATE, args.where)
+                for start, end in ranges
+            ]
+            for future in futures:
+                for name, counts in future.result().items():
+                    for value, count in counts.items():
+                        aggregation[name].add_count(value, count)
+    else:
+        aggregation.run(project_final.iter_people(args.file_name, fields=FIELDS, where=args.where))
+
+    with TextWriter() as writer:
+        for name, distribution in aggregation.accumulators.items():
+            writer.text('Normality of ' + name.lower() + ':')
+            rows = NormalityReport(distribution.counts, args.bootstrap).rows()
+            writer.write(Table('Normality of ' + name.lower(), NORMALITY_COLUMNS, rows, 'list'))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Parallel reading of large people.db files.
+# The file is split into byte ranges that end right after a record, every range is parsed in a worker process
+# (including the CPR decoding and the firstborn of 'Children') and the people are put back together in the
+# order of the file. The result is the same list of dicts as read_people_as_dict gives.
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import project_final
+from people_table import PeopleTable
+
+
+# Ranges are made about this size, so a worker never holds more than one range of text at a time
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+# Byte offsets splitting the file into about num_chunks ranges.
+# The serial reader only starts over with an empty person after a record with a CPR, so a range is only ended
+# after the blank line closing a record with a 'CPR' line. Every range is then read exactly as the serial
+# reader would read that part of the file.
+def chunk_boundaries(file_name, num_chunks):
+    size = os.path.getsize(file_name)
+    boundaries = [0]
+    with open(file_name, 'rb') as file:
+        for chunk in range(1, num_chunks):
+            target = max(size * chunk // num_chunks, boundaries[-1])
+            file.seek(target)
+            # The record that target falls in may have started before it, so it does not count
+            has_cpr = None
+            for line in file:
+                text = line.decode('utf-8', errors='replace')
+                if text.strip() == '':
+                    if has_cpr:
+                        break
+                    has_cpr = False
+                elif has_cpr is not None and text[0] != '#' and text.split(': ')[0] == 'CPR':
+                    has_cpr = True
+            boundary = file.tell()
+            if boundaries[-1] < boundary < size:
+                boundaries.append(boundary)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# Runs in a worker process. fields and where are those of project_final.iter_people.
+def parse_chunk(file_name, start, end, reference_date, fields=None, where=()):
+    with open(file_name, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    # Decoded the same way as the text file opened by the serial reader
+    lines = io.TextIOWrapper(io.BytesIO(data))
+
+    if fields is None and not where:
+        return list(project_final.iter_people_in_lines(lines, reference_date))
+
+    return list(project_final.iter_projected_people_in_lines(lines, reference_date, fields, where))
+
+
+# The people of every range in the order of the file, one list of dicts per range as the workers finish them.
+# workers defaults to the number of CPUs.
+def iter_chunks(file_name, workers=None, reference_date=project_final.REFERENCE_DATE, fields=None, where=()):
+    workers = workers or os.cpu_count() or 1
+    try:
+        num_chunks = max(workers, -(-os.path.getsize(file_name) // CHUNK_SIZE))
+        ranges = chunk_boundaries(file_name, num_chunks)
+    except IOError as error:
+        print('File not found, reason:', str(error))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map gives the results in the order of the ranges, which is the order of the file, and lets go of every
+        # result once it is handed on
+        yield from executor.map(
+            parse_chunk,
+            [file_name] * len(ranges),
+            [start for start, end in ranges],
+            [end for start, end in ranges],
+            [reference_date] * len(ranges),
+            [fields] * len(ranges),
+            [where] * len(ranges),
+        )
+
+
+# Parallel version of read_people_as_dict. workers defaults to the number of CPUs.
+def read_people(file_name, workers=None, reference_date=project_final.REFERENCE_DATE, fields=None, where=()):
+    return list(chain.from_iterable(iter_chunks(file_name, workers, reference_date, fields, where)))
+
+
+# The dicts of a range are appended to the table as soon as the range is read, so only the ranges not yet appended
+# are held as dicts, never the whole file
+def read_people_as_table(file_name, workers=None, reference_date=project_final.REFERENCE_DATE, fields=None, where=()):
+    if fields is not None:
+        fields = set(fields) | {'CPR'}
+    chunks = iter_chunks(file_name, workers, reference_date, fields, where)
+
+    return PeopleTable.from_people(chain.from_iterable(chunks), reference_date)
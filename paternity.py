@@ -0,0 +1,236 @@
+# Probabilistic parentage from blood types, working on genotypes instead of the phenotype whitelists of blood.py.
+# ABO genotypes are AA, AO, BB, BO, AB and OO, and Rhesus genotypes DD, Dd and dd.
+#
+# Every person gets a genotype distribution given their own blood type and the blood types of all their ancestors
+# in the family graph. A founder (no parents in the graph) starts from the Hardy-Weinberg frequencies. For others
+# the distribution of their parents is pushed through the Mendelian transmission table, so grandparents narrow
+# down the genotypes of the parents, and so on up the pedigree. Distributions are memoized per person and the
+# distribution of the children of a couple per couple, so each family is only worked out once.
+#
+# For each child-parent link the likelihood of the child's blood type with both listed parents is compared to
+# the likelihood when that parent is replaced by a random person from the population (the paternity index).
+
+from collections import namedtuple
+
+from people_table import MISSING
+
+
+ABO_GENOTYPES = ('AA', 'AO', 'BB', 'BO', 'AB', 'OO')
+RHESUS_GENOTYPES = ('DD', 'Dd', 'dd')
+
+# Allele frequencies used for founders and for the random person of the alternative hypothesis
+ABO_FREQUENCIES = {'A': 0.28, 'B': 0.08, 'O': 0.64}
+RHESUS_FREQUENCIES = {'D': 0.6, 'd': 0.4}
+
+# Blood type codes of people_table are A = 4, B = 2 and Rhesus D = 1
+ABO_PHENOTYPE_FOR_CODE = ('O', 'O', 'B', 'B', 'A', 'A', 'AB', 'AB')
+
+
+def abo_phenotype(genotype):
+    antigens = ''.join(sorted(set(genotype) - {'O'}))
+    return antigens or 'O'
+
+
+def rhesus_phenotype(genotype):
+    return '+' if 'D' in genotype else '-'
+
+
+def hardy_weinberg(genotypes, frequencies):
+    return [frequencies[g[0]] * frequencies[g[1]] * (1 if g[0] == g[1] else 2) for g in genotypes]
+
+
+# TRANSMISSION[g1][g2][g] is the chance that parents with genotypes g1 and g2 have a child with genotype g
+def transmission_table(genotypes):
+    index_for_alleles = {}
+    for index, genotype in enumerate(genotypes):
+        index_for_alleles[genotype] = index
+        index_for_alleles[genotype[::-1]] = index
+
+    table = []
+    for first in genotypes:
+        row = []
+        for second in genotypes:
+            child = [0.0] * len(genotypes)
+            for allele1 in first:
+                for allele2 in second:
+                    child[index_for_alleles[allele1 + allele2]] += 0.25
+            row.append(child)
+        table.append(row)
+
+    return table
+
+
+class BloodSystem:
+
+    def __init__(self, name, genotypes, frequencies, phenotype, phenotype_for_code):
+        self.name = name
+        self.genotypes = genotypes
+        self.prior = hardy_weinberg(genotypes, frequencies)
+        self.transmission = transmission_table(genotypes)
+        # For each blood type code, 1 for the genotypes giving that blood type and 0 for the others
+        self.consistent = [
+            [1.0 if phenotype(g) == phenotype_for_code(code) else 0.0 for g in genotypes] for code in range(8)
+        ]
+
+    # Genotype distribution of a child of parents with the distributions first and second
+    def child_distribution(self, first, second):
+        size = len(self.genotypes)
+        child = [0.0] * size
+        for g1 in range(size):
+            if first[g1] == 0.0:
+                continue
+            for g2 in range(size):
+                weight = first[g1] * second[g2]
+                if weight == 0.0:
+                    continue
+                transmitted = self.transmission[g1][g2]
+                for g in range(size):
+                    child[g] += weight * transmitted[g]
+
+        return child
+
+    # Distribution narrowed down by the person's own blood type. Returns the normalized distribution and the
+    # likelihood of the blood type. A missing blood type leaves the distribution as it is.
+    def observe(self, distribution, code):
+        if code == MISSING:
+            return distribution, 1.0
+        consistent = self.consistent[code]
+        weighted = [p * c for p, c in zip(distribution, consistent)]
+        likelihood = sum(weighted)
+        if likelihood == 0.0:
+            return weighted, 0.0
+
+        return [p / likelihood for p in weighted], likelihood
+
+    def likelihood(self, distribution, code):
+        if code == MISSING:
+            return 1.0
+
+        return sum(p * c for p, c in zip(distribution, self.consistent[code]))
+
+
+ABO_SYSTEM = BloodSystem('ABO', ABO_GENOTYPES, ABO_FREQUENCIES, abo_phenotype, lambda code: ABO_PHENOTYPE_FOR_CODE[code])
+RHESUS_SYSTEM = BloodSystem('Rhesus', RHESUS_GENOTYPES, RHESUS_FREQUENCIES, rhesus_phenotype,
+                            lambda code: '+' if code & 1 else '-')
+SYSTEMS = (ABO_SYSTEM, RHESUS_SYSTEM)
+
+
+# likelihood is the chance of the child's blood type with both listed parents, and random_likelihood the chance
+# when this parent is replaced by a random person. likelihood_ratio is their ratio (the paternity index) and
+# probability the chance the link is biological when both hypotheses were equally likely beforehand.
+ParentLink = namedtuple('ParentLink', ['child', 'parent', 'likelihood', 'random_likelihood', 'likelihood_ratio',
+                                       'probability'])
+
+
+class PaternityEngine:
+
+    def __init__(self, table, family, systems=SYSTEMS):
+        self.table = table
+        self.family = family
+        self.systems = systems
+        self._distributions = {}
+        self._couple_distributions = {}
+
+    def blood_type_code(self, node):
+        return self.table.blood_type[node] if node < len(self.table) else MISSING
+
+    # Genotype distributions of node (one per system) given its blood type and the blood types of its ancestors
+    def distributions(self, node):
+        distributions = self._distributions.get(node)
+        if distributions is not None:
+            return distributions
+
+        # Worked out iteratively from the oldest ancestors down, since pedigrees can be deep
+        stack = [node]
+        in_progress = set()
+        while stack:
+            current = stack[-1]
+            if current in self._distributions:
+                stack.pop()
+                continue
+            parents = self.family.parents(current)
+            missing = [
+                parent for parent in parents
+                if parent not in self._distributions and parent not in in_progress
+            ] if len(parents) == 2 else []
+            if missing:
+                in_progress.add(current)
+                stack.extend(missing)
+                continue
+            stack.pop()
+            in_progress.discard(current)
+            if len(parents) == 2 and all(parent in self._distributions for parent in parents):
+                before = self.couple_distributions(parents[0], parents[1])
+            else:
+                # Founders, and people caught in a cycle of bad data, start from the population
+                before = [system.prior for system in self.systems]
+            code = self.blood_type_code(current)
+            self._distributions[current] = [
+                self.observe(system, distribution, code) for system, distribution in zip(self.systems, before)
+            ]
+
+        return self._distributions[node]
+
+    # A person whose blood type is impossible from their own parents is not a biological child of both of them, so
+    # their ancestors say nothing about them and they start from the population instead
+    def observe(self, system, distribution, code):
+        observed, likelihood = system.observe(distribution, code)
+        if likelihood == 0.0:
+            observed = system.observe(system.prior, code)[0]
+
+        return observed
+
+    # Genotype distributions of any child of the two parents, before looking at the child's own blood type
+    def couple_distributions(self, first, second):
+        key = (first, second) if first < second else (second, first)
+        distributions = self._couple_distributions.get(key)
+        if distributions is None:
+            distributions = [
+                system.child_distribution(a, b)
+                for system, a, b in zip(self.systems, self.distributions(key[0]), self.distributions(key[1]))
+            ]
+            self._couple_distributions[key] = distributions
+
+        return distributions
+
+    # Chance of the child's blood type when its parents have the given genotype distributions
+    def child_likelihood(self, child, first, second):
+        code = self.blood_type_code(child)
+        likelihood = 1.0
+        for system, a, b in zip(self.systems, first, second):
+            likelihood *= system.likelihood(system.child_distribution(a, b), code)
+
+        return likelihood
+
+    # ParentLink for both parents of child. Children without exactly two parents give an empty list.
+    def links(self, child):
+        parents = self.family.parents(child)
+        if len(parents) != 2:
+            return []
+
+        code = self.blood_type_code(child)
+        both = self.couple_distributions(parents[0], parents[1])
+        likelihood = 1.0
+        for system, distribution in zip(self.systems, both):
+            likelihood *= system.likelihood(distribution, code)
+
+        links = []
+        population = [system.prior for system in self.systems]
+        for parent, other in ((parents[0], parents[1]), (parents[1], parents[0])):
+            random_likelihood = self.child_likelihood(child, population, self.distributions(other))
+            if random_likelihood > 0.0:
+                ratio = likelihood / random_likelihood
+            else:
+                ratio = float('inf') if likelihood > 0.0 else 0.0
+            probability = ratio / (ratio + 1) if ratio != float('inf') else 1.0
+            links.append(ParentLink(child, parent, likelihood, random_likelihood, ratio, probability))
+
+        return links
+
+    # ParentLink for every child-parent link in the family graph
+    def all_links(self):
+        links = []
+        for child in self.family.nodes_with_parents():
+            links.extend(self.links(child))
+
+        return links
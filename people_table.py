@@ -0,0 +1,283 @@
+# Columnar storage for the people in people.db.
+# Instead of one dict per person every field is kept in its own column. Numeric fields are typed
+# arrays parsed once when loading, and repeated strings (names, eye color) are interned.
+
+import sys
+from array import array
+from collections.abc import Mapping
+
+from cpr import REFERENCE_DATE, age_column, birth_ordinal, decode_cpr, first_born, gender_bit
+
+
+# Used in the numeric and code columns when a person does not have the value.
+# Ages can be negative for people born after the reference date, so -1 can not be used.
+MISSING = -128
+
+GENDERS = ('Female', 'Male')
+
+# Blood types are encoded by their antigens: A = 4, B = 2 and Rhesus D = 1.
+# The code of a blood type is therefore also its index in this tuple.
+BLOOD_TYPES = ('O-', 'O+', 'B-', 'B+', 'A-', 'A+', 'AB-', 'AB+')
+CODE_FOR_BLOOD_TYPE = {blood_type: code for code, blood_type in enumerate(BLOOD_TYPES)}
+
+# The keys a row has, in the order they are listed by a row view
+FIELDS = ('CPR', 'First name', 'Last name', 'Height', 'Weight', 'Eye color', 'Blood type', 'Children',
+          'Age', 'Gender', 'Parent age', 'First child gender')
+
+# The names of the columns of a PeopleTable
+STRING_COLUMNS = ('cpr', 'first_name', 'last_name', 'eye_color', 'children')
+NUMERIC_COLUMNS = ('height', 'weight', 'age', 'gender', 'blood_type', 'parent_age', 'first_child_gender',
+                   'birth_ordinal', 'first_child_birth_ordinal')
+
+
+def encode_blood_type(blood_type):
+    return CODE_FOR_BLOOD_TYPE[blood_type]
+
+
+def decode_blood_type(code):
+    return BLOOD_TYPES[code]
+
+
+def encode_gender(gender):
+    return GENDERS.index(gender)
+
+
+class PeopleTable:
+
+    def __init__(self, reference_date=REFERENCE_DATE):
+        self.reference_date = reference_date
+        self.cpr = []
+        self.first_name = []
+        self.last_name = []
+        self.eye_color = []
+        self.children = []
+        self.height = array('h')
+        self.weight = array('h')
+        self.age = array('h')
+        self.gender = array('b')
+        self.blood_type = array('b')
+        self.parent_age = array('h')
+        self.first_child_gender = array('b')
+        # Birth dates as date ordinals, so ages can be recalculated for another reference date without parsing
+        self.birth_ordinal = array('l')
+        self.first_child_birth_ordinal = array('l')
+        # Fields that are not part of FIELDS, given as {key: [value or None for each row]}
+        self.other_fields = {}
+        self.index_for_cpr = {}
+        self.cpr_index = CprIndex(self)
+
+    # Builds the table from dicts as they are produced by iter_people. The rows are consumed once,
+    # so a stream can be given without holding every dict in memory.
+    @classmethod
+    def from_people(cls, people, reference_date=REFERENCE_DATE):
+        table = cls(reference_date)
+        for row in people:
+            table.append(row)
+
+        return table
+
+    # Wraps columns that already exist, for example columns mapped from a snapshot file.
+    # index_for_cpr can be any mapping from CPR to row index.
+    @classmethod
+    def from_columns(cls, columns, index_for_cpr, other_fields=None, reference_date=REFERENCE_DATE):
+        table = cls(reference_date)
+        for name in STRING_COLUMNS + NUMERIC_COLUMNS:
+            setattr(table, name, columns[name])
+        table.other_fields = other_fields or {}
+        table.index_for_cpr = index_for_cpr
+
+        return table
+
+    def append(self, row):
+        index = len(self.cpr)
+        self.cpr.append(row['CPR'])
+        self.first_name.append(intern_or_none(row.get('First name')))
+        self.last_name.append(intern_or_none(row.get('Last name')))
+        self.eye_color.append(intern_or_none(row.get('Eye color')))
+        self.children.append(row.get('Children'))
+        self.height.append(int_or_missing(row.get('Height')))
+        self.weight.append(int_or_missing(row.get('Weight')))
+        self.age.append(int_or_missing(row.get('Age')))
+        self.gender.append(encode_gender(row['Gender']) if 'Gender' in row else MISSING)
+        self.blood_type.append(encode_blood_type(row['Blood type']) if 'Blood type' in row else MISSING)
+        self.parent_age.append(int_or_missing(row.get('Parent age')))
+        if 'First child gender' in row:
+            self.first_child_gender.append(encode_gender(row['First child gender']))
+        else:
+            self.first_child_gender.append(MISSING)
+        self.birth_ordinal.append(birth_ordinal(decode_cpr(row['CPR'])))
+        if 'Children' in row:
+            first_child = first_born(row['Children'].split(), self.reference_date)
+            self.first_child_birth_ordinal.append(birth_ordinal(decode_cpr(first_child)))
+        else:
+            self.first_child_birth_ordinal.append(MISSING)
+
+        for key, value in row.items():
+            if key in FIELDS:
+                continue
+            if key not in self.other_fields:
+                self.other_fields[key] = [None] * index
+            self.other_fields[key].append(value)
+        for values in self.other_fields.values():
+            if len(values) == index:
+                values.append(None)
+
+        self.index_for_cpr[row['CPR']] = index
+
+    # Appends the rows of another table, as if they had been read after the rows of this one. Used to put together
+    # the tables of the shards of a dataset, see sharded.py.
+    def extend(self, other):
+        offset = len(self.cpr)
+        for name in STRING_COLUMNS + NUMERIC_COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+        for key in list(self.other_fields) + [x for x in other.other_fields if x not in self.other_fields]:
+            values = self.other_fields.setdefault(key, [None] * offset)
+            values.extend(other.other_fields.get(key, [None] * len(other)))
+        for cpr, index in other.index_for_cpr.items():
+            self.index_for_cpr[cpr] = offset + index
+
+    def __len__(self):
+        return len(self.cpr)
+
+    def __iter__(self):
+        for index in range(len(self.cpr)):
+            yield PersonRow(self, index)
+
+    # Indexing gives row views, so the table can be used wherever a list of dicts was used before
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [PersonRow(self, i) for i in range(*index.indices(len(self.cpr)))]
+        if index < 0:
+            index += len(self.cpr)
+        if not 0 <= index < len(self.cpr):
+            raise IndexError('PeopleTable index out of range')
+
+        return PersonRow(self, index)
+
+    def row_for_cpr(self, cpr):
+        return self.cpr_index[cpr]
+
+    # Recalculates the age columns as of another date from the stored birth dates. The CPRs of the children are
+    # already decoded, so the firstborn is picked again for the new date without parsing anything.
+    def set_reference_date(self, reference_date):
+        self.reference_date = reference_date
+        self.age = age_column(self.birth_ordinal, reference_date)
+        # New columns are built, the current ones may be read-only views of a snapshot file
+        self.first_child_birth_ordinal = array('l', self.first_child_birth_ordinal)
+        self.first_child_gender = array('b', self.first_child_gender)
+        for index, children in enumerate(self.children):
+            if children is None:
+                continue
+            packed = decode_cpr(first_born(children.split(), reference_date))
+            self.first_child_birth_ordinal[index] = birth_ordinal(packed)
+            self.first_child_gender[index] = gender_bit(packed)
+
+        first_child_age = age_column(self.first_child_birth_ordinal, reference_date)
+        self.parent_age = array('h', (
+            MISSING if child_age == MISSING else age - child_age for age, child_age in zip(self.age, first_child_age)
+        ))
+
+    # BMI for every person as one column, computed straight from the typed height and weight columns
+    def bmi_column(self):
+        return array('d', (weight / ((height / 100) * (height / 100)) for height, weight in zip(self.height, self.weight)))
+
+
+def intern_or_none(value):
+    return None if value is None else sys.intern(value)
+
+
+def int_or_missing(value):
+    return MISSING if value is None else int(value)
+
+
+# CPR -> row view lookup for a PeopleTable. It reads the index the table maintains while rows are appended,
+# so it is never rebuilt and always matches the current rows.
+class CprIndex(Mapping):
+    __slots__ = ('table',)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, cpr):
+        return PersonRow(self.table, self.table.index_for_cpr[cpr])
+
+    def __contains__(self, cpr):
+        return cpr in self.table.index_for_cpr
+
+    def __iter__(self):
+        return iter(self.table.index_for_cpr)
+
+    def __len__(self):
+        return len(self.table.index_for_cpr)
+
+
+# Read-only view of one person in a PeopleTable that behaves like the dicts from iter_people
+class PersonRow(Mapping):
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+
+        return value
+
+    def get(self, key, default=None):
+        table, index = self.table, self.index
+        if key == 'CPR':
+            value = table.cpr[index]
+        elif key == 'First name':
+            value = table.first_name[index]
+        elif key == 'Last name':
+            value = table.last_name[index]
+        elif key == 'Height':
+            value = table.height[index]
+        elif key == 'Weight':
+            value = table.weight[index]
+        elif key == 'Eye color':
+            value = table.eye_color[index]
+        elif key == 'Blood type':
+            code = table.blood_type[index]
+            value = MISSING if code == MISSING else BLOOD_TYPES[code]
+        elif key == 'Children':
+            value = table.children[index]
+        elif key == 'Age':
+            value = table.age[index]
+        elif key == 'Gender':
+            code = table.gender[index]
+            value = MISSING if code == MISSING else GENDERS[code]
+        elif key == 'Parent age':
+            value = table.parent_age[index]
+        elif key == 'First child gender':
+            code = table.first_child_gender[index]
+            value = MISSING if code == MISSING else GENDERS[code]
+        elif key in table.other_fields:
+            value = table.other_fields[key][index]
+        else:
+            return default
+
+        if value is None or value == MISSING:
+            return default
+
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __iter__(self):
+        for key in FIELDS:
+            if key in self:
+                yield key
+        for key in self.table.other_fields:
+            if key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'PersonRow({!r})'.format(dict(self))
@@ -3,159 +3,315 @@
 # PROJECT 5: DATA ANALYSIS 
 # By: Nina Shenker-Tauris & Sofus Halkjær Wiisbye
 
-import datetime
-from datetime import date
+import argparse
+import os
+import sys
+from collections import namedtuple
+
+from aggregation import Aggregation, Fraction, Histogram
+from binning import Binning, label_pair_counts, pair_counts, rows_for_pairs
+from blood import ABO, RHESUS, inheritance_violations, is_possible_sign, is_possible_symbol
+from cache import DEFAULT_DIRECTORY, DatasetCache, ResultCache, materialize
+from cpr import REFERENCE_DATE, age_from_cpr, first_born, gender_bit_from_cpr
+from donors import can_donate, iter_donor_pairs
+from family_graph import FamilyGraph
+from instrumentation import DEFAULT_TRACE_FILE, TRACE_ENVIRONMENT_VARIABLE, Profiler, enabled_by_environment
+from kinship import kinship_counts
+from normality import NORMALITY_COLUMNS, Distribution, NormalityReport, gender_balance
+from paternity import PaternityEngine
+from people_table import FIELDS, GENDERS, PeopleTable, encode_blood_type
+from scheduler import POOLS, StageGraph
+from writers import WRITERS, Table, TextWriter, Value, to_percentage_str, writer_for
+
+
+# Records are read in large buffered chunks so huge registry extracts need few system calls
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+# Fields worked out by add_line_to_person, and the line they are worked out from
+DERIVED_FIELDS = {'Age': 'CPR', 'Gender': 'CPR', 'Parent age': 'Children', 'First child gender': 'Children'}
+
+# Fields known as soon as the CPR line is read
+CPR_FIELDS = {'CPR', 'Age', 'Gender'}
+
+
+# Streaming reader. Yields one dict per person so only the current record is held in memory.
+# fields limits the dicts to those fields and where to the people every predicate holds for, see
+# iter_projected_people_in_lines.
+def iter_people(file_name, reference_date=REFERENCE_DATE, fields=None, where=()):
+    try:
+        with open(file_name, 'r', buffering=READ_BUFFER_SIZE) as file:
+            if fields is None and not where:
+                yield from iter_people_in_lines(file, reference_date)
+            else:
+                yield from iter_projected_people_in_lines(file, reference_date, fields, where)
+
+    except IOError as error:
+        print('File not found, reason:', str(error))
 
 
-# Preparing our data structure. Creating a list of dicts for the data to be put into.
-def read_people_as_dict(file_name):
-    people = []
+# Yields the people in the lines of a people.db file, or of a piece of one that starts at a record
+def iter_people_in_lines(lines, reference_date=REFERENCE_DATE):
+    current_person = {}
+    for line in lines:
+        # Creating a dict for each individual person
+        if line.strip() == '':
+            # Secures we do not create dict initial space, between file header and first entry
+            if len(current_person) > 1:
+                yield current_person
+                # Reset of current_person
+                current_person = {}
+        # Skips header preceeded by #
+        elif line[0] == '#':
+            continue
+        else:
+            add_line_to_person(current_person, line, reference_date)
+
+    # The last record is not always followed by a blank line
+    if len(current_person) > 1:
+        yield current_person
+
+
+# Adds a single 'Key: value' line to the person being read, including the values derived from it
+def add_line_to_person(current_person, line, reference_date=REFERENCE_DATE):
+    # Get key and value from line
+    split_line = line.split(': ')
+    key = split_line[0]
+    value = split_line[-1].rstrip('\n')
+    current_person[key] = value
+    # CPR key contains information of both age and gender as 'ddmmyy - xxxX'. X will determine gender, Odd=make/Even=female
+    if key == 'CPR':
+        current_person["Age"] = get_age_from_cpr(value, reference_date)
+        current_person["Gender"] = get_gender_from_cpr(value)
+    elif key == 'Children':
+        # Extract first child age
+        first_child = first_born(value.split(), reference_date)
+        # Find the age when they had first child
+        current_person['Parent age'] = current_person['Age'] - get_age_from_cpr(first_child, reference_date)
+        # Extract first born chender
+        current_person["First child gender"] = get_gender_from_cpr(first_child)
+
+
+# iter_people_in_lines for only some of the fields, and only the people all the predicates of where hold for.
+# Lines of other fields are passed over without being split, and the derived fields are only worked out when they
+# are asked for. A predicate on the CPR, age or gender is tested as soon as the CPR line is read, and the rest of a
+# record it does not hold for is passed over too. The other predicates are tested at the end of the record.
+def iter_projected_people_in_lines(lines, reference_date=REFERENCE_DATE, fields=None, where=()):
+    wanted = set(FIELDS if fields is None else fields)
+    for predicate in where:
+        wanted.update(predicate.fields)
+    # The parent age is the age of the parent minus that of the first child
+    if 'Parent age' in wanted:
+        wanted.add('Age')
+    keys = {DERIVED_FIELDS.get(field, field) for field in wanted}
+    prefixes = tuple(key + ': ' for key in keys)
+    extra_fields = (wanted | keys) - set(fields) if fields is not None else set()
+    early = [predicate for predicate in where if set(predicate.fields) <= CPR_FIELDS]
+    late = [predicate for predicate in where if predicate not in early]
+
     current_person = {}
+    has_cpr = False
+    num_lines = 0
+    skipping = False
+    for line in lines:
+        if line.strip() == '':
+            # A record ends where the full reader would have yielded it
+            if has_cpr or num_lines > 1:
+                if not skipping and all(predicate(current_person) for predicate in late):
+                    yield project_person(current_person, extra_fields)
+                current_person = {}
+                has_cpr = False
+                num_lines = 0
+                skipping = False
+        elif skipping or line[0] == '#':
+            continue
+        else:
+            num_lines += 1
+            if not line.startswith(prefixes):
+                continue
+            split_line = line.split(': ')
+            key = split_line[0]
+            value = split_line[-1].rstrip('\n')
+            current_person[key] = value
+            if key == 'CPR':
+                has_cpr = True
+                if 'Age' in wanted:
+                    current_person["Age"] = get_age_from_cpr(value, reference_date)
+                if 'Gender' in wanted:
+                    current_person["Gender"] = get_gender_from_cpr(value)
+                skipping = not all(predicate(current_person) for predicate in early)
+            elif key == 'Children' and ('Parent age' in wanted or 'First child gender' in wanted):
+                first_child = first_born(value.split(), reference_date)
+                if 'Parent age' in wanted:
+                    current_person['Parent age'] = current_person['Age'] - get_age_from_cpr(first_child, reference_date)
+                if 'First child gender' in wanted:
+                    current_person["First child gender"] = get_gender_from_cpr(first_child)
 
-    # Read in the file once
-    try:
-        with open('people.db', 'r') as file:
-            line = True
-            while line:
-                line = file.readline()
-                # Creating a dict for each individual person
-                if line.strip() == '':
-                    # Secures we do not create dict initial space, between file header and first entry 
-                    if len(current_person) > 1:
-                        people.append(current_person)
-                    else:
-                        continue
-                    # Reset of current_person
-                    current_person = { }
-                # Skips header preceeded by #
-                elif line[0] == '#':
-                    continue
-                else:
-                    # Get key and value from line
-                    split_line = line.split(': ')
-                    key = split_line[0]
-                    value = split_line[-1].rstrip('\n')
-                    current_person[key] = value
-                    # CPR key contains information of both age and gender as 'ddmmyy - xxxX'. X will determine gender, Odd=make/Even=female
-                    if key == 'CPR':
-                         current_person["Age"] = get_age_from_cpr(value)
-                         current_person["Gender"] = get_gender_from_cpr(value)
-                    elif key == 'Children':
-                        # Extract first child age
-                        children_cprs = value.split()
-                        child_ages = [(get_age_from_cpr(x), x) for x in children_cprs]
-                        first_child = max(child_ages)
-                        # Find the age when they had first child
-                        current_person['Parent age'] = current_person['Age'] - first_child[0]
-                        # Extract first born chender
-                        current_person["First child gender"] = get_gender_from_cpr(first_child[1])
+    if (has_cpr or num_lines > 1) and not skipping and all(predicate(current_person) for predicate in late):
+        yield project_person(current_person, extra_fields)
 
-    except IOError as error:
-        print('File not found, reason:', str(error))
 
-    return people
+# Leaves out the fields that were only read for a predicate or a derived field
+def project_person(person, extra_fields):
+    if not extra_fields:
+        return person
+
+    return {key: value for key, value in person.items() if key not in extra_fields}
+
+
+# Row predicates for the reader. fields are the fields a predicate looks at. They are classes rather than lambdas so
+# they can be sent to the worker processes of parallel_ingest.py.
+class GenderIs:
+    fields = ('Gender',)
+
+    def __init__(self, gender):
+        self.gender = gender
+
+    def __call__(self, person):
+        return person['Gender'] == self.gender
+
+    def __repr__(self):
+        return 'gender=' + self.gender
+
+
+# Ages from low to high, both included
+class AgeBetween:
+    fields = ('Age',)
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def __call__(self, person):
+        return self.low <= person['Age'] <= self.high
+
+    def __repr__(self):
+        return 'age={}-{}'.format(self.low, self.high)
+
+
+class HasChildren:
+    fields = ('Children',)
+
+    def __call__(self, person):
+        return 'Children' in person
+
+    def __repr__(self):
+        return 'children'
+
+
+# 'gender=Male', 'age=20-40' or 'children', as given to --where
+def parse_predicate(text):
+    name, _, value = text.partition('=')
+    if name == 'gender' and value in GENDERS:
+        return GenderIs(value)
+    if name == 'age' and '-' in value:
+        low, high = value.split('-')
+        return AgeBetween(int(low), int(high))
+    if name == 'children' and value == '':
+        return HasChildren()
+
+    raise ValueError('Unknown predicate: ' + text + " (use gender=Male, gender=Female, age=LOW-HIGH or children)")
+
+
+# Preparing our data structure. Creating a list of dicts for the data to be put into.
+def read_people_as_dict(file_name, reference_date=REFERENCE_DATE, fields=None, where=()):
+    return list(iter_people(file_name, reference_date, fields, where))
+
+
+# Columnar version of the data structure. Rows of the table behave like the dicts above. A table needs the CPR.
+def read_people_as_table(file_name, reference_date=REFERENCE_DATE, fields=None, where=()):
+    if fields is not None:
+        fields = set(fields) | {'CPR'}
+
+    return PeopleTable.from_people(iter_people(file_name, reference_date, fields, where), reference_date)
+
+
+PEOPLE_COLUMNS = ['CPR', 'Age', 'Gender', 'First name', 'Last name', 'Height', 'Weight', 'Blood type', 'Children']
+
+
+# To get an overview of the data in a table format. Values a person does not have are None.
+def people_overview(people):
+    rows = (tuple(row.get(column) for column in PEOPLE_COLUMNS) for row in people)
+
+    return Table('People', PEOPLE_COLUMNS, rows, 'people')
 
 
-# To get an overview of the data in a table format
 def print_people_as_table(people):
-    # Create column headers and format spacing/dashed line
-    column_order = ['CPR', 'Age', 'Gender', 'First name', 'Last name', 'Height', 'Weight', 'Blood type', 'Children']
-    for value in column_order:
-        formatted = " {0:16}".format(value)
-        print(formatted, end="")
-    print()
-
-    print('-' * (len(column_order) + 1) * 15)
-    # Add values for each column header
-    for row in people:
-        col_values = [row[col] for col in column_order if col in row]
-        for value in col_values:
-            formatted = " {0:<16}".format(value)
-            print(formatted, end="")
-        print()
+    with TextWriter() as writer:
+        writer.write(people_overview(people))
+
+
+# Defining our age groups. An age equal to a limit belongs to the group below it.
+AGE_BINNING = Binning(('0-10', '11-20', '21-30', '31-40', '41-50', '51-60', '61-70', '71-80', '81-90', '91+'),
+                      (10, 20, 30, 40, 50, 60, 70, 80, 90), lambda table: table.age, right=True)
 
 
-# Defining our age groups
 def bucket_age(ages):
-    if ages <= 10:
-        return "0-10"
-    elif ages <= 20:
-        return "11-20"
-    elif ages <= 30:
-        return "21-30"
-    elif ages <= 40:
-        return "31-40"
-    elif ages <= 50:
-        return "41-50"
-    elif ages <= 60:
-        return "51-60"
-    elif ages <= 70:
-        return "61-70"
-    elif ages <= 80:
-        return "71-80"
-    elif ages <= 90:
-        return "81-90"
-    else:
-        return "91+"
-
-
-# With the date function we extract birthdate from CPR and calculate age in year 2000
-def get_age_from_cpr(cpr):
-    ddmmyy = cpr.split('-')[0]
-    pydate = date(
-        year=int(ddmmyy[-2:]) + 1900,
-        month=int(ddmmyy[2:4]),
-        day=int(ddmmyy[:2]),
-    )
-    d = datetime.date(2000, 1, 1)
-    
-    return (d - pydate).days // 365
+    return AGE_BINNING.label(ages)
+
+
+# Birthdate is extracted from CPR to calculate age in year 2000, or at another reference date.
+# The CPR is only parsed the first time it is seen, see cpr.py.
+def get_age_from_cpr(cpr, reference_date=REFERENCE_DATE):
+    return age_from_cpr(cpr, reference_date)
 
 
 # Gender is extracted from last number in CPR
 def get_gender_from_cpr(cpr):
-    # Calculates even number to determine if female
-    gender = int(cpr[-1]) % 2 == 0
-    
-    return "Female" if gender else "Male"
+    # Odd last digit is male
+    return GENDERS[gender_bit_from_cpr(cpr)]
+
+
+# The family graph is built once in main and shared by the analyses. Without one, it is built from people.
+def family_graph_for(people, family=None):
+    if family is None:
+        family = FamilyGraph.from_people(people)
+
+    return family
+
+
+# The parameters the answers depend on, which keep results in the cache apart
+def report_parameters(reference_date=REFERENCE_DATE):
+    return {'height_limits': HEIGHT_LIMITS, 'bmi_limits': BMI_LIMITS, 'reference_date': reference_date.isoformat()}
+
+
+# Checks that gather values from the columns of a table turn a list of dicts into one first
+def table_for(people):
+    if isinstance(people, PeopleTable):
+        return people
+
+    return PeopleTable.from_people(people)
 
 
 # Find parents for each child
-def parents_for_children(people):
-    parents_for_child = {}
-    for row in people:
-        # Checks for children CPR in dict of people
-        if 'Children' in row:
-            # Splits row if multiple children 
-            child_cprs = row['Children'].split()
-            for cpr in child_cprs:
-                if cpr not in parents_for_child:
-                    parents_for_child[cpr] = []
+def parents_for_children(people, family=None):
+    family = family_graph_for(people, family)
 
-                parents_for_child[cpr].append(row['CPR'])
-   
-    return parents_for_child
+    return {family.cpr(child): family.cprs_for(family.parents(child)) for child in family.nodes_with_parents()}
 
 
 # Calculates each age difference to take the average
-def average_age_difference_between_parents(people):
-    parents_for_child = parents_for_children(people)
+def average_age_difference_between_parents(people, family=None):
+    family = family_graph_for(people, family)
     # Calculate difference between parents
     parent_differences = []
     seen_parents = set()
-    for child, parents in parents_for_child.items():
+    for child in family.nodes_with_parents():
+        parents = family.parents(child)
         assert len(parents) == 2
         parent_key = (parents[0], parents[1])
         # Ensure we aren't calculting difference twice
         if parent_key in seen_parents:
             continue
 
-        parent_0_age = get_age_from_cpr(parents[0])
-        parent_1_age = get_age_from_cpr(parents[1])
+        parent_0_age = get_age_from_cpr(family.cpr(parents[0]))
+        parent_1_age = get_age_from_cpr(family.cpr(parents[1]))
         parent_differences.append(abs(parent_0_age - parent_1_age))
         seen_parents.add(parent_key)
 
-    print("{:.2f}".format(average(parent_differences)))
+    average_difference = average(parent_differences)
+
+    return Value('Average age difference between parents', average_difference, "{:.2f}".format(average_difference))
 
 
 def average(list_of_numbers):
@@ -163,130 +319,226 @@ def average(list_of_numbers):
 
 
 # Finding grandparents by cross referencing their childrens children
-def grandparents_for_children(people):
-    # Reuse already found parents
-    parents_for_child = parents_for_children(people)
+def grandparents_for_children(people, family=None):
+    family = family_graph_for(people, family)
     grandparents_for_child = {}
-    for child, parents in parents_for_child.items():
-        for parent in parents:
-            if parent in parents_for_child:
-                if child not in grandparents_for_child:
-                    grandparents_for_child[child] = []
-                #adding the parent's parents    
-                grandparents_for_child[child].extend(parents_for_child[parent])
+    for child in family.nodes_with_parents():
+        grandparents = family.grandparents(child)
+        if len(grandparents) > 0:
+            grandparents_for_child[family.cpr(child)] = family.cprs_for(grandparents)
 
     return grandparents_for_child
 
 
 # All grandparents in data set are alive, all children without grandparents listed will be considered to have dead grandparents
-def num_alive_grandparents(people):
+def alive_grandparents_percentage(people, family=None):
+    family = family_graph_for(people, family)
     # Get the number of children with grandparents and divide it by the total number of children
-    grandparents_for_child = grandparents_for_children(people)
-    parents_for_child = parents_for_children(people)
-    ratio = (len(grandparents_for_child) / len(parents_for_child)) * 100
-    
-    print("{:.2f}%".format(ratio))
-
-
-# Defines the sibling pairs
-def num_siblings_for_child(people):
-    parents_for_child = parents_for_children(people)
-    child_for_parents = {}
-    # Switching the keys and values to be {parent: [children]}
-    for child, parents in parents_for_child.items():
-        for parent in parents:
-            if parent not in child_for_parents:
-                child_for_parents[parent] = []
-            child_for_parents[parent].append(child)
-
-    num_siblings_for_child = {}
-    for parent, children in child_for_parents.items():
-        for child in children:
-            # Number of siblings that individual has (subtract 1 so it doesn't include themselves)
-            num_siblings_for_child[child] = len(children) - 1
-    
-    return num_siblings_for_child
-
-
-def average_number_of_cousins(people):
-    # Given as {child: [grandparents]}
-    grandparents_for_child = grandparents_for_children(people)
-    child_for_grandparents = {}
-    # Switching the keys and values to be {grandparent: [children]}
-    for child, grandparents in grandparents_for_child.items():
-        for grandparent in grandparents:
-            if grandparent not in child_for_grandparents:
-                child_for_grandparents[grandparent] = []
-            child_for_grandparents[grandparent].append(child)
-    
-    number_siblings = num_siblings_for_child(people)
-
-    num_cousins = []
-    # Cousins share grandparents but NOT parents (subtract out siblings)
-    for grandparent, children in child_for_grandparents.items():
-        for child in children:
-            # Must subtract by one so the person you are counting for doesn't include themselves
-            num_cousins_for_child = len(children) - number_siblings[child] - 1
-            num_cousins.append(num_cousins_for_child)
-    
-    print("{:.2f}".format(average(num_cousins)))
+    children = family.nodes_with_parents()
+    children_with_grandparents = [child for child in children if len(family.grandparents(child)) > 0]
+
+    return (len(children_with_grandparents) / len(children)) * 100
+
+
+def num_alive_grandparents(people, family=None):
+    percentage = alive_grandparents_percentage(people, family)
+
+    return Value('Percentage of people with a grandparent alive', percentage, "{:.2f}%".format(percentage))
+
+
+# Number of siblings (sharing at least one parent) for every child
+def num_siblings_for_child(people, family=None):
+    family = family_graph_for(people, family)
+    siblings = kinship_counts(family).siblings
+
+    return {family.cpr(child): siblings[child] for child in family.nodes_with_parents()}
+
+
+# Number of first cousins of everyone in the family graph, as an array indexed by node id.
+# Cousins share grandparents but NOT parents, and a cousin reached through several grandparents is counted once.
+# kinship may be given when the counts are already made, see kinship.py.
+def cousin_counts(people, family=None, kinship=None):
+    if kinship is None:
+        kinship = kinship_counts(family_graph_for(people, family))
+
+    return kinship.cousins
+
+
+def average_number_of_cousins(people, family=None, kinship=None):
+    # Only those who have cousins are counted
+    average_cousins = average([x for x in cousin_counts(people, family, kinship) if x > 0])
+
+    return Value('Average number of cousins', average_cousins, "{:.2f}".format(average_cousins))
+
+
+# Accumulator of the age at which people of the given gender first became parents
+def first_child_age_summary(gender):
+    return Distribution(lambda x: int(x["Parent age"]) if "Parent age" in x else None, where=lambda x: x["Gender"] == gender)
 
 
 # Based on previous calculations in dict of parents age of first child
+def first_child_age_stats(people, gender, parent_gender):
+    # From the people dict, extract the value "Parent age" defined above. Single pass, so people may be a stream.
+    summary = first_child_age_summary(gender)
+    for x in people:
+        summary.add(x)
+
+    return first_child_age_results(summary, parent_gender)
+
+
 def print_first_child_age_stats(people, gender, parent_gender):
-    # From the people dict, extract the value "Parent age" defined above
-    parent_ages = [int(x["Parent age"]) for x in people if x["Gender"] == gender and "Parent age" in x]
+    with TextWriter() as writer:
+        writer.write(first_child_age_stats(people, gender, parent_gender))
+
+
+def first_child_age_results(summary, parent_gender):
     columns = 'Age of first time' + ' ' + parent_gender
-    print_distribution_of_values(columns, parent_ages)
-    print('Maximum age of first-time', parent_gender, ': ', max(parent_ages))
-    print('Minimum age of first-time', parent_gender, ': ', min(parent_ages))
-    print('Average age of first-time', parent_gender, ': ', '{:.2f}'.format(average(parent_ages)))
+    results = [histogram_table(columns, summary.counts, summary.total)]
+    for name, value, text in (('Maximum', summary.max, summary.max),
+                              ('Minimum', summary.min, summary.min),
+                              ('Average', summary.mean(), '{:.2f}'.format(summary.mean()))):
+        name = name + ' age of first-time ' + parent_gender
+        results.append(Value(name, value, '{} :  {}'.format(name, text)))
+
+    return results
+
+
+# Accumulator of the share of people of the given gender without children
+def without_children_fraction(gender):
+    return Fraction(lambda x: "Children" not in x, where=lambda x: x["Gender"] == gender)
+
+
+# How many men and women do not have children, counted in a single pass so people may be a stream
+def percentage_without_children(people):
+    aggregation = Aggregation()
+    aggregation.add('Male', without_children_fraction("Male"))
+    aggregation.add('Female', without_children_fraction("Female"))
+    aggregation.run(people)
+
+    return without_children_results(aggregation['Male'], aggregation['Female'])
+
+
+def print_percentage_without_children(people):
+    with TextWriter() as writer:
+        writer.write(percentage_without_children(people))
+
+
+def without_children_results(men, women):
+    results = ['']
+    for name, fraction in (('Percentage of men without children', men), ('Percentage of women without children', women)):
+        percentage = fraction.ratio() * 100
+        results.append(Value(name, percentage, name + ' :  ' + "{:.2f}%".format(percentage)))
+
+    return results
+
+
+# Accumulators for all the distribution questions (age, gender, first-time parents, childless, firstborn)
+def distribution_aggregation():
+    aggregation = Aggregation()
+    aggregation.add('Age', Histogram(lambda x: bucket_age(x["Age"])))
+    aggregation.add('Age distribution', Distribution(lambda x: x["Age"]))
+    aggregation.add('Gender', Histogram(lambda x: x["Gender"]))
+    aggregation.add('fathers', first_child_age_summary("Male"))
+    aggregation.add('mothers', first_child_age_summary("Female"))
+    aggregation.add('men without children', without_children_fraction("Male"))
+    aggregation.add('women without children', without_children_fraction("Female"))
+    aggregation.add('Gender of firstborn', Histogram(lambda x: x.get("First child gender")))
+
+    return aggregation
+
+
+# All the distribution questions counted in one pass. people may be a list, a PeopleTable or a stream from iter_people.
+def distribution_questions(people):
+    return distribution_aggregation().run(people)
+
+
+def distribution_results(people):
+    aggregation = distribution_questions(people)
+
+    return (age_and_gender_results(aggregation) + first_time_fathers_results(aggregation)
+            + first_time_mothers_results(aggregation) + childless_results(aggregation)
+            + firstborn_results(aggregation))
+
+
+# The results of each question from the counted aggregation, so the questions can be asked for one at a time
+def age_and_gender_results(aggregation):
+    results = [histogram_table('Age', aggregation['Age'].counts, aggregation['Age'].total)]
+    results.extend(normality_results('age', aggregation['Age distribution']))
+    results.append(histogram_table('Gender', aggregation['Gender'].counts, aggregation['Gender'].total))
+    results.append('Is the gender distribution balanced?')
+    results.append(Table('Gender balance', NORMALITY_COLUMNS, gender_balance(aggregation['Gender'].counts), 'list'))
+
+    return results
+
+
+def first_time_fathers_results(aggregation):
+    return (first_child_age_results(aggregation['fathers'], "fathers")
+            + normality_results('age of first-time fathers', aggregation['fathers']))
+
+
+def first_time_mothers_results(aggregation):
+    return (first_child_age_results(aggregation['mothers'], "mothers")
+            + normality_results('age of first-time mothers', aggregation['mothers']))
+
+
+def childless_results(aggregation):
+    return without_children_results(aggregation['men without children'], aggregation['women without children'])
+
+
+def firstborn_results(aggregation):
+    histogram = aggregation['Gender of firstborn']
+
+    return [histogram_table('Gender of firstborn', histogram.counts, histogram.total)]
+
+
+# Moments, normality tests and bootstrap confidence intervals of the counted values, see normality.py
+def normality_results(name, distribution):
+    return [
+        'Is the ' + name + ' distribution normal?',
+        Table('Normality of ' + name, NORMALITY_COLUMNS, NormalityReport(distribution.counts).rows(), 'list'),
+    ]
+
+
+def print_distribution_questions(people):
+    with TextWriter() as writer:
+        writer.write(distribution_results(people))
 
 
 # Finding children's parents and pairing them
-def partners_for_person(people):
-    parents_for_child = parents_for_children(people)
-    partners_for_parent = {}
-    # Finding childrens CPR, split if more than one
-    for row in people:
-        if 'Children' in row:
-            baby_momma_or_daddy = []
-            child_cprs = row['Children'].split()
-            # Adding parents to all children
-            for cpr in child_cprs:
-                child_parents = parents_for_child[cpr]
-                for child_parent_cpr in child_parents:
-                    if child_parent_cpr != row["CPR"]:
-                        baby_momma_or_daddy.append(child_parent_cpr)
-            partners_for_parent[row["CPR"]] = list(set(baby_momma_or_daddy))
-    
-    return partners_for_parent
+def partners_for_person(people, family=None):
+    family = family_graph_for(people, family)
+
+    return {family.cpr(parent): family.cprs_for(family.partners(parent)) for parent in family.nodes_with_children()}
+
+
+# Asking if there are any parents with multiple partners. More than one couple means multiple partners.
+def multiple_partners_count(people, family=None):
+    family = family_graph_for(people, family)
 
+    return family.couples().num_with_multiple_partners()
 
-# Asking if there are any parents with multiple partners 
-def num_multiple_partners(people):
-    partners_for_parent = partners_for_person(people)
 
-    total_multiple_partners = 0
-    for partners in partners_for_parent.values():
-        # More than one means multiple partners
-        total_multiple_partners += int((len(partners) > 1))
+def num_multiple_partners(people, family=None):
+    count = multiple_partners_count(people, family)
 
-    print("{:.1f}%".format(total_multiple_partners))
+    return Value('Number of men/women with children with more than one woman/man', count, "{:.1f}%".format(count))
+
+
+# Heights (cm) below the first limit are short, and from the second limit tall
+HEIGHT_LIMITS = (165, 185)
+HEIGHT_BINNING = Binning(("short", "normal", "tall"), HEIGHT_LIMITS, lambda table: table.height)
 
 
 def category_for_height(height):
-    height = int(height)
-    if height < 165:
-        return "short"
-    elif height < 185:
-        return "normal"
-    else:
-        return "tall"
+    return HEIGHT_BINNING.label(int(height))
 
 
-# Defining the rows of CPR from people dict for later use 
+# Defining the rows of CPR from people dict for later use
 def get_row_by_cpr(people):
+    # A PeopleTable keeps its CPR index up to date itself, so it is shared instead of rebuilt on every call
+    if isinstance(people, PeopleTable):
+        return people.cpr_index
+
     row_for_cpr = {}
     for row in people:
         row_for_cpr[row["CPR"]] = row
@@ -294,45 +546,58 @@ def get_row_by_cpr(people):
     return row_for_cpr
 
 
-# Creating a tuple of partners by CPR
-def get_couple_pairs(people):
-    partners_for_parent = partners_for_person(people)
-    partner_pairs = set()
-    for person_cpr, partners in partners_for_parent.items():
-        for x in partners:
-            partner_pairs.add(tuple([person_cpr, x]))
+# Creating a tuple of partners by CPR, once for every couple
+def get_couple_pairs(people, family=None):
+    family = family_graph_for(people, family)
 
-    return partner_pairs
+    return [(family.cpr(first), family.cpr(second)) for first, second in family.couples()]
 
 
-def height_of_couples(people):
-    partner_pairs = get_couple_pairs(people)
-    # Lambda allows us to sort according to the established categories for height
-    percentage_of_pairs(people, partner_pairs, lambda x: category_for_height(x['Height']))
+def height_of_couples(people, family=None):
+    # The heights of all people are put in their categories at once, see binning.py
+    return percentage_of_couples(people, family, HEIGHT_BINNING, 'Height of couples')
 
 
-# Formats the values to percentages
-def to_percentage_str(x):
-    return str(round(x * 100, 2)) + "%"
+# Shares of the couples for every pair of categories, each couple counted once. A node id is the row of the person.
+def percentage_of_couples(people, family, binning, name):
+    table = table_for(people)
+    family = family_graph_for(table, family)
+    counts = family.couples().contingency(binning.bin_table(table))
 
+    return pair_percentages(label_pair_counts(binning.labels, counts), name)
 
-# Print function for formatting of proper output
+
+# Print function for formatting of proper output. Values are only iterated once, so they may be a generator.
 def print_distribution_of_values(category, values):
-    total = len(values)
+    total = 0
     counts = {}
     for x in values:
         if x not in counts:
             counts[x] = 0
 
         counts[x] += 1
+        total += 1
 
-    histogram = {k: to_percentage_str(v / total) for k, v in counts.items()}
-    columns = [category, 'Percentage'] 
-    print_table(histogram, columns)
+    print_histogram(category, counts, total)
 
 
-# Function used for pairing of categories in percentage
-def percentage_of_pairs(people, cpr_pairs, row_to_cat_funct):
+# Already counted values as shares of the total, sorted by value
+def histogram_table(category, counts, total):
+    return Table(category, [category, 'Percentage'], [(k, v / total) for k, v in sorted(counts.items())], 'percentages')
+
+
+def print_histogram(category, counts, total):
+    with TextWriter() as writer:
+        writer.write(histogram_table(category, counts, total))
+
+
+# Counts the pairs of each (sorted) pair of categories. The categories are given by a Binning of a column, or by a
+# function of a row.
+def category_pair_counts(people, cpr_pairs, row_to_cat_funct):
+    if isinstance(row_to_cat_funct, Binning):
+        table = table_for(people)
+        return pair_counts(row_to_cat_funct, table, rows_for_pairs(table, cpr_pairs))
+
     row_for_cpr = get_row_by_cpr(people)
     #l is left tuple value, r is right tuple value
     cat_for_partner_pair = [(row_to_cat_funct(row_for_cpr[l]), row_to_cat_funct(row_for_cpr[r])) for l, r in cpr_pairs]
@@ -346,16 +611,34 @@ def percentage_of_pairs(people, cpr_pairs, row_to_cat_funct):
 
         cat_count[cat_key] += 1
 
+    return cat_count
+
+
+# Function used for pairing of categories in percentage
+def percentage_of_pairs(people, cpr_pairs, row_to_cat_funct, name="Groups"):
+    return pair_percentages(category_pair_counts(people, cpr_pairs, row_to_cat_funct), name)
+
+
+def pair_percentages(cat_count, name="Groups"):
     total = sum(list(cat_count.values()))
-    cat_percentage = {'/'.join(list(k)): to_percentage_str(v / total) for k, v in cat_count.items()}
+    cat_share = sorted(('/'.join(list(k)), v / total) for k, v in cat_count.items())
     header = ["Groups", "Percentage"]
-    print_table(cat_percentage, header)
+
+    return Table(name, header, cat_share, 'percentages')
 
 
 # Percentage of tall children based on parent pairings
-def height_of_children_parents(people):
-    parent_to_child_pairs = get_parent_to_child_pairs(people)
-    percentage_of_pairs(people, parent_to_child_pairs, lambda x: category_for_height(x['Height']))
+def height_of_children_parents(people, family=None):
+    return percentage_of_pairs(people, parent_child_pairs(people, family), HEIGHT_BINNING,
+                               'Height of parents and children')
+
+
+def parent_child_pairs(people, family=None):
+    family = family_graph_for(people, family)
+
+    return [
+        (family.cpr(parent), family.cpr(child)) for parent in family.nodes_with_children() for child in family.children(parent)
+    ]
 
 
 # The BMI formula is kilograms / meter^2
@@ -373,145 +656,100 @@ def bmi_from_row(row):
 
 
 # Catergories of BMI are taken from the official BMI standard 
+BMI_LIMITS = (18.5, 25)
+BMI_BINNING = Binning(("slim", "normal", "fat"), BMI_LIMITS, PeopleTable.bmi_column)
+
+
 def category_for_bmi(bmi):
-    if bmi < 18.5:
-        return "slim"
-    elif bmi < 25:
-        return "normal"
-    else:
-        return "fat"
+    return BMI_BINNING.label(bmi)
 
 
 # Comparing partners in relation to their BMI 
-def bmi_of_couples(people):
-    partner_pairs = get_couple_pairs(people)
-    percentage_of_pairs(people, partner_pairs, lambda x: category_for_bmi(bmi_from_row(x)))
+def bmi_of_couples(people, family=None):
+    return percentage_of_couples(people, family, BMI_BINNING, 'BMI of couples')
 
 
 # Defining the Rhesus system in relation to blood inheritance
 def is_possible_blood_sign_combo(parent1, parent2, child):
-    # Parent1, parent2, child
-    possible_sign_combos = {
-        ('+', '+', '+'),
-        ('+', '+', '-'),
-        ('+', '-', '+'),
-        ('+', '-', '-'),
-        ('-', '-', '-'),
-    }
-
-    parent1_sign, parent2_sign, child_sign = parent1[-1], parent2[-1], child[-1]
-    potential_sign_combo_1 = (parent1_sign, parent2_sign, child_sign) in possible_sign_combos
-    potential_sign_combo_2 = (parent2_sign, parent1_sign, child_sign) in possible_sign_combos
-    return potential_sign_combo_1 or potential_sign_combo_2
+    # The possible (parent1, parent2, child) combinations are in blood.py, made once instead of on every call
+    return is_possible_sign(parent1, parent2, child)
 
 
 # Defining the ABO blood inheritance system
 def is_possible_blood_symbol_combo(parent1, parent2, child):
-    possible_combos = {
-        # Parent1, parent2, child
-        ("A", "A", "A"),
-        ("A", "A", "O"),
+    # Checking both p1/p2 and p2/p1 combos for inheritance
+    return is_possible_symbol(parent1, parent2, child)
 
-        ("A", "B", "A"),
-        ("A", "B", "B"),
-        ("A", "B", "AB"),
-        ("A", "B", "O"),
 
-        ("A", "AB", "A"),
-        ("A", "AB", "B"),
-        ("A", "AB", "AB"),
+def name_for_row(row):
+    return row["First name"] + ' ' + row["Last name"]
 
-        ("A", "O", "A"),
-        ("A", "O", "O"),
 
-        ("B", "B", "B"),
-        ("B", "B", "O"),
+# Reasons printed for the blood systems that make a child impossible
+REASON_FOR_SYSTEMS = {
+    ABO | RHESUS: "Not possible blood sign combination and not possible blood symbol combination",
+    RHESUS: "Not possible blood sign combination",
+    ABO: "Not possible blood symbol combination",
+}
 
-        ("B", "AB", "A"),
-        ("B", "AB", "B"),
-        ("B", "AB", "AB"),
 
-        ("B", "O", "B"),
-        ("B", "O", "O"),
+# Checking for potential non-biological parents by examining blood inheritance, see blood.py
+def children_that_have_fake_parents(people, family=None):
+    family = family_graph_for(people, family)
+    table = table_for(people)
+    violations = inheritance_violations(table, family)
 
-        ("AB", "AB", "A"),
-        ("AB", "AB", "B"),
-        ("AB", "AB", "AB"),
+    # Failing systems for each child, in the order the children were checked
+    failing_systems = {}
+    for violation in violations:
+        failing_systems[violation.child] = failing_systems.get(violation.child, 0) | violation.system
+    fake_children = [(table[child], REASON_FOR_SYSTEMS[systems]) for child, systems in failing_systems.items()]
 
-        ("AB", "O", "A"),
-        ("AB", "O", "B"),
-        ("O", "O", "O"),
-    }
-    
-    parent1, parent2, child = parent1[:-1], parent2[:-1], child[:-1]
-    # Checking both p1/p2 and p2/p1 combos for inheritance
-    potential_combo_1 = (parent1, parent2, child) in possible_combos
-    potential_combo_2 = (parent2, parent1, child) in possible_combos
-    
-    return potential_combo_1 or potential_combo_2
+    # The table of children with non-biological parents
+    count = Value('Number of children with at least one non-biological parent', len(fake_children),
+                  'Number of children total with at least one non-biological parent:  {} / {}'.format(
+                      len(fake_children), len(people)))
+    fake_children_names = {name_for_row(x[0]): x[1] for x in fake_children}
+    header = ["Name of child", "Reason for at least one non-biological parent"]
 
+    return [count, Table('Children with non-biological parents', header, sorted(fake_children_names.items()), width=120)]
 
-def name_for_row(row):
-    return row["First name"] + ' ' + row["Last name"]
 
+# Likelihood of every child-parent link worked out from the genotypes the blood types allow, taking the blood
+# types of all ancestors into account. Returns a ParentLink for each link, see paternity.py.
+def paternity_links(people, family=None):
+    family = family_graph_for(people, family)
 
-# Checking for potential non-biological parents by examining blood inheritance
-def children_that_have_fake_parents(people):
-    parents_for_child = parents_for_children(people)
-    row_for_cpr = get_row_by_cpr(people)
+    return PaternityEngine(table_for(people), family).all_links()
 
-    fake_children = []
-    for cpr, parents in parents_for_child.items():
-        row = row_for_cpr[cpr]
-        # Getting blood types from both children and parents
-        child_blood_type = row["Blood type"]
-        parents_blood_type = [row_for_cpr[x]["Blood type"] for x in parents]
-        # Checking if Rhesus inheritance is possible
-        is_possible_blood_sign = is_possible_blood_sign_combo(
-            parents_blood_type[0],
-            parents_blood_type[1],
-            child_blood_type
-        )
-        # Checking if ABO type inheritance is possible
-        is_possible_blood_symbol = is_possible_blood_symbol_combo(
-            parents_blood_type[0],
-            parents_blood_type[1],
-            child_blood_type
-        )
-
-        if is_possible_blood_sign and is_possible_blood_symbol:
-            continue
-        if not is_possible_blood_symbol and not is_possible_blood_sign:
-            reason = "Not possible blood sign combination and not possible blood symbol combination"
-        elif not is_possible_blood_sign:
-            reason = "Not possible blood sign combination"
-        elif not is_possible_blood_symbol:
-            reason = "Not possible blood symbol combination"
 
-        fake_children.append((row, reason))
+# The child-parent links that are least likely to be biological
+def least_likely_parents(people, family=None, limit=20):
+    links = sorted(paternity_links(people, family), key=lambda x: (x.probability, x.likelihood))
+    table = table_for(people)
+    family = family_graph_for(people, family)
 
-    # Printing the table of children with non-biological parents
-    print('Number of children total with at least one non-biological parent: ', len(fake_children), '/', len(people))
-    fake_children_names = {name_for_row(x[0]): x[1] for x in fake_children}
-    header = ["Name of child", "Reason for at least one non-biological parent"]
-    print_table(fake_children_names, header, length=120)
+    impossible = [x for x in links if x.likelihood == 0.0]
+    count = Value('Number of child-parent links that are impossible from genotypes', len(impossible),
+                  'Number of child-parent links that are impossible from genotypes:  {} / {}'.format(
+                      len(impossible), len(links)))
+    rows = [
+        (name_for_row(table[x.child]) if family.has_row(x.child) else family.cpr(x.child),
+         name_for_row(table[x.parent]),
+         '{:.3f}'.format(x.likelihood_ratio),
+         to_percentage_str(x.probability))
+        for x in links[:limit]
+    ]
+    header = ['Child', 'Parent', 'Paternity index', 'Probability of parent']
+
+    return [count, '', Table('Least likely parents', header, rows, 'list')]
 
 
 # A donor / recipient table
 def can_donate_to_blood_type(donor, recipient):
-    # Donor: [recipient]
-    donation_mapping = {
-        'A+': ['A+', 'AB+'],
-        'A-': ['A-', 'A+', 'AB-', 'AB+'],
-        'B+': ['B+', 'AB+'],
-        'B-': ['B-', 'B+', 'AB-', 'AB+'],
-        'O+': ['A+', 'B+', 'AB+'],
-        'AB+': ['AB+'],
-        'AB-': ['AB-', 'AB+']
-    }
-    
+    # One bitmask of possible recipients per donor blood type, see donors.py.
     # O- is the universal donor meaning that it can donate to all other bloodtypes
-    return donor == 'O-' or recipient in donation_mapping[donor]
+    return can_donate(encode_blood_type(donor), encode_blood_type(recipient))
 
 
 # Finding all possible donor/recipient pairs by name for later use 
@@ -522,8 +760,22 @@ def pairs_that_can_donate_and_receive(people_pairs, people):
         for donor, recipient in people_pairs
         if can_donate_to_blood_type(row_for_cpr[donor]["Blood type"], row_for_cpr[recipient]["Blood type"])
     ]
-    header = ['Donor', 'Recipient', "Donor's blood type", "Recipient's blood type"]
-    print_blood(pairs_that_can_donate, header)
+
+    return Table('Donors', DONOR_COLUMNS, pairs_that_can_donate, 'list')
+
+
+DONOR_COLUMNS = ['Donor', 'Recipient', "Donor's blood type", "Recipient's blood type"]
+
+
+# Same table for (donor, recipient) pairs of node ids that are already known to be compatible. The rows are made
+# while the table is written, so pairs may be a generator.
+def donor_pairs_table(name, table, pairs):
+    rows = (
+        (name_for_row(table[donor]), name_for_row(table[recipient]), table[donor]["Blood type"], table[recipient]["Blood type"])
+        for donor, recipient in pairs
+    )
+
+    return Table(name, DONOR_COLUMNS, rows, 'list')
 
 
 # For use in donor/recepient relation between father/son
@@ -538,139 +790,360 @@ def get_parent_to_child_pairs(people):
     return parent_to_child_pairs
 
 
-# Finding which sons can receive blood from their father 
-def fathers_that_can_donate_to_sons(people):
-    males = [x for x in people if x["Gender"] == "Male"]
-    fathers_to_child_pairs = get_parent_to_child_pairs(males)
-    fathers_to_son_pairs = [
-        (father, child) for father, child in fathers_to_child_pairs if get_row_by_cpr(people)[child]["Gender"] == 'Male'
-    ]
-    pairs_that_can_donate_and_receive(fathers_to_son_pairs, people)
+# Finding which sons can receive blood from their father
+def fathers_that_can_donate_to_sons(people, family=None):
+    family = family_graph_for(people, family)
+    table = table_for(people)
+    male = GENDERS.index("Male")
+    fathers = [x for x in range(len(table)) if table.gender[x] == male]
+    # Compatible father -> child pairs from the graph, of which only the sons are kept
+    fathers_to_son_pairs = (
+        (father, child) for father, child in iter_donor_pairs(table, family, 'child', fathers) if table.gender[child] == male
+    )
 
+    return donor_pairs_table('Fathers that can donate to sons', table, fathers_to_son_pairs)
 
-# Finding which children can donate to their grandparents
-def child_that_can_donate_to_grandparents(people):
-    grandparents_for_child = grandparents_for_children(people)
 
-    child_grandparent_pairs = []
-    for child, grandparents in grandparents_for_child.items():
-        for grandparent in grandparents:
-            child_grandparent_pairs.append((child, grandparent))
+# Finding which children can donate to their grandparents
+def child_that_can_donate_to_grandparents(people, family=None):
+    family = family_graph_for(people, family)
+    table = table_for(people)
+    child_grandparent_pairs = iter_donor_pairs(table, family, 'grandparent', family.nodes_with_parents())
 
-    pairs_that_can_donate_and_receive(child_grandparent_pairs, people)
+    return donor_pairs_table('Grandchildren that can donate to grandparents', table, child_grandparent_pairs)
 
 
 # Formatting used for printing tables nicely
 def print_table(dict_of_values, columns, length=45):
-    print()
-    print("{:<30} {:<30}".format(columns[0], columns[1]))
-    print('-' * length)
-    print("\n".join("{:<30} {:<30}".format(k, v) for k, v in sorted(dict_of_values.items())))
-    print()
+    with TextWriter() as writer:
+        writer.write(Table(columns[0], columns, sorted(dict_of_values.items()), 'table', length))
 
 
 # Formatting for donor related tables 
 def print_blood(list_of_lists, columns):
-    # Print columns
-    for column_name in columns:
-        print("{:<30}".format(column_name), end='')
-    print()
-    print('-' * 120)
-    for x in list_of_lists:
-        print("{:30} {:30} {:30} {:30}".format(x[0], x[1], x[2], x[3]))
-    print()
+    with TextWriter() as writer:
+        writer.write(Table(columns[0], columns, list_of_lists, 'list'))
 
 
 # Main program
-def main():
-    people = read_people_as_dict('people.db')
-    
-    #To preserve space we only print first 10 entries in the people.db file 
-    print_people_as_table(people[:10])
-
-    # Is the age and gender distribution "normal" in the database? A yes/no answer is not good enough.
-    print_distribution_of_values('Age', [bucket_age(x["Age"]) for x in people])
-    print_distribution_of_values('Gender', [x["Gender"] for x in people])
-
-    # At what age do the men become fathers first time (max age, min age, average age)?
-    # Is the distribution of first-time fatherhood age "normal"? A yes/no answer is not good enough.
-    print_first_child_age_stats(people, gender="Male", parent_gender = "fathers")
-
-    # At what age does the women become mothers first time (max age, min age, average age)?
-    # Is the distribution of first-time motherhood age "normal"? A yes/no answer is not good enough.
-    print_first_child_age_stats(people, gender="Female", parent_gender = "mothers")
-
-    # How many men and women do not have children (in percent)?
-    male_rows = [x for x in people if x["Gender"] == "Male"]
-    female_rows = [x for x in people if x["Gender"] == "Female"]
-    male_rows_without_children = [x for x in male_rows if "Children" not in x]
-    female_rows_without_children = [x for x in female_rows if "Children" not in x]
-    format_men_len = "{:.2f}%".format((len(male_rows_without_children) / len(male_rows) * 100))
-    print()
-    print('Percentage of men without children : ', format_men_len)
-    format_women_len =  "{:.2f}%".format((len(female_rows_without_children) / len(female_rows) * 100))
-    print('Percentage of women without children : ', format_women_len)
-
-    # Is the firstborn likely to be male or female?
-    print_distribution_of_values('Gender of firstborn', [x["First child gender"] for x in people if "First child gender" in x])
-
-    # What is the average age difference between the parents (with a child in common obviously)?
-    print('Average age difference between parents:')
-    average_age_difference_between_parents(people)
-
-    # How many people in percent has at least one grandparent that is still alive? A person is living if he/she is in the database.
-    print()
-    print('Percentage of people who have at least one grandparent still alive:')
-    num_alive_grandparents(people)
-
-
-    # For those who have cousins, what is the average number of cousins?
-    print()
-    print('Average number of cousins per individual (if they have cousins):')
-    average_number_of_cousins(people)
-
-    # How many men/women (percentage) have children with more than one woman/man?
-    print()
-    print('Percentage of men/women who have children with more than one woman/man:')
-    num_multiple_partners(people)
-
-    # Do tall people marry (or at least get children together)? To answer that, calculate
-    # the percentages of tall/tall, tall/normal, tall/short, normal/normal, normal/short,
-    # and short/short couples. Decide your own limits for tall, normal and short, and if
-    # they are the same for men and women.
-    print()
-    print('The percentages of couples in respect to height difference:')
-    height_of_couples(people)
-
-    # Do tall parents get tall children?
-    print('Percentage of couples who get tall children: ')
-    height_of_children_parents(people)
-
-    # Do fat people marry (or at least get children together)? To answer that,
-    # calculate the percentages of fat/fat, fat/normal, fat/slim, normal/normal,
-    # normal/slim, and slim/slim couples. Decide your own limits for fat, normal and
-    # slim. Calculate the BMI, and let that be the fatness indicator.
-    print('The percentages of couples in respect to BMI difference:')
-    bmi_of_couples(people)
-
-    # Using the knowledge of blood group type inheritance, are there any children in
-    # the database where you can safely say that at least one of the parents are not
-    # the real parent. If such children exists, make a list of them. In the report you
-    # must discuss how you determine that the parent(s) of the child are not the "true"
-    # parents.
-    children_that_have_fake_parents(people)
-
-    # Make a list of fathers who can donate blood to their sons. The list must identify
-    # must the father and the son(s) and their blood type. You must write the length of
-    # the list in the report.
-    print('Fathers that can donate blood to their sons: ')
-    fathers_that_can_donate_to_sons(people)
-
-    # Make a list of persons who can donate blood to their grandparents. The list must
-    # identify must the person, the grandparent(s) and their blood type. You must write
-    # the length of the list in the report.
-    print('People that can donate blood to their grandparent: ')
-    child_that_can_donate_to_grandparents(people)
+# A stage of the report: the numbered questions of the README it answers (0 is the overview of the first people),
+# the headings written before its results and the function giving the results from the nodes it depends on.
+# after lists the shared indexes the function looks up in the family graph, see scheduler.py. records tells what
+# the stage goes through: 'people', 'edges' (child-parent links) or None.
+ReportStage = namedtuple('ReportStage', ['name', 'questions', 'headings', 'function', 'dependencies', 'after', 'local',
+                                         'records'])
+
+# Most questions are functions of (people, family)
+PEOPLE_AND_FAMILY = ('people', 'family')
+
+
+def first_people_overview(people):
+    # To preserve space we only print first 10 entries in the people.db file
+    return people_overview(people[:10])
+
+
+# The stages in the order they are written. The paternity likelihoods are only worked out when asked for.
+# With sqlite the family and donor questions the SQLite database can answer take it instead of the people.
+def report_stages(paternity=False, sqlite=False):
+    stages = [
+        ReportStage('people overview', (0,), (), first_people_overview, ('people',), (), False, 'people'),
+
+        # Is the age and gender distribution "normal" in the database? A yes/no answer is not good enough.
+        # At what age do the men become fathers first time (max age, min age, average age)?
+        # Is the distribution of first-time fatherhood age "normal"? A yes/no answer is not good enough.
+        # At what age does the women become mothers first time (max age, min age, average age)?
+        # Is the distribution of first-time motherhood age "normal"? A yes/no answer is not good enough.
+        # How many men and women do not have children (in percent)?
+        # Is the firstborn likely to be male or female?
+        # All of these are counted in the same pass over the people, the distribution node
+        ReportStage('age and gender', (1,), (), age_and_gender_results, ('distribution',), (), True, None),
+        ReportStage('first-time fathers', (2, 3), (), first_time_fathers_results, ('distribution',), (), True, None),
+        ReportStage('first-time mothers', (4, 5), (), first_time_mothers_results, ('distribution',), (), True, None),
+        ReportStage('without children', (6,), (), childless_results, ('distribution',), (), True, None),
+        ReportStage('gender of firstborn', (10,), (), firstborn_results, ('distribution',), (), True, None),
+
+        # What is the average age difference between the parents (with a child in common obviously)?
+        ReportStage('age difference between parents', (7,), ('Average age difference between parents:',),
+                    average_age_difference_between_parents, PEOPLE_AND_FAMILY, (), False, 'edges'),
+
+        # How many people in percent has at least one grandparent that is still alive? A person is living if he/she is in the database.
+        ReportStage('alive grandparents', (8,),
+                    ('', 'Percentage of people who have at least one grandparent still alive:'),
+                    num_alive_grandparents, PEOPLE_AND_FAMILY, ('grandparents',), False, 'edges'),
+
+        # For those who have cousins, what is the average number of cousins?
+        ReportStage('cousins', (9,), ('', 'Average number of cousins per individual (if they have cousins):'),
+                    average_number_of_cousins, PEOPLE_AND_FAMILY + ('kinship',), (), False, 'edges'),
+
+        # How many men/women (percentage) have children with more than one woman/man?
+        ReportStage('multiple partners', (11,),
+                    ('', 'Percentage of men/women who have children with more than one woman/man:'),
+                    num_multiple_partners, PEOPLE_AND_FAMILY, ('couples',), False, 'edges'),
+
+        # Do tall people marry (or at least get children together)? To answer that, calculate
+        # the percentages of tall/tall, tall/normal, tall/short, normal/normal, normal/short,
+        # and short/short couples. Decide your own limits for tall, normal and short, and if
+        # they are the same for men and women.
+        ReportStage('height of couples', (12,), ('', 'The percentages of couples in respect to height difference:'),
+                    height_of_couples, PEOPLE_AND_FAMILY, ('couples',), False, 'edges'),
+
+        # Do tall parents get tall children?
+        ReportStage('height of children and parents', (13,), ('Percentage of couples who get tall children: ',),
+                    height_of_children_parents, PEOPLE_AND_FAMILY, (), False, 'edges'),
+
+        # Do fat people marry (or at least get children together)? To answer that,
+        # calculate the percentages of fat/fat, fat/normal, fat/slim, normal/normal,
+        # normal/slim, and slim/slim couples. Decide your own limits for fat, normal and
+        # slim. Calculate the BMI, and let that be the fatness indicator.
+        ReportStage('BMI of couples', (14,), ('The percentages of couples in respect to BMI difference:',),
+                    bmi_of_couples, PEOPLE_AND_FAMILY, ('couples',), False, 'edges'),
+
+        # Using the knowledge of blood group type inheritance, are there any children in
+        # the database where you can safely say that at least one of the parents are not
+        # the real parent. If such children exists, make a list of them. In the report you
+        # must discuss how you determine that the parent(s) of the child are not the "true"
+        # parents.
+        ReportStage('fake parents', (15,), (), children_that_have_fake_parents, PEOPLE_AND_FAMILY, (), False, 'edges'),
+    ]
+
+    # The same question answered with likelihoods for every child-parent link instead of yes/no
+    if paternity:
+        stages.append(ReportStage('paternity likelihoods', (15,), ('Child-parent links least likely to be biological: ',),
+                                  least_likely_parents, PEOPLE_AND_FAMILY, (), False, 'edges'))
+
+    stages += [
+        # Make a list of fathers who can donate blood to their sons. The list must identify
+        # must the father and the son(s) and their blood type. You must write the length of
+        # the list in the report.
+        ReportStage('father to son donors', (16,), ('Fathers that can donate blood to their sons: ',),
+                    fathers_that_can_donate_to_sons, PEOPLE_AND_FAMILY, (), False, 'edges'),
+
+        # Make a list of persons who can donate blood to their grandparents. The list must
+        # identify must the person, the grandparent(s) and their blood type. You must write
+        # the length of the list in the report.
+        ReportStage('grandchild to grandparent donors', (17,), ('People that can donate blood to their grandparent: ',),
+                    child_that_can_donate_to_grandparents, PEOPLE_AND_FAMILY, ('grandparents',), False, 'edges'),
+    ]
+
+    if sqlite:
+        # Imported here since sqlite_store.py builds on this module
+        import sqlite_store
+        function_for_stage = {
+            'age difference between parents': sqlite_store.average_age_difference_between_parents,
+            'father to son donors': sqlite_store.fathers_that_can_donate_to_sons,
+            'grandchild to grandparent donors': sqlite_store.child_that_can_donate_to_grandparents,
+        }
+        # The connection can not be sent to another process
+        stages = [
+            x._replace(function=function_for_stage[x.name], dependencies=('database',), after=(), local=True,
+                       records=None) if x.name in function_for_stage else x
+            for x in stages
+        ]
+
+    return stages
+
+
+# Builds the grandparent relation of the family graph, which is then shared by the questions needing it
+def build_grandparents(family):
+    if len(family) > 0:
+        family.grandparents(0)
+
+
+def build_couples(family):
+    family.couples()
+
+
+# Number of records going through a stage, from the results of the nodes it depends on
+def stage_records(stage):
+    if stage.records is None:
+        return None
+    if stage.records == 'people':
+        position = stage.dependencies.index('people')
+        return lambda *args: len(args[position])
+    position = stage.dependencies.index('family')
+
+    return lambda *args: len(args[position].parent_ids)
+
+
+# The stage graph of the report. read gives the people, family the family graph of them and database the
+# connection to the SQLite database of the file.
+def report_graph(stages, read, family, database=None):
+    graph = StageGraph()
+    graph.add('people', read, local=True)
+    if database is not None:
+        graph.add('database', database, local=True)
+    graph.add('family', family, ['people'], local=True, records=len)
+    # The shared intermediates of several questions. The indexes are kept inside the family graph, so they are built
+    # in this process and the questions using them name them in after.
+    graph.add('distribution', distribution_questions, ['people'], local=True)
+    graph.add('grandparents', build_grandparents, ['family'], local=True)
+    graph.add('couples', build_couples, ['family'], local=True)
+    graph.add('kinship', kinship_counts, ['family'])
+    for stage in stages:
+        graph.add(stage.name, stage.function, stage.dependencies, stage.after, stage.local, stage_records(stage))
+
+    return graph
+
+
+# The nodes of the stage graph kept in the cache besides the answers. The family graph is kept with the relations
+# built from it while answering, but not for a snapshot, whose graph is a view of the mapped file.
+def cached_intermediates(snapshot=False):
+    return ('kinship',) if snapshot else ('family', 'kinship')
+
+
+# The indexes only depend on the family relations and the reference date, not on the limits of the answers
+def index_parameters(reference_date=REFERENCE_DATE):
+    return {'reference_date': reference_date.isoformat()}
+
+
+# '8,9,17' gives {8, 9, 17}
+def parse_questions(text):
+    questions = {int(x) for x in text.split(',')}
+    if not questions <= set(range(18)):
+        raise argparse.ArgumentTypeError('questions are numbered 0 (the overview) to 17: ' + text)
+
+    return questions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Answers the questions of the README for a people.db file.')
+    parser.add_argument('file_names', nargs='*', default=['people.db'], metavar='file_name',
+                        help='people.db, or several files read as the shards of one dataset (default people.db)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='load the binary snapshot of the file, writing it first if it is missing or stale')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes reading the file or the shards in parallel (default 1, reading '
+                             'serially)')
+    parser.add_argument('--paternity', action='store_true',
+                        help='also list the child-parent links least likely to be biological, from genotypes')
+    parser.add_argument('--questions', type=parse_questions, metavar='NUMBERS',
+                        help='only answer these questions of the README, such as 8,9,17 (0 is the overview of the '
+                             'first people, default all)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of questions answered at the same time (default 1, one after the other)')
+    parser.add_argument('--pool', choices=POOLS, default='thread',
+                        help='run the questions on threads or processes when --jobs is above 1 (default thread)')
+    parser.add_argument('--plan', action='store_true',
+                        help='print the stages that are run and how long each one took')
+    parser.add_argument('--sqlite', action='store_true',
+                        help='answer questions 7, 16 and 17 with joins in an SQLite database of the file, made on the '
+                             'first run and reused until the file changes')
+    parser.add_argument('--sqlite-database', metavar='PATH',
+                        help='the SQLite database used with --sqlite (default the file name followed by .sqlite)')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='text',
+                        help='how the results are written (default text, the printed report)')
+    parser.add_argument('--output', help='file to write the results to, or directory for csv (default stdout)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIRECTORY, metavar='DIRECTORY',
+                        help='keep the answers in a cache directory (default ' + DEFAULT_DIRECTORY + ') and reuse them '
+                             'while the file, the parameters and the code are unchanged')
+    parser.add_argument('--cache-size', type=int, default=512, metavar='MB',
+                        help='size the cache is kept within by removing the least recently used answers (default 512)')
+    parser.add_argument('--profile', action='store_true', default=enabled_by_environment(),
+                        help='print time and memory of every stage, also turned on by PEOPLE_PROFILE=1')
+    parser.add_argument('--profile-trace', default=os.environ.get(TRACE_ENVIRONMENT_VARIABLE, DEFAULT_TRACE_FILE),
+                        help='file the JSON trace of the stages is written to when profiling')
+    args = parser.parse_args(argv)
+    if args.snapshot and len(args.file_names) > 1:
+        parser.error('--snapshot reads a single file')
+    # The columns of a snapshot are views of the mapped file, which can not be sent to other processes
+    if args.snapshot and args.jobs > 1 and args.pool == 'process':
+        parser.error('--snapshot can not be used with --pool process, use --pool thread')
+    if args.sqlite and len(args.file_names) > 1:
+        parser.error('--sqlite reads a single file')
+    if args.sqlite_database is not None and not args.sqlite:
+        parser.error('--sqlite-database is only used with --sqlite')
+    if args.sqlite_database is not None and os.path.realpath(args.sqlite_database) == os.path.realpath(args.file_names[0]):
+        parser.error('--sqlite-database would replace the file it is made from')
+    if args.format == 'csv' and args.output in (None, '-'):
+        parser.error('--format csv needs --output DIRECTORY')
+    file_name = args.file_names[0] if len(args.file_names) == 1 else args.file_names
+
+    profiler = Profiler(enabled=args.profile)
+    writer = writer_for(args.format, args.output)
+
+    dataset = None
+    if args.cache is not None:
+        dataset = DatasetCache(ResultCache(args.cache, args.cache_size * 1024 * 1024), file_name,
+                               report_parameters())
+    loaded = {}
+
+    # The people are only read when an answer is not in the cache
+    def read():
+        if len(args.file_names) > 1:
+            # Imported here since sharded.py builds on this module
+            import sharded
+            shards = sharded.read_shards(args.file_names, args.workers)
+            people, loaded['family'] = shards.table, shards.family
+        elif args.snapshot:
+            # Imported here since snapshot.py builds on this module
+            import snapshot
+            snapshot_file = snapshot.load_or_convert(file_name)
+            people, loaded['family'] = snapshot_file.table, snapshot_file.family
+        elif args.workers > 1:
+            # Imported here since parallel_ingest.py builds on this module
+            import parallel_ingest
+            people = parallel_ingest.read_people_as_table(file_name, args.workers)
+        else:
+            people = read_people_as_table(file_name)
+
+        return people
+
+    # Parents, children, partners and grandparents are all looked up in this one index
+    def family_graph(people):
+        return loaded.get('family') or FamilyGraph.from_people(people)
+
+    def database():
+        # Imported here since sqlite_store.py builds on this module
+        import sqlite_store
+        return sqlite_store.connect(file_name, args.sqlite_database)
+
+    stages = [
+        x for x in report_stages(args.paternity, args.sqlite)
+        if args.questions is None or args.questions & set(x.questions)
+    ]
+    graph = report_graph(stages, read, family_graph, database if args.sqlite else None)
+    targets = [x.name for x in stages]
+
+    # Answers already in the cache are not worked out again, nor are the indexes the answers still needed use
+    cached = {}
+    intermediates = []
+    if dataset is not None:
+        for name in targets:
+            found, value = dataset.get(name)
+            if found:
+                cached[name] = value
+        intermediates = [x for x in cached_intermediates(args.snapshot) if x in graph.needed(targets, cached)]
+        for name in intermediates:
+            found, value = dataset.get(name, index_parameters())
+            if found:
+                cached[name] = value
+    if args.plan:
+        graph.print_plan(targets, cached)
+
+    results = graph.run(targets, cached, args.jobs, args.pool, profiler)
+    if dataset is not None:
+        for name in targets:
+            if name not in cached:
+                results[name] = materialize(results[name])
+                dataset.put(name, results[name])
+        for name in intermediates:
+            if name not in cached:
+                dataset.put(name, results[name], index_parameters())
+
+    with profiler.stage('write report'):
+        for stage in stages:
+            for line in stage.headings:
+                writer.text(line)
+            writer.write(results[stage.name])
+        writer.close()
+
+    if args.plan:
+        graph.print_timings()
+    if profiler.enabled:
+        profiler.summary()
+        profiler.write_trace(args.profile_trace)
+        print('Trace written to', args.profile_trace, file=sys.stderr)
+
 
 # This allows us to comment out and run functions as we please
 if __name__ == "__main__":
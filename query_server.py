@@ -0,0 +1,237 @@
+# Long running server answering questions about single people.
+# people.db is read once and the family graph, including the partner and grandparent relations, is built up front,
+# so every request is only a few lookups in the CSR arrays.
+#
+# The protocol is one JSON value per line over TCP or a Unix socket. A JSON object is one request and is answered
+# by one object. A JSON list is a batch of requests and is answered by a list of responses in the same order.
+# Requests can be pipelined: a client may send many lines without waiting, and the responses come back in order.
+#
+#   {"id": 1, "op": "relatives", "cpr": "230226-9781", "relationship": "cousin"}
+#   {"id": 2, "op": "donors", "cpr": "230226-9781", "hops": 2}
+#   {"id": 3, "op": "cousins", "cpr": "230226-9781"}
+#   {"id": 4, "op": "first_child_age", "cpr": "230226-9781"}
+#   {"id": 5, "op": "stats"}
+#
+# A response holds the id of its request, ok, and result or error. latency_us is the time spent answering it.
+# relationship is any relationship of donors.py, such as parent, child, sibling, cousin or ancestor:3.
+#
+# Usage: query_server.py [people.db] [--host HOST] [--port PORT | --unix PATH] [--snapshot]
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import project_final
+from donors import MAX_GENERATIONS, donors_within, relatives
+from family_graph import FamilyGraph
+from people_table import BLOOD_TYPES, MISSING
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Longest request line accepted, in bytes
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+class QueryError(Exception):
+    pass
+
+
+class PeopleIndex:
+
+    def __init__(self, table, family):
+        self.table = table
+        self.family = family.build_derived()
+        self.operations = {
+            'relatives': self.relatives,
+            'donors': self.donors,
+            'cousins': self.cousins,
+            'first_child_age': self.first_child_age,
+        }
+
+    def node_for(self, request):
+        cpr = request.get('cpr')
+        if not isinstance(cpr, str):
+            raise QueryError('cpr must be a string')
+        if cpr not in self.family.id_for_cpr:
+            raise QueryError('Unknown CPR: ' + str(cpr))
+
+        return self.family.node_id(cpr)
+
+    def describe(self, node):
+        if not self.family.has_row(node):
+            return {'cpr': self.family.cpr(node), 'name': None, 'blood_type': None}
+        code = self.table.blood_type[node]
+
+        return {
+            'cpr': self.family.cpr(node),
+            'name': project_final.name_for_row(self.table[node]),
+            'blood_type': None if code == MISSING else BLOOD_TYPES[code],
+        }
+
+    def relatives(self, request):
+        node = self.node_for(request)
+        try:
+            nodes = relatives(self.family, node, request.get('relationship', 'parent'))
+        except ValueError as error:
+            raise QueryError(str(error))
+
+        return [self.describe(x) for x in nodes]
+
+    def donors(self, request):
+        node = self.node_for(request)
+        hops = request.get('hops', 2)
+        if not isinstance(hops, int) or not 1 <= hops <= MAX_GENERATIONS:
+            raise QueryError('hops must be an integer from 1 to {}'.format(MAX_GENERATIONS))
+        result = []
+        for donor, steps in donors_within(self.table, self.family, node, hops):
+            description = self.describe(donor)
+            description['steps'] = steps
+            result.append(description)
+
+        return result
+
+    def cousins(self, request):
+        return len(self.family.cousins(self.node_for(request)))
+
+    # Age at which the person first became a parent, or None when they have no children
+    def first_child_age(self, request):
+        node = self.node_for(request)
+        if not self.family.has_row(node) or self.table.parent_age[node] == MISSING:
+            return None
+
+        return self.table.parent_age[node]
+
+
+# Number of requests, total and maximum latency for each operation since the server started
+class LatencyStats:
+
+    def __init__(self):
+        self.count = {}
+        self.total = {}
+        self.max = {}
+
+    def add(self, operation, seconds):
+        self.count[operation] = self.count.get(operation, 0) + 1
+        self.total[operation] = self.total.get(operation, 0.0) + seconds
+        self.max[operation] = max(self.max.get(operation, 0.0), seconds)
+
+    def as_dict(self):
+        return {
+            operation: {
+                'count': count,
+                'mean_us': round(self.total[operation] / count * 1e6, 1),
+                'max_us': round(self.max[operation] * 1e6, 1),
+            }
+            for operation, count in self.count.items()
+        }
+
+
+class QueryServer:
+
+    def __init__(self, index):
+        self.index = index
+        self.stats = LatencyStats()
+
+    def answer(self, request):
+        started = time.perf_counter()
+        if not isinstance(request, dict):
+            return {'id': None, 'ok': False, 'error': 'A request must be a JSON object'}
+        operation = request.get('op')
+        response = {'id': request.get('id')}
+        try:
+            if operation == 'stats':
+                result = self.stats.as_dict()
+            elif operation in self.index.operations:
+                result = self.index.operations[operation](request)
+            else:
+                raise QueryError('Unknown op: ' + str(operation))
+            response['ok'] = True
+            response['result'] = result
+        except QueryError as error:
+            response['ok'] = False
+            response['error'] = str(error)
+        # A request the index fails on is answered as such, so the connection and the requests after it are kept
+        except Exception as error:
+            response['ok'] = False
+            response['error'] = 'Internal error: {}: {}'.format(type(error).__name__, error)
+        seconds = time.perf_counter() - started
+        self.stats.add(operation if isinstance(operation, str) else 'invalid', seconds)
+        response['latency_us'] = round(seconds * 1e6, 1)
+
+        return response
+
+    def answer_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {'id': None, 'ok': False, 'error': 'Invalid JSON: ' + str(error)}
+        if isinstance(request, list):
+            return [self.answer(x) for x in request]
+
+        return self.answer(request)
+
+    # Lines are answered in the order they arrive, so pipelined requests get their responses in order
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                writer.write(json.dumps(self.answer_line(line)).encode() + b'\n')
+                # Only waits when the client is not keeping up with the responses
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, unix_path, limit=LINE_LIMIT)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port, limit=LINE_LIMIT)
+            where = '{}:{}'.format(host, port)
+        print('Answering queries on', where, file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def load_index(file_name, use_snapshot=False):
+    if use_snapshot:
+        # Imported here since snapshot.py builds on project_final.py, like this module
+        import snapshot
+        loaded = snapshot.load_or_convert(file_name)
+        return PeopleIndex(loaded.table, loaded.family)
+    table = project_final.read_people_as_table(file_name)
+
+    return PeopleIndex(table, FamilyGraph.from_people(table))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Answers JSON queries about single people in a people.db file.')
+    parser.add_argument('file_name', nargs='?', default='people.db')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='load the binary snapshot of the file, writing it first if it is missing or stale')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    index = load_index(args.file_name, args.snapshot)
+    print('Loaded', len(index.table), 'people in {:.2f}s'.format(time.perf_counter() - started), file=sys.stderr)
+
+    try:
+        asyncio.run(QueryServer(index).serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
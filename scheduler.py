@@ -0,0 +1,176 @@
+# Running the stages of the report as a graph of dependencies.
+# A node is a function and the nodes whose results it is given, in order. after lists nodes that must be done
+# before it without their results being passed, for intermediates that are kept inside another result (such as
+# the couple index kept by the family graph). Only the nodes the asked for targets depend on are run, and a node
+# is run once however many nodes depend on it.
+#
+# With jobs > 1 the nodes whose dependencies are done run at the same time on a thread or process pool. With a
+# process pool the results of the dependencies are pickled to the worker and the result back, so it only pays for
+# nodes doing much work on little data. Nodes marked local always run in the calling process, which is needed for
+# nodes whose results can not be pickled or that fill in caches of a shared object.
+
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from cache import materialize
+from instrumentation import Profiler
+
+
+Node = namedtuple('Node', ['name', 'function', 'dependencies', 'after', 'local', 'records'])
+
+# When a node started (seconds after the run started), how long it took and where it ran
+Timing = namedtuple('Timing', ['name', 'level', 'worker', 'start', 'seconds'])
+
+POOLS = ('thread', 'process')
+
+
+# Runs in a worker process. Generators are turned into lists so the result can be sent back.
+def call_in_process(function, args):
+    cpu_started = time.process_time()
+    value = materialize(function(*args))
+
+    return value, 'process-{}'.format(os.getpid()), time.process_time() - cpu_started
+
+
+class StageGraph:
+
+    def __init__(self):
+        self.nodes = {}
+        self.timings = []
+
+    # records is given the results of the dependencies and gives the number of records the node went through
+    def add(self, name, function, dependencies=(), after=(), local=False, records=None):
+        if name in self.nodes:
+            raise ValueError('Node added twice: ' + name)
+        self.nodes[name] = Node(name, function, tuple(dependencies), tuple(after), local, records)
+
+    def requirements(self, name):
+        node = self.nodes[name]
+
+        return node.dependencies + node.after
+
+    # The nodes needed for targets, leaving out those already in done and what only they need
+    def needed(self, targets, done=()):
+        needed = set()
+        stack = [x for x in targets if x not in done]
+        while stack:
+            name = stack.pop()
+            if name in needed:
+                continue
+            if name not in self.nodes:
+                raise ValueError('Unknown node: ' + name)
+            needed.add(name)
+            stack.extend(x for x in self.requirements(name) if x not in done and x not in needed)
+
+        return needed
+
+    # The needed nodes in levels. The nodes of a level only depend on earlier levels, so they can run at the
+    # same time. Within a level the nodes keep the order they were added in.
+    def plan(self, targets, done=()):
+        needed = self.needed(targets, done)
+        level_for_node = {}
+
+        def level(name):
+            if name not in level_for_node:
+                level_for_node[name] = 1 + max(
+                    (level(x) for x in self.requirements(name) if x in needed), default=-1)
+            return level_for_node[name]
+
+        levels = []
+        for name in self.nodes:
+            if name in needed:
+                while len(levels) <= level(name):
+                    levels.append([])
+                levels[level(name)].append(name)
+
+        return levels
+
+    def print_plan(self, targets, done=(), file=sys.stderr):
+        print('Execution plan:', file=file)
+        for number, names in enumerate(self.plan(targets, done)):
+            print('  level {}: {}'.format(number, ', '.join(names)), file=file)
+        if done:
+            print('  already known: {}'.format(', '.join(x for x in self.nodes if x in done)), file=file)
+
+    def print_timings(self, file=sys.stderr):
+        print(file=file)
+        print('{:<40} {:>5} {:<24} {:>9} {:>9}'.format('Node', 'Level', 'Worker', 'Start', 'Time'), file=file)
+        print('-' * 91, file=file)
+        for timing in sorted(self.timings, key=lambda x: x.start):
+            print('{:<40} {:>5} {:<24} {:>8.3f}s {:>8.3f}s'.format(
+                timing.name, timing.level, timing.worker, timing.start, timing.seconds), file=file)
+
+    # Runs what targets need and returns the results of all the nodes run, together with values, the results
+    # already known (for example from a cache)
+    def run(self, targets, values=None, jobs=1, pool='thread', profiler=None):
+        values = dict(values or {})
+        profiler = profiler or Profiler()
+        levels = self.plan(targets, values)
+        level_for_node = {name: number for number, names in enumerate(levels) for name in names}
+        self.timings = []
+        started = time.perf_counter()
+
+        def run_node(name):
+            node = self.nodes[name]
+            args = [values[x] for x in node.dependencies]
+            node_started = time.perf_counter()
+            with profiler.stage(name) as stage:
+                value = node.function(*args)
+                # Generators are run on the pool instead of while the results are written
+                if jobs > 1:
+                    value = materialize(value)
+                if node.records is not None:
+                    stage.records = node.records(*args)
+            self.timings.append(Timing(name, level_for_node[name], threading.current_thread().name,
+                                       node_started - started, time.perf_counter() - node_started))
+
+            return value
+
+        if jobs <= 1:
+            for names in levels:
+                for name in names:
+                    values[name] = run_node(name)
+            return values
+
+        if pool not in POOLS:
+            raise ValueError('Unknown pool: ' + pool)
+        executor_class = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+        waiting = [name for names in levels for name in names]
+        running = {}
+        with executor_class(max_workers=jobs) as executor, profiler.overlapping():
+            while waiting or running:
+                ready = [x for x in waiting if all(y in values for y in self.requirements(x))]
+                for name in ready:
+                    waiting.remove(name)
+                    node = self.nodes[name]
+                    if pool == 'thread':
+                        running[executor.submit(run_node, name)] = (name, None)
+                    elif not node.local:
+                        args = [values[x] for x in node.dependencies]
+                        running[executor.submit(call_in_process, node.function, args)] = (name, time.perf_counter())
+                # Local nodes of a process pool run here while the workers go on
+                local = [x for x in ready if pool == 'process' and self.nodes[x].local]
+                for name in local:
+                    values[name] = run_node(name)
+                if local:
+                    continue
+                if not running:
+                    raise ValueError('Nodes depend on each other in a cycle: ' + ', '.join(waiting))
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, submitted = running.pop(future)
+                    if submitted is None:
+                        values[name] = future.result()
+                        continue
+                    values[name], worker, cpu_seconds = future.result()
+                    # Timed from submitting, so sending the arguments and the result back are included, as is
+                    # waiting for a free worker or for local nodes keeping this process busy
+                    elapsed = time.perf_counter() - submitted
+                    self.timings.append(Timing(name, level_for_node[name], worker, submitted - started, elapsed))
+                    profiler.record(name, submitted - profiler.started, elapsed, cpu_seconds, thread_name=worker)
+
+        return values
@@ -0,0 +1,194 @@
+# Datasets split over several people.db files, such as one file per region.
+# A child's parents and grandparents may be listed in other shards than the child, so the family relations are
+# only resolved once all the shards are read. That is done by a map / shuffle / reduce pipeline on a process pool:
+#
+#   map      every shard is parsed in its own worker into a PeopleTable. Its parent -> child edges are written to
+#            one file per partition, picked by a hash of the CPR of the child, so all the parents of a child end up
+#            in the same partition whichever shards they are listed in.
+#   shuffle  the files of a partition from all the shards are handed to one reducer.
+#   reduce   every partition is read in its own worker. The parents are given their row in the merged dataset and
+#            the edges are sorted in the order a single file would list them.
+#
+# The tables are then appended in the order of the shards and the family graph is built from the sorted edges of
+# all the partitions, so the node ids and relations are those of one file holding the shards one after the other,
+# and every analysis gives the same results. A worker only holds one shard or one partition at a time.
+#
+# Usage: sharded.py shard.db [shard.db ...] [--workers N] [--partitions N]
+#        sharded.py people.db --split N --directory DIRECTORY
+
+import argparse
+import heapq
+import os
+import pickle
+import tempfile
+import zlib
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import project_final
+from family_graph import FamilyGraph
+from people_table import PeopleTable
+
+
+# The merged dataset. offsets has the first row of every shard, and cross_shard_children is the number of children
+# whose parents are listed in more than one shard.
+ShardedPeople = namedtuple('ShardedPeople', ['table', 'family', 'offsets', 'cross_shard_children'])
+
+
+# The same partition in every worker. hash() of a string differs between processes, so it can not be used.
+def partition_for(cpr, num_partitions):
+    return zlib.crc32(cpr.encode('utf-8')) % num_partitions
+
+
+def partition_path(directory, partition, shard):
+    return os.path.join(directory, 'partition-{}-shard-{}.pickle'.format(partition, shard))
+
+
+# Runs in a worker process. Edges are written as (row of the parent in the shard, position in its 'Children',
+# CPR of the child), and the table of the shard is returned.
+def map_shard(shard, file_name, directory, num_partitions, reference_date):
+    table = PeopleTable.from_people(project_final.iter_people(file_name, reference_date), reference_date)
+    partitions = [[] for _ in range(num_partitions)]
+    for row, children in enumerate(table.children):
+        if children is None:
+            continue
+        for position, cpr in enumerate(children.split()):
+            partitions[partition_for(cpr, num_partitions)].append((row, position, cpr))
+
+    for partition, edges in enumerate(partitions):
+        with open(partition_path(directory, partition, shard), 'wb') as file:
+            pickle.dump(edges, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return table
+
+
+# Runs in a worker process. Returns the edges of the partition as (row of the parent in the merged dataset,
+# position in its 'Children', CPR of the child) in the order of a single file, and the number of children of the
+# partition with parents in more than one shard.
+def reduce_partition(partition, directory, offsets):
+    edges = []
+    shards_for_child = {}
+    for shard, offset in enumerate(offsets):
+        with open(partition_path(directory, partition, shard), 'rb') as file:
+            for row, position, cpr in pickle.load(file):
+                edges.append((offset + row, position, cpr))
+                shards_for_child.setdefault(cpr, set()).add(shard)
+    edges.sort()
+
+    return edges, sum(1 for shards in shards_for_child.values() if len(shards) > 1)
+
+
+# Reads the shards as one dataset. workers defaults to the number of CPUs and partitions to the number of workers.
+def read_shards(file_names, workers=None, partitions=None, reference_date=project_final.REFERENCE_DATE):
+    workers = workers or os.cpu_count() or 1
+    num_partitions = partitions or workers
+    with tempfile.TemporaryDirectory(prefix='people_shuffle_') as directory, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        tables = list(executor.map(
+            map_shard,
+            range(len(file_names)),
+            file_names,
+            [directory] * len(file_names),
+            [num_partitions] * len(file_names),
+            [reference_date] * len(file_names),
+        ))
+
+        offsets = []
+        table = PeopleTable(reference_date)
+        for shard_table in tables:
+            offsets.append(len(table))
+            table.extend(shard_table)
+        del tables
+
+        reduced = list(executor.map(
+            reduce_partition,
+            range(num_partitions),
+            [directory] * num_partitions,
+            [offsets] * num_partitions,
+        ))
+
+    return ShardedPeople(table, family_from_edges(table, [edges for edges, _ in reduced]), offsets,
+                         sum(count for _, count in reduced))
+
+
+# The family graph of the merged table from the sorted edges of every partition, with node ids given as
+# FamilyGraph.from_people gives them: the people in the order of their rows, then the children without a row in
+# the order they are first listed.
+def family_from_edges(table, partitions):
+    cprs = list(table.cpr)
+    num_people = len(cprs)
+    id_for_cpr = {cpr: node for node, cpr in enumerate(cprs)}
+    parent_sources = array('l')
+    child_targets = array('l')
+    for parent, _, cpr in heapq.merge(*partitions):
+        if cpr not in id_for_cpr:
+            id_for_cpr[cpr] = len(cprs)
+            cprs.append(cpr)
+        parent_sources.append(parent)
+        child_targets.append(id_for_cpr[cpr])
+
+    return FamilyGraph.from_edges(cprs, num_people, id_for_cpr, parent_sources, child_targets)
+
+
+# The records of a people.db file, each as the list of its lines including the blank line ending it
+def iter_records(file_name):
+    record = []
+    with open(file_name, 'r', buffering=project_final.READ_BUFFER_SIZE) as file:
+        for line in file:
+            if line[0] == '#':
+                continue
+            record.append(line)
+            if line.strip() == '':
+                if len(record) > 1:
+                    yield record
+                record = []
+    if any(line.strip() for line in record):
+        yield record + ['\n']
+
+
+# Splits file_name into num_shards files by a hash of the CPR of every record, so the members of a family usually
+# end up in different shards. Returns the names of the shards.
+def split_file(file_name, num_shards, directory):
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    shard_names = [os.path.join(directory, '{}-{}.db'.format(base, shard)) for shard in range(num_shards)]
+    files = [open(x, 'w') for x in shard_names]
+    try:
+        for record in iter_records(file_name):
+            cpr = next((line.split(': ')[-1].rstrip('\n') for line in record if line.startswith('CPR: ')), '')
+            files[partition_for(cpr, num_shards)].writelines(record)
+    finally:
+        for file in files:
+            file.close()
+
+    return shard_names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reads several people.db files as one dataset.')
+    parser.add_argument('file_names', nargs='+', metavar='file_name')
+    parser.add_argument('--workers', type=int, help='number of worker processes (default the number of CPUs)')
+    parser.add_argument('--partitions', type=int, help='number of partitions of the edges (default the workers)')
+    parser.add_argument('--split', type=int, metavar='N', help='split the file into N shards instead')
+    parser.add_argument('--directory', help='the directory the shards are written to when splitting')
+    args = parser.parse_args(argv)
+
+    if args.split is not None:
+        if args.split < 1:
+            parser.error('--split needs at least 1 shard')
+        if args.directory is None:
+            parser.error('--split needs --directory DIRECTORY')
+        for name in split_file(args.file_names[0], args.split, args.directory):
+            print(name)
+        return
+
+    people = read_shards(args.file_names, args.workers, args.partitions)
+    print('Shards:', len(args.file_names))
+    print('People:', len(people.table))
+    print('Child-parent links:', len(people.family.parent_ids))
+    print('Children with parents in more than one shard:', people.cross_shard_children)
+
+
+if __name__ == "__main__":
+    main()
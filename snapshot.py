@@ -0,0 +1,268 @@
+# Binary snapshots of people.db.
+# convert() parses the text file once and writes the columns of the PeopleTable, including the derived age,
+# gender, parent age and first child gender, and the parent/child CSR arrays of the FamilyGraph to one file.
+# load() maps that file with mmap and hands out memoryviews into it, so loading neither parses nor copies.
+#
+# Layout: a fixed header with the position of the metadata, the sections (each aligned to 8 bytes) and last the
+# metadata as JSON. The metadata lists the sections and describes the source file, so a snapshot that no longer
+# matches its source can be detected.
+
+import bisect
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+import project_final
+from family_graph import FamilyGraph
+from people_table import NUMERIC_COLUMNS, STRING_COLUMNS, PeopleTable
+
+
+MAGIC = b'PEOPLEDB'
+FORMAT_VERSION = 1
+# Magic, format version, metadata offset and metadata length
+HEADER = struct.Struct('<8sIxxxxQQ')
+ALIGNMENT = 8
+
+
+class StaleSnapshotError(Exception):
+    pass
+
+
+def snapshot_path_for(source_path):
+    return source_path + '.snapshot'
+
+
+def source_stamp(source_path):
+    stat = os.stat(source_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Parses source_path and writes the snapshot. Returns the path of the snapshot.
+def convert(source_path, snapshot_path=None, reference_date=project_final.REFERENCE_DATE):
+    snapshot_path = snapshot_path or snapshot_path_for(source_path)
+    table = project_final.read_people_as_table(source_path, reference_date)
+    family = FamilyGraph.from_people(table)
+    write_snapshot(snapshot_path, table, family, source_stamp(source_path))
+
+    return snapshot_path
+
+
+def write_snapshot(snapshot_path, table, family, source=None):
+    sections = {}
+    with open(snapshot_path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, 0))
+
+        def write_section(name, values):
+            if isinstance(values, array) and values.typecode == 'l':
+                values = array('q', values)
+            typecode = values.typecode if isinstance(values, array) else 'B'
+            file.write(b'\0' * (-file.tell() % ALIGNMENT))
+            sections[name] = [file.tell(), typecode, len(values)]
+            file.write(values.tobytes() if isinstance(values, array) else values)
+
+        def write_strings(name, strings):
+            offsets = array('q', [0])
+            blob = bytearray()
+            for value in strings:
+                # Empty strings are read back as missing values
+                if value is not None:
+                    blob += value.encode('utf-8')
+                offsets.append(len(blob))
+            write_section(name + '.offsets', offsets)
+            write_section(name + '.data', bytes(blob))
+
+        for name in STRING_COLUMNS:
+            write_strings(name, getattr(table, name))
+        for name in NUMERIC_COLUMNS:
+            write_section(name, getattr(table, name))
+        for name, values in table.other_fields.items():
+            write_strings('other.' + name, values)
+
+        keys, rows = sorted_cpr_keys(table.cpr)
+        write_section('cpr_keys', keys)
+        write_section('cpr_rows', rows)
+
+        write_strings('node_cpr', family.cprs)
+        keys, nodes = sorted_cpr_keys(family.cprs)
+        write_section('node_keys', keys)
+        write_section('node_ids', nodes)
+        for name in ('child_offsets', 'child_ids', 'parent_offsets', 'parent_ids', 'children_in_order'):
+            write_section(name, array('q', getattr(family, name)))
+
+        metadata = {
+            'byteorder': sys.byteorder,
+            'source': source,
+            'reference_date': table.reference_date.isoformat(),
+            'num_people': len(table),
+            'num_nodes': len(family),
+            'other_fields': list(table.other_fields),
+            'sections': sections,
+        }
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        metadata_offset = file.tell()
+        file.write(metadata_bytes)
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, metadata_offset, len(metadata_bytes)))
+
+    # Replacing the old snapshot in one step means a reader never sees a half written file
+    os.replace(snapshot_path + '.tmp', snapshot_path)
+
+
+# CPRs as sortable integers ('ddmmyy-ssss' -> ddmmyyssss) with the row of each, sorted by CPR and then row
+def sorted_cpr_keys(cprs):
+    pairs = sorted((cpr_key(cpr), row) for row, cpr in enumerate(cprs))
+    return array('q', (key for key, row in pairs)), array('q', (row for key, row in pairs))
+
+
+def cpr_key(cpr):
+    return int(cpr.replace('-', ''))
+
+
+def read_metadata(snapshot_path):
+    with open(snapshot_path, 'rb') as file:
+        magic, version, metadata_offset, metadata_length = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise StaleSnapshotError('{} is not a snapshot of format version {}'.format(snapshot_path, FORMAT_VERSION))
+        file.seek(metadata_offset)
+
+        return json.loads(file.read(metadata_length))
+
+
+# A snapshot is stale when it is missing, unreadable or the source file changed size or modification time
+def is_stale(snapshot_path, source_path):
+    try:
+        metadata = read_metadata(snapshot_path)
+    except (IOError, StaleSnapshotError, ValueError, struct.error):
+        return True
+
+    return metadata['source'] != source_stamp(source_path)
+
+
+# A loaded snapshot. The table and family graph read straight from the mapped file.
+class Snapshot:
+
+    def __init__(self, snapshot_path):
+        self.metadata = read_metadata(snapshot_path)
+        if self.metadata['byteorder'] != sys.byteorder:
+            raise StaleSnapshotError('{} was written with another byte order'.format(snapshot_path))
+
+        with open(snapshot_path, 'rb') as file:
+            self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mapped)
+
+        reference_date = datetime.date.fromisoformat(self.metadata['reference_date'])
+        columns = {name: self.strings(name) for name in STRING_COLUMNS}
+        columns.update({name: self.section(name) for name in NUMERIC_COLUMNS})
+        other_fields = {name: self.strings('other.' + name) for name in self.metadata['other_fields']}
+        index_for_cpr = SortedCprIndex(self.section('cpr_keys'), self.section('cpr_rows'), columns['cpr'])
+        self.table = PeopleTable.from_columns(columns, index_for_cpr, other_fields, reference_date)
+
+        node_cprs = self.strings('node_cpr')
+        self.family = FamilyGraph(
+            node_cprs,
+            self.metadata['num_people'],
+            SortedCprIndex(self.section('node_keys'), self.section('node_ids'), node_cprs),
+            self.section('child_offsets'),
+            self.section('child_ids'),
+            self.section('parent_offsets'),
+            self.section('parent_ids'),
+            self.section('children_in_order'),
+        )
+
+    def section(self, name):
+        offset, typecode, length = self.metadata['sections'][name]
+        itemsize = struct.calcsize(typecode)
+        return self.buffer[offset:offset + length * itemsize].cast(typecode)
+
+    def strings(self, name):
+        return StringColumn(self.section(name + '.offsets'), self.section(name + '.data'))
+
+
+def load(snapshot_path, source_path=None):
+    if source_path is not None and is_stale(snapshot_path, source_path):
+        raise StaleSnapshotError('{} is older than {}'.format(snapshot_path, source_path))
+
+    return Snapshot(snapshot_path)
+
+
+# Loads the snapshot of source_path, converting first if there is none or it is stale
+def load_or_convert(source_path, snapshot_path=None, reference_date=project_final.REFERENCE_DATE):
+    snapshot_path = snapshot_path or snapshot_path_for(source_path)
+    if is_stale(snapshot_path, source_path):
+        convert(source_path, snapshot_path, reference_date)
+
+    snapshot = load(snapshot_path, source_path)
+    if snapshot.table.reference_date != reference_date:
+        snapshot.table.set_reference_date(reference_date)
+
+    return snapshot
+
+
+# Strings stored as one utf-8 blob and the offsets where each string starts. Strings are decoded when accessed.
+class StringColumn(Sequence):
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        if start == end:
+            return None
+
+        return str(self.data[start:end], 'utf-8')
+
+
+# CPR -> row lookup using binary search over the sorted CPR keys of a snapshot, so nothing is built on load.
+# Like a dict built row by row, a CPR listed more than once gives the last of its rows.
+class SortedCprIndex(Mapping):
+
+    def __init__(self, keys, rows, cprs):
+        self.keys = keys
+        self.rows = rows
+        self.cprs = cprs
+
+    def __getitem__(self, cpr):
+        try:
+            key = cpr_key(cpr)
+        except ValueError:
+            raise KeyError(cpr)
+        position = bisect.bisect_right(self.keys, key) - 1
+        if position < 0 or self.keys[position] != key:
+            raise KeyError(cpr)
+
+        return self.rows[position]
+
+    def __iter__(self):
+        for row, cpr in enumerate(self.cprs):
+            if self[cpr] == row:
+                yield cpr
+
+    def __len__(self):
+        return sum(1 for position in range(len(self.keys)) if position + 1 == len(self.keys) or self.keys[position] != self.keys[position + 1])
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: snapshot.py people.db [snapshot]')
+        return
+
+    source_path = sys.argv[1]
+    snapshot_path = sys.argv[2] if len(sys.argv) > 2 else None
+    print('Snapshot written to', convert(source_path, snapshot_path))
+
+
+if __name__ == "__main__":
+    main()
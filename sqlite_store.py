@@ -0,0 +1,276 @@
+# people.db in an indexed SQLite database.
+# convert() streams the text file into two tables, so an extract does not have to fit in memory:
+#
+#   person        one row per person, with id the row of the person in the file (the node id of the family graph),
+#                 typed columns and the age, gender and blood type as integers (see people_table.py)
+#   parent_child  one row per child listed in a 'Children' field, with id the order of the listings in the file.
+#                 child_id is the person the child is, or NULL for children without a record of their own.
+#
+# Rows are inserted with executemany in large batches within one transaction, and the indexes on the CPR, gender,
+# blood type and both ends of the edges are made after the rows are in. The database remembers the source file and
+# the reference date, so it is reused across runs until the file changes, as for snapshots.
+#
+# The family and donor questions are then answered by joins over the indexes, in the same order and with the same
+# results as the functions of project_final.py over the family graph.
+#
+# Usage: sqlite_store.py people.db [--database FILE] [--rebuild] [--query SQL]
+
+import argparse
+import json
+import os
+import sqlite3
+
+import project_final
+from cpr import decode_cpr, gender_bit
+from people_table import BLOOD_TYPES, GENDERS, MISSING, encode_blood_type, int_or_missing
+from writers import Table, TextWriter, Value
+
+
+SCHEMA_VERSION = 1
+BATCH_SIZE = 50000
+
+SCHEMA = '''
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE person (
+    id INTEGER PRIMARY KEY,
+    cpr TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    height INTEGER,
+    weight INTEGER,
+    eye_color TEXT,
+    blood_type INTEGER,
+    age INTEGER NOT NULL,
+    gender INTEGER NOT NULL,
+    children TEXT
+);
+CREATE TABLE parent_child (
+    id INTEGER PRIMARY KEY,
+    parent_id INTEGER NOT NULL REFERENCES person (id),
+    child_cpr TEXT NOT NULL,
+    child_id INTEGER REFERENCES person (id)
+);
+'''
+
+INDEXES = '''
+CREATE INDEX person_cpr ON person (cpr);
+CREATE INDEX person_gender ON person (gender);
+CREATE INDEX person_blood_type ON person (blood_type);
+CREATE INDEX parent_child_parent ON parent_child (parent_id);
+CREATE INDEX parent_child_child_cpr ON parent_child (child_cpr);
+CREATE INDEX parent_child_child ON parent_child (child_id);
+'''
+
+
+def database_path_for(source_path):
+    return source_path + '.sqlite'
+
+
+# The database is written by replacing the file at its path, which must therefore never be the source
+def check_database_path(source_path, database_path):
+    if os.path.realpath(database_path) == os.path.realpath(source_path):
+        raise ValueError('The database would replace the file it is made from: ' + database_path)
+
+
+def source_stamp(source_path, reference_date):
+    stat = os.stat(source_path)
+
+    return {'schema': SCHEMA_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'reference_date': reference_date.isoformat()}
+
+
+def person_values(node, row):
+    packed = decode_cpr(row['CPR'])
+    blood_type = encode_blood_type(row['Blood type']) if 'Blood type' in row else None
+    height = int_or_missing(row.get('Height'))
+    weight = int_or_missing(row.get('Weight'))
+
+    return (node, row['CPR'], row.get('First name'), row.get('Last name'),
+            None if height == MISSING else height, None if weight == MISSING else weight, row.get('Eye color'),
+            blood_type, row['Age'], gender_bit(packed), row.get('Children'))
+
+
+# Parses source_path into a new database. Returns the path of the database.
+def convert(source_path, database_path=None, reference_date=project_final.REFERENCE_DATE):
+    database_path = database_path or database_path_for(source_path)
+    check_database_path(source_path, database_path)
+    if os.path.exists(database_path + '.tmp'):
+        os.remove(database_path + '.tmp')
+
+    connection = sqlite3.connect(database_path + '.tmp')
+    try:
+        # Nothing is kept for recovery while loading, the file is only put in place once it is complete
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SCHEMA)
+        people = []
+        edges = []
+        with connection:
+            for node, row in enumerate(project_final.iter_people(source_path, reference_date)):
+                people.append(person_values(node, row))
+                if 'Children' in row:
+                    edges.extend((node, cpr) for cpr in row['Children'].split())
+                if len(people) >= BATCH_SIZE:
+                    insert_batch(connection, people, edges)
+            insert_batch(connection, people, edges)
+
+            connection.executescript(INDEXES)
+            # A CPR listed twice is the person read last, as in the family graph
+            connection.execute('''
+                UPDATE parent_child SET child_id = (SELECT MAX(id) FROM person WHERE person.cpr = parent_child.child_cpr)
+            ''')
+            connection.execute('INSERT INTO metadata VALUES (?, ?)',
+                               ('source', json.dumps(source_stamp(source_path, reference_date))))
+        connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    os.replace(database_path + '.tmp', database_path)
+
+    return database_path
+
+
+# Inserts the batch and empties it
+def insert_batch(connection, people, edges):
+    connection.executemany('INSERT INTO person VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', people)
+    connection.executemany('INSERT INTO parent_child (parent_id, child_cpr) VALUES (?, ?)', edges)
+    people.clear()
+    edges.clear()
+
+
+def is_stale(database_path, source_path, reference_date=project_final.REFERENCE_DATE):
+    try:
+        connection = sqlite3.connect('file:{}?mode=ro'.format(database_path), uri=True)
+        try:
+            stamp = connection.execute("SELECT value FROM metadata WHERE key = 'source'").fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return True
+
+    return stamp is None or json.loads(stamp[0]) != source_stamp(source_path, reference_date)
+
+
+# The database of source_path, converting the file first when the database is missing or stale.
+# The connection may be used from other threads than the one opening it.
+def connect(source_path, database_path=None, reference_date=project_final.REFERENCE_DATE, rebuild=False):
+    database_path = database_path or database_path_for(source_path)
+    check_database_path(source_path, database_path)
+    if rebuild or not os.path.exists(database_path) or is_stale(database_path, source_path, reference_date):
+        convert(source_path, database_path, reference_date)
+
+    return sqlite3.connect(database_path, check_same_thread=False)
+
+
+# The edges listing each child for the first time, which gives the order of the children in the family graph
+FIRST_LISTED = '(SELECT child_cpr, MIN(id) AS first FROM parent_child GROUP BY child_cpr)'
+
+
+# {child CPR: grandparent CPRs} for the children with grandparents, as project_final.grandparents_for_children
+def grandparents_for_children(connection):
+    grandparents_for_child = {}
+    for child, grandparent in connection.execute('''
+        SELECT parent.child_cpr, grandparent.cpr
+        FROM parent_child AS parent
+        JOIN parent_child AS upper ON upper.child_id = parent.parent_id
+        JOIN person AS grandparent ON grandparent.id = upper.parent_id
+        JOIN {} AS listed ON listed.child_cpr = parent.child_cpr
+        ORDER BY listed.first, parent.id, upper.id
+    '''.format(FIRST_LISTED)):
+        grandparents_for_child.setdefault(child, []).append(grandparent)
+
+    return grandparents_for_child
+
+
+def average_age_difference_between_parents(connection):
+    (wrong_count,) = connection.execute(
+        'SELECT COUNT(*) FROM (SELECT child_cpr FROM parent_child GROUP BY child_cpr HAVING COUNT(*) != 2)').fetchone()
+    assert wrong_count == 0
+    # Each couple once, with the parents in the order they list their first child together
+    (average_difference,) = connection.execute('''
+        SELECT AVG(ABS(first.age - second.age))
+        FROM (
+            SELECT DISTINCT first_edge.parent_id AS first_parent, second_edge.parent_id AS second_parent
+            FROM parent_child AS first_edge
+            JOIN parent_child AS second_edge ON second_edge.child_cpr = first_edge.child_cpr
+                AND second_edge.id > first_edge.id
+        ) AS couple
+        JOIN person AS first ON first.id = couple.first_parent
+        JOIN person AS second ON second.id = couple.second_parent
+    ''').fetchone()
+
+    return Value('Average age difference between parents', average_difference, "{:.2f}".format(average_difference))
+
+
+# A recipient can be given blood when they have every antigen of the donor, see donors.py
+DONOR_COLUMNS_SQL = '''
+    donor.first_name || ' ' || donor.last_name, recipient.first_name || ' ' || recipient.last_name,
+    donor.blood_type, recipient.blood_type
+'''
+CAN_DONATE = 'donor.blood_type & ~recipient.blood_type = 0'
+
+
+# The rows are decoded while the table is written, so a long list is never held in memory
+def donor_table(name, cursor):
+    rows = ((donor, recipient, BLOOD_TYPES[donor_type], BLOOD_TYPES[recipient_type])
+            for donor, recipient, donor_type, recipient_type in cursor)
+
+    return Table(name, project_final.DONOR_COLUMNS, rows, 'list')
+
+
+def fathers_that_can_donate_to_sons(connection):
+    male = GENDERS.index("Male")
+
+    return donor_table('Fathers that can donate to sons', connection.execute('''
+        SELECT {}
+        FROM person AS donor
+        JOIN parent_child AS edge ON edge.parent_id = donor.id
+        JOIN person AS recipient ON recipient.id = edge.child_id
+        WHERE donor.gender = ? AND recipient.gender = ? AND {}
+        ORDER BY donor.id, edge.id
+    '''.format(DONOR_COLUMNS_SQL, CAN_DONATE), (male, male)))
+
+
+def child_that_can_donate_to_grandparents(connection):
+    return donor_table('Grandchildren that can donate to grandparents', connection.execute('''
+        SELECT {}
+        FROM parent_child AS parent
+        JOIN parent_child AS upper ON upper.child_id = parent.parent_id
+        JOIN person AS donor ON donor.id = parent.child_id
+        JOIN person AS recipient ON recipient.id = upper.parent_id
+        JOIN {} AS listed ON listed.child_cpr = parent.child_cpr
+        WHERE {}
+        ORDER BY listed.first, parent.id, upper.id
+    '''.format(DONOR_COLUMNS_SQL, FIRST_LISTED, CAN_DONATE)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Answers the family and donor questions from an SQLite database.')
+    parser.add_argument('file_name', nargs='?', default='people.db')
+    parser.add_argument('--database', help='the database file (default the file name followed by .sqlite)')
+    parser.add_argument('--rebuild', action='store_true', help='convert the file again even if it is unchanged')
+    parser.add_argument('--query', help='run this SQL instead and print the rows')
+    args = parser.parse_args(argv)
+
+    connection = connect(args.file_name, args.database, rebuild=args.rebuild)
+    try:
+        with TextWriter() as writer:
+            if args.query is not None:
+                cursor = connection.execute(args.query)
+                columns = [x[0] for x in cursor.description or []]
+                writer.write(Table('Query', columns, ([str(x) for x in row] for row in cursor), 'list'))
+                return
+
+            writer.text('Average age difference between parents:')
+            writer.write(average_age_difference_between_parents(connection))
+            writer.text()
+            writer.text('Number of people with grandparents:  {}'.format(len(grandparents_for_children(connection))))
+            writer.text('Fathers that can donate blood to their sons: ')
+            writer.write(fathers_that_can_donate_to_sons(connection))
+            writer.text('People that can donate blood to their grandparent: ')
+            writer.write(child_that_can_donate_to_grandparents(connection))
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
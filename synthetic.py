@@ -0,0 +1,210 @@
+# Generator of synthetic people.db files for testing and benchmarking.
+# The population is made of families: a founding couple born early in the century, their children who
+# each have children with a partner from outside the family, and so on for up to four generations. Blood types
+# are inherited through ABO and Rhesus genotypes, and a small share of children get a father different from
+# the one listed, so the non-biological parent questions have something to find.
+# Families are written to the file as soon as they are made, so memory does not grow with the size of the file.
+# The same seed always gives the same file.
+
+import datetime
+import random
+import sys
+
+
+FIRST_NAMES = {
+    'Male': ['Anders', 'Anton', 'Bastian', 'Benjamin', 'Bent', 'Brian', 'Carsten', 'Daniel', 'Danny', 'Finn',
+             'Flemming', 'Frank', 'Glenn', 'Hans', 'Henning', 'Jens', 'Jokum', 'Kenneth', 'Kristoffer', 'Kurt',
+             'Lars', 'Marcus', 'Mikael', 'Niels', 'Norman', 'Odin', 'Robert', 'Steen', 'Svend'],
+    'Female': ['Abelone', 'Alea', 'Anne', 'Annette', 'Beatrix', 'Belina', 'Bente', 'Betina', 'Betty', 'Christina',
+               'Dea', 'Dolly', 'Dorthe', 'Edita', 'Ella', 'Ellen', 'Elsebeth', 'Eva', 'Freja', 'Gina', 'Heidi',
+               'Helga', 'Inger', 'Karin', 'Klara', 'Lene', 'Lisbeth', 'Maja', 'Mette', 'Pia', 'Sanne', 'Signe'],
+}
+LAST_NAMES = ['Berg', 'Boesen', 'Dahl', 'Friis', 'Frost', 'Gade', 'Hansen', 'Holm', 'Ibsen', 'Jensen', 'Karlsen',
+              'Kristoffersen', 'Laursen', 'Lind', 'Nielsen', 'Olsen', 'Pedersen', 'Petersen', 'Rapacki',
+              'Rasmussen', 'Skot', 'Skov', 'Steffensen', 'Svendsen', 'Thomsen', 'Thorn', 'Vang', 'Vestergaard',
+              'Wad', 'Winther']
+EYE_COLORS = ['Blue', 'Brown', 'Green', 'Grey', 'Black']
+
+# Allele frequencies of the ABO and Rhesus systems
+ABO_ALLELES = ('A', 'B', 'O')
+ABO_WEIGHTS = (0.28, 0.08, 0.64)
+RH_ALLELES = ('D', 'd')
+RH_WEIGHTS = (0.6, 0.4)
+
+# Everyone is born before the reference date of the database
+FIRST_BIRTH = datetime.date(1900, 1, 1)
+LAST_BIRTH = datetime.date(1999, 12, 31)
+
+GENERATIONS = 4
+# Chance that a child of the family has children, and the weights of having 1, 2, 3 or 4 of them
+CHANCE_OF_CHILDREN = 0.7
+NUMBER_OF_CHILDREN_WEIGHTS = (0.25, 0.4, 0.25, 0.1)
+# Chance that someone with children also has children with a second partner
+CHANCE_OF_SECOND_PARTNER = 0.05
+# Chance that the biological father of a child is not the father listed
+CHANCE_OF_OTHER_FATHER = 0.02
+
+
+def blood_type_for_genotype(abo, rh):
+    antigens = ''.join(sorted(set(abo) - {'O'}))
+    symbol = antigens if antigens else 'O'
+
+    return symbol + ('+' if 'D' in rh else '-')
+
+
+class PopulationGenerator:
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        # Next free sequence number for each birth date and gender, so every CPR is unique without remembering them
+        self.next_sequence = {}
+
+    def new_cpr(self, birth_date, gender):
+        key = (birth_date, gender)
+        # Odd sequence numbers are male and even are female
+        sequence = self.next_sequence.get(key, 1 if gender == 'Male' else 0)
+        if sequence > 9999:
+            raise ValueError('No more CPR numbers for ' + birth_date.isoformat())
+        self.next_sequence[key] = sequence + 2
+
+        return '{:%d%m%y}-{:04d}'.format(birth_date, sequence)
+
+    def random_date(self, first, last):
+        return first + datetime.timedelta(days=self.random.randint(0, (last - first).days))
+
+    def new_person(self, birth_date, gender, last_name=None, abo=None, rh=None):
+        rnd = self.random
+        if gender == 'Male':
+            height = round(rnd.gauss(180, 7))
+        else:
+            height = round(rnd.gauss(167, 6))
+        bmi = max(15.0, rnd.gauss(24, 4))
+
+        return {
+            'CPR': self.new_cpr(birth_date, gender),
+            'birth_date': birth_date,
+            'gender': gender,
+            'First name': rnd.choice(FIRST_NAMES[gender]),
+            'Last name': last_name or rnd.choice(LAST_NAMES),
+            'Height': height,
+            'Weight': round(bmi * (height / 100) ** 2),
+            'Eye color': rnd.choice(EYE_COLORS),
+            'abo': abo or tuple(rnd.choices(ABO_ALLELES, ABO_WEIGHTS, k=2)),
+            'rh': rh or tuple(rnd.choices(RH_ALLELES, RH_WEIGHTS, k=2)),
+            'children': [],
+        }
+
+    # A partner born around the same time as person, from outside the family
+    def new_partner(self, person):
+        gender = 'Female' if person['gender'] == 'Male' else 'Male'
+        born = person['birth_date'] + datetime.timedelta(days=self.random.randint(-5 * 365, 5 * 365))
+
+        return self.new_person(min(max(born, FIRST_BIRTH), LAST_BIRTH), gender)
+
+    def new_child(self, mother, father):
+        rnd = self.random
+        born = mother['birth_date'] + datetime.timedelta(days=rnd.randint(18 * 365, 38 * 365))
+        if born > LAST_BIRTH or born < father['birth_date'] + datetime.timedelta(days=16 * 365):
+            return None
+
+        # The alleles of someone else than the listed father
+        if rnd.random() < CHANCE_OF_OTHER_FATHER:
+            father_abo = rnd.choices(ABO_ALLELES, ABO_WEIGHTS, k=2)
+            father_rh = rnd.choices(RH_ALLELES, RH_WEIGHTS, k=2)
+        else:
+            father_abo, father_rh = father['abo'], father['rh']
+        abo = (rnd.choice(mother['abo']), rnd.choice(father_abo))
+        rh = (rnd.choice(mother['rh']), rnd.choice(father_rh))
+        child = self.new_person(born, rnd.choice(('Male', 'Female')), father['Last name'], abo, rh)
+        mother['children'].append(child['CPR'])
+        father['children'].append(child['CPR'])
+
+        return child
+
+    # Lets person have children with one or sometimes two partners. Returns the partners and the children.
+    def new_children(self, person):
+        rnd = self.random
+        partners = []
+        children = []
+        if rnd.random() >= CHANCE_OF_CHILDREN:
+            return partners, children
+
+        num_partners = 2 if rnd.random() < CHANCE_OF_SECOND_PARTNER else 1
+        for _ in range(num_partners):
+            partner = self.new_partner(person)
+            partners.append(partner)
+            mother, father = (person, partner) if person['gender'] == 'Female' else (partner, person)
+            num_children = rnd.choices((1, 2, 3, 4), NUMBER_OF_CHILDREN_WEIGHTS)[0]
+            for _ in range(num_children):
+                child = self.new_child(mother, father)
+                if child is not None:
+                    children.append(child)
+
+        return partners, children
+
+    # All the people of one family: a founding couple and their descendants with their partners
+    def new_family(self):
+        founder = self.new_person(self.random_date(datetime.date(1905, 1, 1), datetime.date(1935, 12, 31)),
+                                  self.random.choice(('Male', 'Female')))
+        people = [founder]
+        generation = [founder]
+        for _ in range(GENERATIONS - 1):
+            next_generation = []
+            for person in generation:
+                partners, children = self.new_children(person)
+                people.extend(partners)
+                people.extend(children)
+                next_generation.extend(children)
+            generation = next_generation
+
+        # The file is not sorted by family
+        self.random.shuffle(people)
+
+        return people
+
+    # Yields families until at least num_people people have been made
+    def families(self, num_people):
+        total = 0
+        while total < num_people:
+            family = self.new_family()
+            total += len(family)
+            yield family
+
+
+def format_person(person):
+    lines = ['CPR: ' + person['CPR']]
+    for key in ('First name', 'Last name', 'Height', 'Weight', 'Eye color'):
+        lines.append('{}: {}'.format(key, person[key]))
+    lines.append('Blood type: ' + blood_type_for_genotype(person['abo'], person['rh']))
+    if person['children']:
+        lines.append('Children: ' + ' '.join(person['children']))
+
+    return '\n'.join(lines) + '\n\n'
+
+
+# Writes a people.db file with at least num_people people. Whole families are written, so there can be a few more.
+# Returns the number of people written.
+def write_population(file_name, num_people, seed=0):
+    generator = PopulationGenerator(seed)
+    written = 0
+    with open(file_name, 'w', buffering=1024 * 1024) as file:
+        file.write('# Synthetic population made by synthetic.py with seed {}.\n\n'.format(seed))
+        for family in generator.families(num_people):
+            file.write(''.join(format_person(person) for person in family))
+            written += len(family)
+
+    return written
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('Usage: synthetic.py file_name number_of_people [seed]')
+        return
+
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    written = write_population(sys.argv[1], int(sys.argv[2]), seed)
+    print('Wrote', written, 'people to', sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Tests of the relatives walks in donors.py.
+#
+# Usage: python -m pytest test_donors.py
+
+import donors
+from family_graph import FamilyGraph
+
+
+def family_of(children_for_cpr):
+    return FamilyGraph.from_people(
+        [{'CPR': cpr, 'Children': children} if children else {'CPR': cpr} for cpr, children in children_for_cpr]
+    )
+
+
+def cprs(family, nodes):
+    return sorted(family.cpr(x) for x in nodes)
+
+
+def test_ancestors_and_descendants():
+    # a and b are the parents of c, and c the parent of d
+    family = family_of([('a', 'c'), ('b', 'c'), ('c', 'd'), ('d', None)])
+    d = family.id_for_cpr['d']
+    assert cprs(family, donors.ancestors(family, d, 1)) == ['c']
+    assert cprs(family, donors.ancestors(family, d, 2)) == ['a', 'b']
+    assert donors.ancestors(family, d, 3) == []
+    assert cprs(family, donors.descendants(family, family.id_for_cpr['a'], 2)) == ['d']
+
+
+def test_ancestor_reached_twice_is_listed_once():
+    # a is the grandparent of e through both of e's parents
+    family = family_of([('a', 'b c'), ('b', 'e'), ('c', 'e'), ('e', None)])
+    assert cprs(family, donors.ancestors(family, family.id_for_cpr['e'], 2)) == ['a']
+
+
+def test_cyclic_parents_end_the_walk():
+    # Inconsistent data where everyone is a parent of the others
+    family = family_of([('a', 'b c'), ('b', 'a c'), ('c', 'a b')])
+    a = family.id_for_cpr['a']
+    assert cprs(family, donors.ancestors(family, a, 1)) == ['b', 'c']
+    assert donors.ancestors(family, a, donors.MAX_GENERATIONS) == []
+    assert donors.descendants(family, a, donors.MAX_GENERATIONS) == []
@@ -0,0 +1,162 @@
+# Known-answer tests of the normality tests in normality.py.
+# Reference values are those published for R's shapiro.test and scipy's skewtest and kurtosistest, or worked out
+# by hand. The grouped Anderson-Darling and Lilliefors statistics are checked against the textbook formulas over
+# every value.
+#
+# Usage: python -m pytest test_normality.py
+
+import math
+import random
+from collections import Counter
+from statistics import NormalDist
+
+import pytest
+
+import normality
+
+
+def moments_of(values):
+    return normality.Moments.from_counts(Counter(values))
+
+
+def test_moments():
+    moments = moments_of([1, 2, 3, 4, 5])
+    assert moments.n == 5
+    assert moments.mean == 3
+    assert moments.variance() == pytest.approx(2.5)
+    assert moments.variance(ddof=0) == pytest.approx(2.0)
+    assert moments.skewness() == pytest.approx(0.0)
+    # n * M4 / M2² - 3 = 5 * 34 / 100 - 3
+    assert moments.excess_kurtosis() == pytest.approx(-1.3)
+
+
+def test_shapiro_wilk_weights_of_men():
+    # The example of Shapiro and Wilk (1965). R: W = 0.78881, p-value = 0.006704
+    result = normality.shapiro_wilk(sorted([148, 154, 158, 160, 161, 162, 166, 170, 182, 195, 236]))
+    assert result.statistic == pytest.approx(0.78881, abs=5e-5)
+    assert result.p_value == pytest.approx(0.006704, abs=5e-5)
+    assert result.rejects()
+
+
+def test_shapiro_wilk_of_three_values():
+    # Equally spaced values have W = 1, and W = 0.75 is the smallest W for three values
+    assert normality.shapiro_wilk([1, 2, 3]).statistic == pytest.approx(1.0)
+    assert normality.shapiro_wilk([1, 2, 3]).p_value == pytest.approx(1.0)
+    assert normality.shapiro_wilk([1, 1, 2]).statistic == pytest.approx(0.75)
+
+
+def test_shapiro_wilk_of_equal_values():
+    assert normality.shapiro_wilk([4, 4, 4, 4]) is None
+
+
+def test_skewness_z():
+    # scipy.stats.skewtest([1, 2, 3, 4, 5, 6, 7, 8]).statistic
+    assert normality.skewness_z(moments_of(range(1, 9))) == pytest.approx(1.0108048609177787, rel=1e-9)
+
+
+def test_kurtosis_z():
+    # scipy.stats.kurtosistest(range(20)): statistic -1.7058104152122062, p-value 0.08804338332528348
+    z = normality.kurtosis_z(moments_of(range(20)))
+    assert z == pytest.approx(-1.7058104152122062, rel=1e-9)
+    assert normality.two_sided_p(z) == pytest.approx(0.08804338332528348, rel=1e-9)
+
+
+def test_kurtosis_z_undefined():
+    assert math.isnan(normality.kurtosis_z(moments_of([1, 2, 3])))
+    assert math.isnan(normality.kurtosis_z(moments_of([5] * 30)))
+    # Moments for which 1 + x * sqrt(2 / (A - 4)) of Anscombe and Glynn is exactly 0
+    moments = normality.Moments()
+    moments.n, moments.m2, moments.m4 = 30, 30.0, 27.754283387826334
+    assert math.isnan(normality.kurtosis_z(moments))
+    assert normality.dagostino_pearson(moments) is None
+
+
+def test_dagostino_pearson():
+    moments = moments_of(range(20))
+    result = normality.dagostino_pearson(moments)
+    k2 = normality.skewness_z(moments) ** 2 + normality.kurtosis_z(moments) ** 2
+    assert result.statistic == pytest.approx(k2)
+    assert result.p_value == pytest.approx(math.exp(-k2 / 2))
+    assert normality.dagostino_pearson(moments_of(range(19))) is None
+
+
+def test_jarque_bera():
+    # JB = 5 / 6 * (0 + 1.3² / 4), with p-value exp(-JB / 2)
+    result = normality.jarque_bera(moments_of([1, 2, 3, 4, 5]))
+    assert result.statistic == pytest.approx(0.3520833333)
+    assert result.p_value == pytest.approx(math.exp(-0.3520833333 / 2))
+
+
+# A² over every value of the sorted sample, with equal values listed one by one
+def anderson_darling_a2(values):
+    values = sorted(values)
+    n = len(values)
+    mean = sum(values) / n
+    deviation = math.sqrt(sum((x - mean) ** 2 for x in values) / (n - 1))
+    cdf = [NormalDist(mean, deviation).cdf(x) for x in values]
+    total = sum((2 * i + 1) * (math.log(cdf[i]) + math.log(1 - cdf[n - 1 - i])) for i in range(n))
+
+    return -n - total / n
+
+
+def test_anderson_darling_matches_formula_over_every_value():
+    rng = random.Random(1)
+    values = [round(rng.gauss(40, 10)) for _ in range(300)]
+    n = len(values)
+    result = normality.anderson_darling(Counter(values))
+    assert result.statistic == pytest.approx(anderson_darling_a2(values) * (1 + 0.75 / n + 2.25 / (n * n)), rel=1e-9)
+
+
+def test_anderson_darling_p_values():
+    # Exponential values are far from normal, values at the normal quantiles close to it
+    rng = random.Random(2)
+    assert normality.anderson_darling(Counter(round(rng.expovariate(0.1), 1) for _ in range(500))).p_value < 1e-6
+    quantiles = [round(NormalDist(50, 10).inv_cdf((i + 0.5) / 200), 2) for i in range(200)]
+    assert normality.anderson_darling(Counter(quantiles)).p_value > 0.5
+
+
+# Kolmogorov-Smirnov distance over every value of the sorted sample
+def lilliefors_distance(values):
+    values = sorted(values)
+    n = len(values)
+    mean = sum(values) / n
+    normal = NormalDist(mean, math.sqrt(sum((x - mean) ** 2 for x in values) / (n - 1)))
+    distance = 0.0
+    for i, x in enumerate(values):
+        # Equal values only count at the last of them, where the empirical distribution has taken its step
+        if i + 1 < n and values[i + 1] == x:
+            continue
+        first = values.index(x)
+        distance = max(distance, (i + 1) / n - normal.cdf(x), normal.cdf(x) - first / n)
+
+    return distance
+
+
+def test_lilliefors_matches_formula_over_every_value():
+    rng = random.Random(3)
+    values = [round(rng.gauss(30, 5)) for _ in range(400)]
+    assert normality.lilliefors(Counter(values)).statistic == pytest.approx(lilliefors_distance(values), rel=1e-12)
+
+
+def test_lilliefors_p_values():
+    quantiles = [round(NormalDist(50, 10).inv_cdf((i + 0.5) / 200), 2) for i in range(200)]
+    result = normality.lilliefors(Counter(quantiles))
+    assert result.p_value is None and result.p_text == '> 0.1'
+    rng = random.Random(4)
+    result = normality.lilliefors(Counter(round(rng.expovariate(0.1), 1) for _ in range(500)))
+    assert result.rejects()
+
+
+def test_resampled_counts_keep_the_total():
+    rng = random.Random(5)
+    values, counts = (20, 30, 40, 50), (1000, 5000, 3000, 1000)
+    for _ in range(20):
+        resampled = normality.resampled_counts(values, counts, rng)
+        assert sum(resampled.values()) == sum(counts)
+        assert set(resampled) <= set(values)
+
+
+def test_gender_balance():
+    rows = dict((name, value) for name, value, _ in normality.gender_balance({'Male': 50, 'Female': 50}))
+    assert rows['Share of men'] == 0.5
+    assert rows['Balance z'] == 0
@@ -0,0 +1,42 @@
+# Tests of the command line of the report in project_final.py.
+#
+# Usage: python -m pytest test_project_final.py
+
+import os
+
+import pytest
+
+import project_final
+
+
+PEOPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'people.db')
+
+
+def test_snapshot_is_not_sent_to_a_process_pool(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        project_final.main([str(tmp_path / 'people.db'), '--snapshot', '--jobs', '2', '--pool', 'process'])
+    assert '--snapshot can not be used with --pool process' in capsys.readouterr().err
+
+
+def test_snapshot_runs_on_a_thread_pool(tmp_path, capsys):
+    source = tmp_path / 'people.db'
+    source.write_bytes(open(PEOPLE, 'rb').read())
+    project_final.main([str(source), '--questions', '7,16,17', '--jobs', '2'])
+    expected = capsys.readouterr().out
+    project_final.main([str(source), '--snapshot', '--questions', '7,16,17', '--jobs', '2', '--pool', 'thread'])
+    assert capsys.readouterr().out == expected
+
+
+def test_cache_keeps_the_family_graph(tmp_path, capsys):
+    source = tmp_path / 'people.db'
+    source.write_bytes(open(PEOPLE, 'rb').read())
+    directory = str(tmp_path / 'cache')
+    project_final.main([str(source), '--questions', '16', '--cache', directory])
+    first = capsys.readouterr().out
+    dataset = project_final.DatasetCache(project_final.ResultCache(directory), str(source),
+                                         project_final.report_parameters())
+    found, family = dataset.get('family', project_final.index_parameters())
+    assert found and len(family) > 0
+    # Another question is answered from the cached family graph with the same result
+    project_final.main([str(source), '--questions', '16,17', '--cache', directory])
+    assert capsys.readouterr().out.startswith(first)
@@ -0,0 +1,25 @@
+# Tests of the SQLite database of people.db in sqlite_store.py.
+#
+# Usage: python -m pytest test_sqlite_store.py
+
+import pytest
+
+import project_final
+import sqlite_store
+
+
+def test_database_never_replaces_its_source(tmp_path):
+    source = tmp_path / 'people.db'
+    source.write_text('CPR: 010101-1234\n\n')
+    with pytest.raises(ValueError):
+        sqlite_store.connect(str(source), str(tmp_path / '.' / 'people.db'))
+    with pytest.raises(ValueError):
+        sqlite_store.convert(str(source), str(source))
+    assert source.read_text() == 'CPR: 010101-1234\n\n'
+
+
+def test_report_rejects_the_source_as_database(tmp_path, capsys):
+    source = str(tmp_path / 'people.db')
+    with pytest.raises(SystemExit):
+        project_final.main(['--sqlite', '--sqlite-database', source, source])
+    assert 'would replace the file' in capsys.readouterr().err
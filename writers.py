@@ -0,0 +1,318 @@
+# Writing the results of the analyses.
+# An analysis returns a Table, a Value, a line of text or a list of those. The text lines are the headings of the
+# printed report and are only written by the TextWriter. Each writer streams the rows of a table as they come, so
+# a table can be given a generator and is never formatted as a whole in memory.
+#
+#   text       the report as it has always been printed
+#   csv        a directory with one CSV file per table and values.csv with the values
+#   jsonl      one JSON object per table row and per value
+#   columnar   a binary file with the tables in row groups of typed columns, see read_columnar
+#
+# Writers are used as 'with writer_for(format, output) as writer: writer.write(results)'.
+
+import abc
+import csv
+import io
+import json
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+
+# rows is any iterable of tuples with one value per column. layout tells the TextWriter how to print the table:
+#   table        two columns in the 30 character wide format of print_table, with a rule of width characters
+#   percentages  the same, with the second column a share printed as a percentage
+#   list         any number of columns in the 30 character wide format of print_blood
+#   people       the overview of people of print_people_as_table, leaving out missing (None) values
+Table = namedtuple('Table', ['name', 'columns', 'rows', 'layout', 'width'], defaults=('table', 45))
+
+# A single number. text is the line the TextWriter prints for it.
+Value = namedtuple('Value', ['name', 'value', 'text'])
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+# Formats the values to percentages
+def to_percentage_str(x):
+    return str(round(x * 100, 2)) + "%"
+
+
+class Writer(abc.ABC):
+
+    def write(self, result):
+        if isinstance(result, str):
+            self.text(result)
+        elif isinstance(result, Table):
+            self.table(result)
+        elif isinstance(result, Value):
+            self.value(result)
+        else:
+            for x in result:
+                self.write(x)
+
+    # Headings and other lines of the printed report. Only the TextWriter writes them.
+    def text(self, line=''):
+        pass
+
+    @abc.abstractmethod
+    def table(self, table):
+        pass
+
+    @abc.abstractmethod
+    def value(self, value):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+        return False
+
+
+# Opens file_name for writing, or hands out file (stdout by default) without closing it afterwards
+def open_output(file_name, mode, file=None):
+    if file_name is None or file_name == '-':
+        return (file or (sys.stdout.buffer if 'b' in mode else sys.stdout)), False
+
+    return open(file_name, mode, buffering=WRITE_BUFFER_SIZE), True
+
+
+class TextWriter(Writer):
+
+    def __init__(self, file_name=None, file=None):
+        self.file, self.owns_file = open_output(file_name, 'w', file)
+
+    def text(self, line=''):
+        self.file.write(line + '\n')
+
+    def value(self, value):
+        self.text(value.text)
+
+    def table(self, table):
+        write = self.file.write
+        if table.layout in ('table', 'percentages'):
+            write('\n{:<30} {:<30}\n'.format(table.columns[0], table.columns[1]))
+            write('-' * table.width + '\n')
+            empty = True
+            for key, value in table.rows:
+                if table.layout == 'percentages':
+                    value = to_percentage_str(value)
+                write('{:<30} {:<30}\n'.format(key, value))
+                empty = False
+            if empty:
+                write('\n')
+            write('\n')
+        elif table.layout == 'list':
+            write(''.join('{:<30}'.format(column) for column in table.columns) + '\n')
+            write('-' * 120 + '\n')
+            for row in table.rows:
+                write(' '.join('{:30}'.format(x) for x in row) + '\n')
+            write('\n')
+        elif table.layout == 'people':
+            write(''.join(' {0:16}'.format(column) for column in table.columns) + '\n')
+            write('-' * (len(table.columns) + 1) * 15 + '\n')
+            for row in table.rows:
+                write(''.join(' {0:<16}'.format(x) for x in row if x is not None) + '\n')
+        else:
+            raise ValueError('Unknown layout: ' + table.layout)
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def file_name_for(name):
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'table'
+
+
+class CsvWriter(Writer):
+
+    def __init__(self, directory):
+        if directory is None or directory == '-':
+            raise ValueError('The csv format writes a directory, give it with --output')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.used_names = set()
+        self.values_file = None
+
+    # A table name used before gets a number, so tables with the same name do not overwrite each other
+    def path_for(self, name):
+        base = file_name_for(name)
+        file_name, number = base, 1
+        while file_name in self.used_names or file_name == 'values':
+            number += 1
+            file_name = '{}_{}'.format(base, number)
+        self.used_names.add(file_name)
+
+        return os.path.join(self.directory, file_name + '.csv')
+
+    def table(self, table):
+        with open(self.path_for(table.name), 'w', buffering=WRITE_BUFFER_SIZE, newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(table.columns)
+            writer.writerows(table.rows)
+
+    def value(self, value):
+        if self.values_file is None:
+            self.values_file = open(os.path.join(self.directory, 'values.csv'), 'w', newline='')
+            self.values = csv.writer(self.values_file)
+            self.values.writerow(['Name', 'Value'])
+        self.values.writerow([value.name, value.value])
+
+    def close(self):
+        if self.values_file is not None:
+            self.values_file.close()
+
+
+class JsonLinesWriter(Writer):
+
+    def __init__(self, file_name=None, file=None):
+        self.file, self.owns_file = open_output(file_name, 'w', file)
+
+    def table(self, table):
+        write = self.file.write
+        columns = table.columns
+        for row in table.rows:
+            write(json.dumps({'table': table.name, 'row': dict(zip(columns, row))}) + '\n')
+
+    def value(self, value):
+        self.file.write(json.dumps({'name': value.name, 'value': value.value}) + '\n')
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+COLUMNAR_MAGIC = b'PEOPLCOL'
+COLUMNAR_VERSION = 1
+# Magic and format version
+COLUMNAR_HEADER = struct.Struct('<8sI')
+# Metadata length and data length of a block
+BLOCK_HEADER = struct.Struct('<IQ')
+ROW_GROUP_SIZE = 64 * 1024
+
+
+# Typed column of a row group: 'q' for integers, 'd' for numbers and 'str' for anything else. Strings are stored
+# as offsets into UTF-8 data, with an empty string standing for a missing value as in the snapshot files.
+def encode_column(values):
+    if all(type(x) is int for x in values):
+        return 'q', array('q', values).tobytes()
+    if all(type(x) in (int, float) for x in values):
+        return 'd', array('d', values).tobytes()
+
+    offsets = array('q', [0])
+    data = bytearray()
+    for x in values:
+        if x is not None:
+            data += str(x).encode('utf-8')
+        offsets.append(len(data))
+
+    return 'str', offsets.tobytes() + bytes(data)
+
+
+def decode_column(column_type, data, num_rows):
+    if column_type in ('q', 'd'):
+        return array(column_type, data).tolist()
+
+    offsets = array('q', data[:(num_rows + 1) * 8])
+    strings = data[(num_rows + 1) * 8:]
+
+    return [
+        str(strings[offsets[i]:offsets[i + 1]], 'utf-8') if offsets[i + 1] > offsets[i] else None
+        for i in range(num_rows)
+    ]
+
+
+# The file is a header followed by blocks. Each block is its metadata as JSON and its data. A table is written as
+# one block per row group of at most ROW_GROUP_SIZE rows, so only one row group is held in memory at a time.
+class ColumnarWriter(Writer):
+
+    def __init__(self, file_name=None, file=None):
+        self.file, self.owns_file = open_output(file_name, 'wb', file)
+        self.file.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION))
+
+    def write_block(self, metadata, data=b''):
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        self.file.write(BLOCK_HEADER.pack(len(metadata_bytes), len(data)))
+        self.file.write(metadata_bytes)
+        self.file.write(data)
+
+    def table(self, table):
+        group = []
+        for row in table.rows:
+            group.append(row)
+            if len(group) == ROW_GROUP_SIZE:
+                self.write_row_group(table, group)
+                group = []
+        if group:
+            self.write_row_group(table, group)
+
+    def write_row_group(self, table, rows):
+        columns = []
+        data = io.BytesIO()
+        for index, name in enumerate(table.columns):
+            column_type, column_data = encode_column([row[index] for row in rows])
+            columns.append({'name': name, 'type': column_type, 'offset': data.tell(), 'length': len(column_data)})
+            data.write(column_data)
+        self.write_block({'kind': 'table', 'name': table.name, 'rows': len(rows), 'columns': columns}, data.getvalue())
+
+    def value(self, value):
+        self.write_block({'kind': 'value', 'name': value.name, 'value': value.value})
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+# Reads a columnar file back. Yields a Table with the rows as a list for every row group, and a Value (without
+# text) for every value, in the order they were written.
+def read_columnar(file_name):
+    with open(file_name, 'rb') as file:
+        magic, version = COLUMNAR_HEADER.unpack(file.read(COLUMNAR_HEADER.size))
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise ValueError('{} is not a columnar file of format version {}'.format(file_name, COLUMNAR_VERSION))
+        while True:
+            header = file.read(BLOCK_HEADER.size)
+            if not header:
+                break
+            metadata_length, data_length = BLOCK_HEADER.unpack(header)
+            metadata = json.loads(file.read(metadata_length))
+            data = file.read(data_length)
+            if metadata['kind'] == 'value':
+                yield Value(metadata['name'], metadata['value'], None)
+                continue
+            columns = [
+                decode_column(x['type'], data[x['offset']:x['offset'] + x['length']], metadata['rows'])
+                for x in metadata['columns']
+            ]
+            yield Table(metadata['name'], [x['name'] for x in metadata['columns']], list(zip(*columns)))
+
+
+WRITERS = {
+    'text': TextWriter,
+    'csv': CsvWriter,
+    'jsonl': JsonLinesWriter,
+    'columnar': ColumnarWriter,
+}
+
+
+# output is a file name, or a directory for csv. None or '-' writes to stdout.
+def writer_for(format_name, output=None):
+    if format_name not in WRITERS:
+        raise ValueError('Unknown format: ' + format_name)
+
+    return WRITERS[format_name](output)